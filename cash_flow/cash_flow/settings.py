@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым: время ответа включает все остальные middleware (метрики - /metrics)
+    'transactions.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,13 +77,96 @@ WSGI_APPLICATION = 'cash_flow.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# SQLite в режиме WAL: читатели не блокируются писателями из других воркеров.
+# Параметры PRAGMA применяются к каждому новому соединению
+# (см. transactions/backends/sqlite3/base.py).
+#
+# Постоянные соединения (CONN_MAX_AGE > 0) выключены: под ASGI синхронный код
+# каждого запроса выполняется в новом потоке, соединение потока не переиспользуется
+# и остается открытым - документация Django советует под ASGI значение 0.
+# При развертывании только через WSGI можно задать DJANGO_CONN_MAX_AGE, например 600.
+CONN_MAX_AGE = int(os.environ.get('DJANGO_CONN_MAX_AGE', 0))
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # В режиме WAL NORMAL не теряет целостность, только последние коммиты при сбое ОС
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -20000,       # ~20 МБ страниц на соединение
+    'mmap_size': 268435456,     # 256 МБ
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'transactions.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pragmas': SQLITE_PRAGMAS,
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Тот же файл только на чтение - для представлений с read_only_view
+    'replica': {
+        'ENGINE': 'transactions.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pragmas': {**SQLITE_PRAGMAS, 'query_only': 'ON'},
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['transactions.routers.ReadWriteRouter']
+
+
+# Cache
+# Кэш фрагментов списка транзакций (см. transactions/fragments.py). Актуальность
+# проверяется по ленте изменений в БД, поэтому подходит и кэш в памяти каждого
+# процесса; для общего кэша нескольких процессов - FileBasedCache.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cash-flow',
     }
 }
 
+FRAGMENT_CACHE_ALIAS = 'default'
+FRAGMENT_CACHE_TIMEOUT = 300
+
+# Источник статистики списка: 'sql' (DailyRollup / строки) или 'columnar' -
+# копия транзакций в массивах numpy в памяти процесса (transactions/columnar.py).
+# Без numpy 'columnar' молча работает как 'sql'.
+TRANSACTION_STATS_ENGINE = 'sql'
+
+# Токены для изменяющих запросов JSON API из скриптов (Authorization: Bearer <токен>);
+# запросы из браузера без токена проходят проверку CSRF (заголовок X-CSRFToken)
+API_TOKENS = []
+
+# Журнал медленных SQL-запросов (transactions/slowlog.py, страница admin/slow-queries/):
+# порог в мс (None - выключен), размер кольцевого буфера и скрытие значений параметров
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_LOG_SIZE = 500
+SLOW_QUERY_REDACT_PARAMS = True
+
+# Фоновые задачи (transactions/jobs.py, воркер - manage.py run_jobs): каталог
+# загруженных и готовых файлов, задержка первого повтора (с), время без отметки
+# воркера, после которого задача возвращается в очередь (с), срок хранения (дни)
+JOB_FILES_DIR = BASE_DIR / 'job_files'
+JOB_RETRY_DELAY = 30
+JOB_STALE_AFTER = 300
+JOB_RETENTION_DAYS = 7
+
+# Помесячные отчеты (transactions/reports.py): число процессов отрисовки XLSX/PDF
+# (0 - в процессе воркера) и TTF-шрифт с кириллицей для PDF (None - поиск в системе)
+REPORT_RENDER_WORKERS = 2
+REPORT_PDF_FONT = None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from transactions.admin import slow_queries
+
 urlpatterns = [
+    path('admin/slow-queries/', admin.site.admin_view(slow_queries), name='slow_queries'),
     path('admin/', admin.site.urls),
     path('', include('transactions.urls')),
 ]
\ No newline at end of file
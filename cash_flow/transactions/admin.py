@@ -1,25 +1,29 @@
 from django.contrib import admin
-from .models import Status, Type, Category, Subcategory, Transaction
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from .models import Job, Status, Type, Category, Subcategory, Transaction
+from .search import fts_available, ranked, words
+from .slowlog import slow_log, threshold_ms
 
 @admin.register(Status)
 class StatusAdmin(admin.ModelAdmin):
-    list_display = ['name']
+    list_display = ['name', 'usage_count']
     search_fields = ['name']
 
 @admin.register(Type)
 class TypeAdmin(admin.ModelAdmin):
-    list_display = ['name']
+    list_display = ['name', 'usage_count']
     search_fields = ['name']
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'type']
+    list_display = ['name', 'type', 'usage_count']
     list_filter = ['type']
     search_fields = ['name']
 
 @admin.register(Subcategory)
 class SubcategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'category']
+    list_display = ['name', 'category', 'usage_count']
     list_filter = ['category', 'category__type']
     search_fields = ['name']
 
@@ -28,4 +32,40 @@ class TransactionAdmin(admin.ModelAdmin):
     list_display = ['created_date', 'status', 'type', 'category', 'subcategory', 'amount']
     list_filter = ['status', 'type', 'category', 'created_date']
     search_fields = ['comment']
-    date_hierarchy = 'created_date'
\ No newline at end of file
+    search_help_text = 'Поиск по словам комментария, в том числе по началу слова'
+    date_hierarchy = 'created_date'
+    
+    def get_search_results(self, request, queryset, search_term):
+        # Полнотекстовый индекс вместо LIKE '%...%' по search_fields
+        if not search_term.strip():
+            return queryset, False
+        return ranked(queryset, search_term), False
+    
+    def get_ordering(self, request):
+        # Результаты поиска - по релевантности, если не выбрана сортировка по колонке
+        if words(request.GET.get('q', '')) and 'o' not in request.GET and fts_available():
+            return ['search__rank']
+        return super().get_ordering(request)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'progress', 'total', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    readonly_fields = ['heartbeat_at', 'started_at', 'finished_at', 'worker']
+
+
+def slow_queries(request):
+    """Медленные SQL-запросы процесса: отпечатки по суммарному времени и последние записи"""
+    if request.method == 'POST':
+        slow_log.reset()
+        return redirect('slow_queries')
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Медленные SQL-запросы',
+        'threshold_ms': threshold_ms(),
+        'log_size': slow_log.size,
+        'summary': slow_log.summary(),
+        'entries': slow_log.entries()[:50],
+    }
+    return TemplateResponse(request, 'admin/transactions/slow_queries.html', context)
@@ -0,0 +1,304 @@
+"""
+JSON API v1 для транзакций.
+
+Фильтры те же, что у списка (TransactionFilterSet), постраничный вывод -
+по курсору (created_date, id). Ответы собираются из values() без создания
+моделей и без JOIN: справочники передаются своими id.
+"""
+import hmac
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig, ValidationError
+from django.db import transaction as db_transaction
+from django.http import HttpResponse, JsonResponse, QueryDict
+from django.middleware.csrf import CsrfViewMiddleware
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from .bulk import DELETE, BulkOperation, parse_ids, select
+from .filters import TransactionFilterSet
+from .forms import TransactionForm
+from .fragments import counters as fragment_counters
+from .importers import IdRowValidator
+from .jobs import cancel
+from .metrics import registry as metrics_registry
+from .models import Job, Transaction
+from .pagination import CursorPaginator, InvalidCursor
+from .routers import read_only_view
+from .stats import TransactionStats
+
+API_FIELDS = (
+    'id', 'created_date', 'status_id', 'type_id', 'category_id', 'subcategory_id', 'amount', 'comment',
+)
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+BATCH_LIMIT = 5000
+
+
+def serialize(row):
+    return {
+        'id': row['id'],
+        'created_date': row['created_date'].isoformat(),
+        'status': row['status_id'],
+        'type': row['type_id'],
+        'category': row['category_id'],
+        'subcategory': row['subcategory_id'],
+        'amount': str(row['amount']),
+        'comment': row['comment'],
+    }
+
+
+def error_response(message, status=400, **extra):
+    return JsonResponse({'error': message, **extra}, status=status)
+
+
+def parse_body(request):
+    """Тело запроса в виде JSON; ValueError с понятным сообщением при ошибке"""
+    try:
+        return json.loads(request.body or b'null')
+    except RequestDataTooBig:
+        raise ValueError('Слишком большой запрос')
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError('Тело запроса должно быть корректным JSON')
+
+
+def token_authenticated(request):
+    """Заголовок Authorization: Bearer <токен> с одним из settings.API_TOKENS"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return False
+    return any(hmac.compare_digest(token.encode(), known.encode()) for known in getattr(settings, 'API_TOKENS', ()))
+
+
+def api_write(view):
+    """
+    Изменяющие запросы API. Скрипты передают токен: такой заголовок браузер сам
+    не подставит, поэтому CSRF для них не проверяется. Остальные запросы (из браузера,
+    с cookie) проходят ту же проверку CSRF, что и HTML-формы: заголовок X-CSRFToken.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE') and not token_authenticated(request):
+            rejected = CsrfViewMiddleware(lambda request: None).process_view(request, None, (), {})
+            if rejected is not None:
+                return error_response('Нужен токен API или заголовок X-CSRFToken', status=403)
+        return view(request, *args, **kwargs)
+    return csrf_exempt(wrapper)
+
+
+def serialize_job(job):
+    def moment(value):
+        return value.isoformat() if value else None
+
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'finished': job.finished,
+        'progress': job.progress,
+        'total': job.total,
+        'percent': job.percent,
+        'message': job.message,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'result': job.result,
+        # Последняя строка трассировки - само исключение
+        'error': job.error.strip().splitlines()[-1] if job.error.strip() else '',
+        'created_at': moment(job.created_at),
+        'started_at': moment(job.started_at),
+        'finished_at': moment(job.finished_at),
+        'download_url': (
+            reverse('job_download', args=[job.pk])
+            if job.status == Job.SUCCEEDED and job.result and job.result.get('file') else None
+        ),
+    }
+
+
+def form_errors(form):
+    return {field: list(errors) for field, errors in form.errors.items()}
+
+
+def get_row(pk):
+    return Transaction.objects.filter(pk=pk).values(*API_FIELDS).first()
+
+
+def save_form(request, instance=None, partial=False):
+    try:
+        body = parse_body(request)
+    except ValueError as error:
+        return error_response(str(error))
+    if not isinstance(body, dict):
+        return error_response('Ожидается JSON-объект с полями транзакции')
+
+    data = {}
+    if partial:
+        # PATCH: недостающие поля берутся из текущей записи
+        current = serialize(get_row(instance.pk))
+        data.update({name: value for name, value in current.items() if name != 'id'})
+    data.update(body)
+
+    form = TransactionForm(data, instance=instance)
+    if not form.is_valid():
+        return error_response('Ошибка проверки данных', errors=form_errors(form))
+    transaction = form.save()
+    return JsonResponse(serialize(get_row(transaction.pk)), status=200 if instance else 201)
+
+
+@api_write
+@require_http_methods(['GET', 'POST'])
+def transaction_collection(request):
+    if request.method == 'POST':
+        return save_form(request)
+
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        return error_response('Параметр limit должен быть числом')
+
+    filterset = TransactionFilterSet(request.GET)
+    if filterset.errors:
+        return error_response('Неверные параметры фильтра', errors=filterset.errors)
+    queryset = filterset.filter(Transaction.objects.values(*API_FIELDS))
+    paginator = CursorPaginator(queryset, limit)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return error_response('Неверный курсор')
+
+    return JsonResponse({
+        'results': [serialize(row) for row in page],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    })
+
+
+@api_write
+@require_http_methods(['GET', 'PUT', 'PATCH', 'DELETE'])
+def transaction_detail(request, pk):
+    row = get_row(pk)
+    if row is None:
+        return error_response('Запись не найдена', status=404)
+
+    if request.method == 'GET':
+        return JsonResponse(serialize(row))
+    instance = Transaction.objects.get(pk=pk)
+    if request.method == 'DELETE':
+        instance.delete()
+        return HttpResponse(status=204)
+    return save_form(request, instance=instance, partial=request.method == 'PATCH')
+
+
+@api_write
+@require_http_methods(['POST'])
+def transaction_batch(request):
+    """
+    Пакетное создание: {"transactions": [...]} или просто список.
+    Все записи проверяются заранее; при любой ошибке ничего не сохраняется.
+    """
+    try:
+        body = parse_body(request)
+    except ValueError as error:
+        return error_response(str(error))
+    items = body.get('transactions') if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        return error_response('Ожидается список транзакций')
+    if len(items) > BATCH_LIMIT:
+        return error_response(f'Не больше {BATCH_LIMIT} записей за запрос', status=413)
+
+    validator = IdRowValidator()
+    objects, errors = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'errors': ['Ожидается JSON-объект']})
+            continue
+        try:
+            objects.append(validator.clean(item))
+        except ValidationError as error:
+            errors.append({'index': index, 'errors': error.messages})
+    if errors:
+        return error_response('Ошибка проверки данных', errors=errors)
+
+    with db_transaction.atomic():
+        created = Transaction.objects.bulk_create(objects, batch_size=1000)
+    return JsonResponse({'created': len(created), 'ids': [obj.pk for obj in created]}, status=201)
+
+
+@api_write
+@require_http_methods(['POST'])
+def transaction_bulk(request):
+    """
+    Массовая операция одним UPDATE/DELETE:
+    {"action": "update" | "delete", "ids": [...] или "filter": {параметры списка},
+     "changes": {"status": id, "subcategory": id, ...}}
+    Удаление по фильтру выполняется только с "confirm": true.
+    """
+    try:
+        body = parse_body(request)
+    except ValueError as error:
+        return error_response(str(error))
+    if not isinstance(body, dict):
+        return error_response('Ожидается JSON-объект')
+    changes = body.get('changes') or {}
+    selection = body.get('filter') or {}
+    if not isinstance(changes, dict) or not isinstance(selection, dict):
+        return error_response('Поля changes и filter должны быть объектами')
+
+    filterset = TransactionFilterSet(QueryDict(urlencode(selection, doseq=True)))
+    if filterset.errors:
+        return error_response('Неверные параметры фильтра', errors=filterset.errors)
+    try:
+        operation = BulkOperation.from_data(body.get('action'), changes)
+        ids = parse_ids(body.get('ids'))
+        if operation.action == DELETE and not ids and body.get('confirm') is not True:
+            return error_response('Удаление по фильтру требует подтверждения: "confirm": true')
+        count = operation.execute(select(ids, filterset))
+    except ValidationError as error:
+        return error_response(' '.join(error.messages))
+    return JsonResponse({'action': operation.action, 'count': count})
+
+
+@require_http_methods(['GET'])
+@read_only_view
+def transaction_stats(request):
+    filterset = TransactionFilterSet(request.GET)
+    if filterset.errors:
+        return error_response('Неверные параметры фильтра', errors=filterset.errors)
+    return JsonResponse(TransactionStats.for_filters(filterset).compute().as_dict())
+
+
+@require_http_methods(['GET'])
+def job_status(request, pk):
+    """Состояние фоновой задачи для опроса со страницы или из скрипта"""
+    job = Job.objects.filter(pk=pk).first()
+    if job is None:
+        return error_response('Задача не найдена', status=404)
+    return JsonResponse(serialize_job(job))
+
+
+@api_write
+@require_http_methods(['POST'])
+def job_cancel(request, pk):
+    job = Job.objects.filter(pk=pk).first()
+    if job is None:
+        return error_response('Задача не найдена', status=404)
+    if not cancel(job):
+        return error_response('Задача уже завершена', status=409, job=serialize_job(job))
+    job.refresh_from_db()
+    return JsonResponse(serialize_job(job), status=202)
+
+
+@require_http_methods(['GET'])
+def cache_stats(request):
+    """Попадания в кэш фрагментов списка по видам (для мониторинга)"""
+    return JsonResponse(fragment_counters.snapshot())
+
+
+@require_http_methods(['GET'])
+def metrics(request):
+    """Метрики запросов по представлениям в текстовом формате Prometheus"""
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
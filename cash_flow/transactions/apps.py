@@ -2,4 +2,10 @@ from django.apps import AppConfig
 
 class TransactionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'transactions'
\ No newline at end of file
+    name = 'transactions'
+    
+    def ready(self):
+        # reports регистрирует обработчик задачи 'report' для воркера run_jobs
+        from . import metrics, reports, signals, slowlog  # noqa: F401
+        metrics.install()
+        slowlog.install()
@@ -0,0 +1,46 @@
+"""
+SQLite с настройками для нескольких процессов-воркеров.
+
+В OPTIONS кроме обычных параметров sqlite3.connect принимаются:
+pragmas - словарь PRAGMA, выполняемых при открытии соединения;
+transaction_mode - режим BEGIN для atomic() (DEFERRED, IMMEDIATE, EXCLUSIVE).
+
+В режиме WAL читатели не ждут писателей, но транзакция, начатая чтением
+(BEGIN DEFERRED), при попытке записи получает "database is locked" сразу,
+без ожидания busy_timeout. BEGIN IMMEDIATE берет блокировку записи в начале
+транзакции, и конкурирующие писатели просто ждут своей очереди.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+def apply_pragmas(conn, pragmas):
+    """Выполняет PRAGMA по порядку; journal_mode и т.п. возвращают строку - ее не читаем"""
+    for name, value in pragmas.items():
+        conn.execute(f'PRAGMA {name} = {value}').fetchall()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        options = self.settings_dict['OPTIONS']
+        self.pragmas = dict(options.get('pragmas') or {})
+        self.transaction_mode = (options.get('transaction_mode') or 'DEFERRED').upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'Неизвестный transaction_mode {self.transaction_mode!r}, '
+                f'допустимы: {", ".join(TRANSACTION_MODES)}'
+            )
+        kwargs.pop('pragmas', None)
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        apply_pragmas(conn, self.pragmas)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -0,0 +1,258 @@
+"""
+Остаток на дату и выписка с входящим остатком.
+
+Остаток на день D = снимок PeriodSnapshot на конец предыдущего месяца
+плюс сумма DailyRollup с начала месяца D по D. Снимки строятся лениво:
+при запросе достраиваются месяцы от последнего сохраненного снимка, а
+изменение задним числом (Deltas.apply) удаляет снимки начиная с месяца
+изменения. Снимки сохраняются только с месяца первой записи и не дальше
+текущего месяца (или месяца последней записи, если она позже): до и после
+этого интервала итоги не меняются. Поэтому запрос остатка стоит O(месяцев с последнего изменения)
+один раз и O(1) дальше, независимо от числа транзакций.
+"""
+import datetime
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db import router
+from django.db import transaction as db_transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .hierarchy import get_hierarchy
+from .models import DailyRollup, PeriodSnapshot, Transaction
+from .pagination import NEXT, decode_cursor, encode_cursor
+from .stats import EXPENSE_TYPE, INCOME_TYPE, Totals
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return (month.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def previous_month(month):
+    return (month - datetime.timedelta(days=1)).replace(day=1)
+
+
+def invalidate_snapshots(since=None, using=None):
+    """Удаляет снимки, в которые входит день since (все - если since не задан)"""
+    snapshots = PeriodSnapshot.objects.using(using)
+    if since is not None:
+        snapshots = snapshots.filter(month__gte=month_start(since))
+    snapshots.delete()
+
+
+def add_totals(left, right):
+    return Totals(
+        count=left.count + right.count,
+        income=left.income + right.income,
+        expense=left.expense + right.expense,
+    )
+
+
+class Balances:
+    """
+    Остатки по всем статусам или по выбранным (status_ids).
+    Чтение снимков и сводки - через маршрутизатор, построение снимков - в базе записи.
+    """
+
+    def __init__(self, status_ids=(), hierarchy=None):
+        self.status_ids = tuple(status_ids)
+        self.hierarchy = hierarchy or get_hierarchy()
+        self.income_ids = self.hierarchy.type_ids(INCOME_TYPE)
+        self.expense_ids = self.hierarchy.type_ids(EXPENSE_TYPE)
+
+    def signed(self, type_id, amount):
+        """Сумма со знаком: поступление +, списание -, прочие типы не влияют на остаток"""
+        if type_id in self.income_ids:
+            return amount
+        if type_id in self.expense_ids:
+            return -amount
+        return Decimal('0')
+
+    def _expressions(self, count):
+        """count - Sum('count') для DailyRollup или Count('id') для строк"""
+        expressions = {'total_count': count}
+        if self.income_ids:
+            expressions['total_income'] = Sum('amount', filter=Q(type_id__in=self.income_ids))
+        if self.expense_ids:
+            expressions['total_expense'] = Sum('amount', filter=Q(type_id__in=self.expense_ids))
+        return expressions
+
+    @staticmethod
+    def _totals(row):
+        return Totals(
+            count=row.get('total_count') or 0,
+            income=row.get('total_income') or Decimal('0'),
+            expense=row.get('total_expense') or Decimal('0'),
+        )
+
+    def _status_filter(self):
+        return Q(status_id__in=self.status_ids) if self.status_ids else Q()
+
+    # Снимки
+
+    def ensure_snapshots(self, until):
+        """
+        Достраивает снимки по месяц until включительно и возвращает месяц снимка,
+        итоги которого совпадают с итогами until, или None, если до конца until
+        записей нет. Выполняется в транзакции базы записи: в SQLite это
+        BEGIN IMMEDIATE, так что построение не пересекается с записью транзакций
+        и не сохранит устаревшие итоги.
+        """
+        using = router.db_for_write(PeriodSnapshot)
+        snapshots = PeriodSnapshot.objects.using(using)
+        if snapshots.filter(month=until, status=None).exists():
+            return until
+        with db_transaction.atomic(using=using):
+            days = DailyRollup.objects.using(using).values_list('created_date', flat=True)
+            first_day = days.order_by('created_date').first()
+            # До месяца первой записи итоги нулевые: снимки не сохраняются
+            if first_day is None or until < month_start(first_day):
+                return None
+            # После месяца последней записи (и текущего) итоги не меняются: снимки
+            # дальше не сохраняются, вместо них берется снимок горизонта
+            horizon = month_start(max(days.order_by('-created_date').first(), timezone.localdate()))
+            if until > horizon:
+                until = horizon
+                if snapshots.filter(month=until, status=None).exists():
+                    return until
+            latest = snapshots.filter(
+                month__gte=month_start(first_day), month__lt=until, status=None,
+            ).order_by('-month').first()
+            carried = {}
+            if latest is not None:
+                start = next_month(latest.month)
+                for snapshot in snapshots.filter(month=latest.month):
+                    carried[snapshot.status_id] = [snapshot.count, snapshot.income, snapshot.expense]
+            else:
+                start = month_start(first_day)
+
+            monthly = {}
+            rows = (
+                DailyRollup.objects.using(using)
+                .filter(created_date__gte=start, created_date__lt=next_month(until))
+                .annotate(month=TruncMonth('created_date'))
+                .values('month', 'status_id')
+                .annotate(**self._expressions(Sum('count')))
+                .order_by()
+            )
+            for row in rows:
+                monthly.setdefault(row['month'], []).append((row['status_id'], self._totals(row)))
+
+            created = []
+            month = start
+            while month <= until:
+                for status_id, totals in monthly.get(month, ()):
+                    for key in (status_id, None):
+                        item = carried.setdefault(key, [0, Decimal('0'), Decimal('0')])
+                        item[0] += totals.count
+                        item[1] += totals.income
+                        item[2] += totals.expense
+                carried.setdefault(None, [0, Decimal('0'), Decimal('0')])
+                created.extend(
+                    PeriodSnapshot(month=month, status_id=key, count=count, income=income, expense=expense)
+                    for key, (count, income, expense) in carried.items()
+                )
+                month = next_month(month)
+            # Параллельный запрос мог построить те же месяцы раньше
+            snapshots.bulk_create(created, batch_size=500, ignore_conflicts=True)
+        return until
+
+    def closing(self, month):
+        """Итоги на конец месяца month нарастающим итогом"""
+        month = self.ensure_snapshots(month)
+        if month is None:
+            return self._totals({})
+        snapshots = PeriodSnapshot.objects.filter(month=month)
+        if self.status_ids:
+            snapshots = snapshots.filter(status_id__in=self.status_ids)
+        else:
+            snapshots = snapshots.filter(status=None)
+        row = snapshots.aggregate(
+            total_count=Sum('count'), total_income=Sum('income'), total_expense=Sum('expense'),
+        )
+        return self._totals(row)
+
+    # Остатки
+
+    def as_of(self, day):
+        """Итоги по день day включительно"""
+        month = month_start(day)
+        # До первого месяца календаря записей нет
+        opening = self.closing(previous_month(month)) if month > datetime.date.min else self._totals({})
+        row = DailyRollup.objects.order_by().filter(
+            self._status_filter(), created_date__gte=month, created_date__lte=day,
+        ).aggregate(**self._expressions(Sum('count')))
+        return add_totals(opening, self._totals(row))
+
+    def before(self, day, pk):
+        """Итоги по всем транзакциям раньше позиции (day, pk) в порядке (created_date, id)"""
+        opening = self.as_of(day - datetime.timedelta(days=1)) if day > datetime.date.min else self._totals({})
+        row = Transaction.objects.order_by().filter(
+            self._status_filter(), created_date=day, id__lt=pk,
+        ).aggregate(**self._expressions(Count('id')))
+        return add_totals(opening, self._totals(row))
+
+
+@dataclass(frozen=True)
+class StatementLine:
+    transaction: Transaction
+    signed_amount: Decimal
+    balance: Decimal
+
+
+@dataclass(frozen=True)
+class StatementPage:
+    opening: Decimal
+    closing: Decimal
+    lines: tuple
+    next_cursor: str = None
+
+
+class Statement:
+    """
+    Выписка: транзакции по возрастанию (created_date, id) с входящим остатком
+    страницы и остатком после каждой строки. Курсор - позиция последней
+    строки предыдущей страницы.
+    """
+
+    def __init__(self, filterset, per_page=50, hierarchy=None):
+        self.filterset = filterset
+        self.per_page = per_page
+        self.balances = Balances(filterset.values.get('status', ()), hierarchy=hierarchy)
+
+    def page(self, cursor=None):
+        queryset = self.filterset.filter(Transaction.objects.all()).select_related(
+            'status', 'type', 'category', 'subcategory'
+        ).order_by('created_date', 'id')
+        if cursor:
+            direction, created_date, pk = decode_cursor(cursor)
+            queryset = queryset.filter(created_date__gte=created_date).filter(
+                Q(created_date__gt=created_date) | Q(id__gt=pk)
+            )
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if rows:
+            opening = self.balances.before(rows[0].created_date, rows[0].pk).balance
+        else:
+            date_from = self.filterset.values.get('date_from')
+            if date_from and date_from > datetime.date.min:
+                opening = self.balances.as_of(date_from - datetime.timedelta(days=1)).balance
+            else:
+                opening = Decimal('0')
+
+        balance = opening
+        lines = []
+        for row in rows:
+            signed_amount = self.balances.signed(row.type_id, row.amount)
+            balance += signed_amount
+            lines.append(StatementLine(row, signed_amount, balance))
+        next_cursor = encode_cursor(NEXT, rows[-1].created_date, rows[-1].pk) if has_next else None
+        return StatementPage(opening=opening, closing=balance, lines=tuple(lines), next_cursor=next_cursor)
@@ -0,0 +1,184 @@
+"""
+Замеры страниц приложения через тестовый клиент Django (без сетевого сервера).
+
+Каждый сценарий - запрос к одному представлению. Для него считаются перцентили
+времени ответа, число SQL-запросов (по всем подключениям из DATABASES) и пик
+памяти Python (tracemalloc, отдельным запросом, чтобы трассировка не искажала время).
+Результаты сравниваются с сохраненной базовой линией: рост времени или памяти
+сверх допуска и любой рост числа запросов считаются регрессией.
+"""
+import datetime
+import json
+import math
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+
+from django.db import connections
+from django.db import transaction as db_transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .hierarchy import get_hierarchy
+from .models import Transaction
+
+# Разница во времени меньше этой считается шумом (мс), в памяти - в КБ
+NOISE_MS = 2.0
+NOISE_KB = 64
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    path: str
+    method: str = 'get'
+    data: dict = field(default_factory=dict)
+    # Запись откатывается после запроса: база не растет от повторов
+    rollback: bool = False
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    runs: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    queries: int
+    peak_kb: float
+    errors: int
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def percentile(values, fraction):
+    """Перцентиль методом ближайшего ранга по отсортированному списку"""
+    if not values:
+        return 0.0
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+def default_scenarios(hierarchy=None):
+    """Основные страницы и AJAX-загрузчики на текущих данных"""
+    hierarchy = hierarchy or get_hierarchy()
+    subcategory = hierarchy.subcategories[0] if hierarchy.subcategories else None
+    status = hierarchy.statuses[0] if hierarchy.statuses else None
+    latest = Transaction.objects.order_by('-created_date').values_list('created_date', flat=True).first()
+    latest = latest or datetime.date.today()
+    month_ago = (latest - datetime.timedelta(days=30)).isoformat()
+
+    scenarios = [
+        Scenario('transaction_list', reverse('transaction_list')),
+        Scenario('transaction_list_filtered', reverse('transaction_list') + f'?date_from={month_ago}'),
+        Scenario('transaction_list_search', reverse('transaction_list') + '?q=оплата'),
+        Scenario('transaction_create_form', reverse('transaction_create')),
+        Scenario('dictionary_management', reverse('dictionary_management')),
+        Scenario('ajax_hierarchy', reverse('ajax_hierarchy')),
+        Scenario('api_stats', reverse('api_stats')),
+    ]
+    if subcategory is not None:
+        category = subcategory.category
+        scenarios += [
+            Scenario('transaction_list_category', reverse('transaction_list') + f'?category={category.id}'),
+            Scenario('ajax_load_categories', reverse('ajax_load_categories') + f'?type_id={category.type_id}'),
+            Scenario('ajax_load_subcategories', reverse('ajax_load_subcategories') + f'?category_id={category.id}'),
+        ]
+        if status is not None:
+            scenarios.append(Scenario('transaction_create', reverse('transaction_create'), method='post', data={
+                'created_date': latest.isoformat(),
+                'status': status.id,
+                'type': category.type_id,
+                'category': category.id,
+                'subcategory': subcategory.id,
+                'amount': '1500.00',
+                'comment': 'замер',
+            }, rollback=True))
+    return scenarios
+
+
+class BenchmarkRunner:
+    def __init__(self, iterations=20, warmup=2):
+        self.iterations = iterations
+        self.warmup = warmup
+
+    def request(self, client, scenario):
+        send = getattr(client, scenario.method)
+        if not scenario.rollback:
+            return send(scenario.path, scenario.data or None)
+        with db_transaction.atomic():
+            response = send(scenario.path, scenario.data)
+            db_transaction.set_rollback(True)
+        return response
+
+    def run(self, scenario):
+        client = Client()
+        for _ in range(self.warmup):
+            self.request(client, scenario)
+
+        latencies, queries, errors = [], [], 0
+        for _ in range(self.iterations):
+            with ExitStack() as stack:
+                contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+                started = time.perf_counter()
+                response = self.request(client, scenario)
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(sum(len(context) for context in contexts))
+            errors += response.status_code >= 400
+
+        tracemalloc.start()
+        try:
+            self.request(client, scenario)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        latencies.sort()
+        return ScenarioResult(
+            name=scenario.name,
+            runs=len(latencies),
+            p50_ms=round(statistics.median(latencies), 2),
+            p95_ms=round(percentile(latencies, 0.95), 2),
+            p99_ms=round(percentile(latencies, 0.99), 2),
+            max_ms=round(latencies[-1], 2),
+            queries=max(queries),
+            peak_kb=round(peak / 1024, 1),
+            errors=errors,
+        )
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Список регрессий относительно базовой линии {имя сценария: словарь результата}"""
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+        if result.p95_ms > base['p95_ms'] * (1 + tolerance) + NOISE_MS:
+            regressions.append(f'{result.name}: p95 {result.p95_ms} мс, было {base["p95_ms"]} мс')
+        if result.queries > base['queries']:
+            regressions.append(f'{result.name}: SQL-запросов {result.queries}, было {base["queries"]}')
+        if result.peak_kb > base['peak_kb'] * (1 + tolerance) + NOISE_KB:
+            regressions.append(f'{result.name}: пик памяти {result.peak_kb} КБ, было {base["peak_kb"]} КБ')
+        if result.errors > base.get('errors', 0):
+            regressions.append(f'{result.name}: ошибок {result.errors}, было {base.get("errors", 0)}')
+    return regressions
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as fileobj:
+        return json.load(fileobj)
+
+
+def save_baseline(path, results, rows):
+    document = {
+        'rows': rows,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'scenarios': {result.name: result.as_dict() for result in results},
+    }
+    with open(path, 'w', encoding='utf-8') as fileobj:
+        json.dump(document, fileobj, ensure_ascii=False, indent=2)
@@ -0,0 +1,305 @@
+"""
+Поддержка производных данных о транзакциях.
+
+Любая запись в таблицу транзакций сводится к изменениям по «корзинам»
+(created_date, status, type, category, subcategory): на сколько изменились
+сумма и число строк. Deltas накапливает эти изменения и применяет их
+к DailyRollup и счетчикам использования справочников (usage_count)
+в той же транзакции БД, что и саму запись.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Case, Count, F, Model, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .money import MoneyField
+
+BUCKET_FIELDS = ('created_date', 'status_id', 'type_id', 'category_id', 'subcategory_id')
+TRACKED_FIELDS = BUCKET_FIELDS + ('amount',)
+# Измерения корзины, у справочников которых есть счетчик usage_count
+USAGE_FIELDS = BUCKET_FIELDS[1:]
+# С какого числа корзин выгоднее пакетный UPSERT, чем UPDATE на каждую
+BULK_APPLY_THRESHOLD = 20
+# Сколько последних версий хранит лента изменений (BucketChange)
+CHANGE_FEED_RETENTION = 10000
+
+
+def affects_buckets(model, values):
+    """Затрагивает ли update(**values) суммы или измерения транзакций"""
+    return any(model._meta.get_field(name).attname in TRACKED_FIELDS for name in values)
+
+
+def grouped(queryset):
+    """Суммы и количества строк queryset по корзинам"""
+    return queryset.order_by().values(*BUCKET_FIELDS).annotate(
+        bucket_amount=Sum('amount'),
+        bucket_count=Count('id'),
+    )
+
+
+class Deltas:
+    def __init__(self):
+        self._items = defaultdict(lambda: [Decimal('0'), 0])
+
+    def __bool__(self):
+        return any(amount or count for amount, count in self._items.values())
+
+    def items(self):
+        return self._items.items()
+
+    def add(self, bucket, amount, count):
+        item = self._items[bucket]
+        item[0] += amount or 0
+        item[1] += count
+
+    def add_instance(self, obj, sign):
+        meta = obj._meta
+        bucket = tuple(
+            meta.get_field(name).to_python(getattr(obj, name)) if name == 'created_date'
+            else getattr(obj, name)
+            for name in BUCKET_FIELDS
+        )
+        amount = meta.get_field('amount').to_python(obj.amount)
+        self.add(bucket, amount * sign, sign)
+
+    def add_queryset(self, queryset, sign):
+        for row in grouped(queryset):
+            bucket = tuple(row[name] for name in BUCKET_FIELDS)
+            self.add(bucket, row['bucket_amount'] * sign, row['bucket_count'] * sign)
+
+    def add_pks(self, model, pks, sign, using=None, batch_size=500):
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            self.add_queryset(model._base_manager.using(using).filter(pk__in=batch), sign)
+
+    def add_constant_update(self, queryset, values):
+        """
+        Учитывает queryset.update(**values) без чтения строк после обновления:
+        новые корзины получаются из старых подстановкой констант.
+        Возвращает False, если среди значений есть выражения.
+        """
+        changes = {}
+        for name, value in values.items():
+            if hasattr(value, 'resolve_expression'):
+                return False
+            field = queryset.model._meta.get_field(name)
+            if field.attname not in TRACKED_FIELDS:
+                continue
+            if isinstance(value, Model):
+                value = value.pk
+            changes[field.attname] = field.to_python(value)
+
+        for row in grouped(queryset):
+            old_bucket = tuple(row[name] for name in BUCKET_FIELDS)
+            new_bucket = tuple(changes.get(name, row[name]) for name in BUCKET_FIELDS)
+            count = row['bucket_count']
+            amount = changes['amount'] * count if 'amount' in changes else row['bucket_amount']
+            self.add(old_bucket, -row['bucket_amount'], -count)
+            self.add(new_bucket, amount, count)
+        return True
+
+    def touch(self, queryset):
+        """Отмечает корзины строк, которые меняются без изменения сумм (например, комментарий)"""
+        self.add_queryset(queryset, 0)
+
+    def apply(self, using=None):
+        """
+        Переносит изменения в DailyRollup и счетчики использования справочников,
+        сбрасывает устаревшие снимки остатков, увеличивает DataVersion.DATA
+        и записывает затронутые корзины в ленту изменений.
+        Вызывается при каждой записи в транзакции, даже без изменений сумм.
+        """
+        from .balances import invalidate_snapshots
+        from .models import DataVersion
+        items = [(bucket, values) for bucket, values in self._items.items() if values[0] or values[1]]
+        if len(items) > BULK_APPLY_THRESHOLD:
+            self._apply_bulk(items, using)
+        elif items:
+            self._apply_each(items, using)
+        apply_usage(items, using)
+        if items:
+            # Снимки остатков с месяца самого раннего изменения больше не верны
+            invalidate_snapshots(min(bucket[0] for bucket, values in items), using)
+        version = DataVersion.bump(DataVersion.DATA, using=using)
+        record_changes(self._items.keys(), version, using)
+        self._items.clear()
+
+    def _apply_each(self, items, using):
+        from .models import DailyRollup
+        manager = DailyRollup.objects.db_manager(using)
+        emptied = []
+        for bucket, (amount, count) in items:
+            key = dict(zip(BUCKET_FIELDS, bucket))
+            updated = manager.filter(**key).update(
+                # Приращение передается в копейках: целочисленное сложение в БД
+                amount=F('amount') + Value(amount, output_field=MoneyField()),
+                count=F('count') + count,
+            )
+            if not updated:
+                manager.create(amount=amount, count=count, **key)
+            if count < 0:
+                emptied.append(key)
+        # Пустые корзины не храним, чтобы сводка не разрасталась
+        for key in emptied:
+            manager.filter(count=0, **key).delete()
+
+    def _apply_bulk(self, items, using):
+        """
+        Для массовых операций: одно чтение затронутых дней и пакетный UPSERT
+        вместо UPDATE на каждую корзину. Вызывается внутри транзакции записи,
+        поэтому прочитанные значения не могут устареть.
+        """
+        from .models import DailyRollup
+        manager = DailyRollup.objects.db_manager(using)
+        dates = sorted({bucket[0] for bucket, values in items})
+        current = {}
+        for start in range(0, len(dates), 500):
+            rows = manager.filter(created_date__in=dates[start:start + 500]).values_list(
+                *BUCKET_FIELDS, 'amount', 'count'
+            )
+            for row in rows:
+                current[row[:5]] = row[5:]
+
+        upserts, emptied = [], []
+        for bucket, (amount, count) in items:
+            old_amount, old_count = current.get(bucket, (0, 0))
+            key = dict(zip(BUCKET_FIELDS, bucket))
+            if old_count + count == 0:
+                emptied.append(key)
+            else:
+                upserts.append(DailyRollup(amount=old_amount + amount, count=old_count + count, **key))
+        manager.bulk_create(
+            upserts,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['created_date', 'status', 'type', 'category', 'subcategory'],
+            update_fields=['amount', 'count'],
+        )
+        for key in emptied:
+            manager.filter(**key).delete()
+
+
+def usage_model(field):
+    from .models import Transaction
+    return Transaction._meta.get_field(field).related_model
+
+
+def apply_usage(items, using=None):
+    """
+    Изменения числа строк по корзинам - в usage_count справочников:
+    не больше одного UPDATE на модель (CASE по id). queryset.update не вызывает
+    сигналы, поэтому кэш справочников при этом не сбрасывается.
+    """
+    changes = {field: defaultdict(int) for field in USAGE_FIELDS}
+    for bucket, (amount, count) in items:
+        if count:
+            for field, pk in zip(USAGE_FIELDS, bucket[1:]):
+                changes[field][pk] += count
+    for field, per_pk in changes.items():
+        per_pk = {pk: delta for pk, delta in per_pk.items() if delta}
+        if not per_pk:
+            continue
+        delta = Case(*(When(pk=pk, then=Value(value)) for pk, value in per_pk.items()), default=Value(0))
+        usage_model(field)._base_manager.using(using).filter(pk__in=per_pk).update(
+            usage_count=F('usage_count') + delta,
+        )
+
+
+def record_changes(buckets, version, using=None):
+    from .models import BucketChange
+    manager = BucketChange.objects.db_manager(using)
+    manager.bulk_create(
+        [BucketChange(version=version, **dict(zip(BUCKET_FIELDS, bucket))) for bucket in buckets],
+        batch_size=500,
+    )
+    # Старые версии не нужны: кэш, отставший сильнее, просто перестраивается
+    if version % 1000 == 0:
+        manager.filter(version__lt=version - CHANGE_FEED_RETENTION).delete()
+
+
+def expected_rollups(using=None):
+    """Сводка, посчитанная заново по исходным строкам"""
+    from .models import Transaction
+    return {
+        tuple(row[name] for name in BUCKET_FIELDS): (row['bucket_amount'], row['bucket_count'])
+        for row in grouped(Transaction._base_manager.using(using).all()).iterator()
+    }
+
+
+def rebuild_rollups(using=None, batch_size=1000):
+    """
+    Пересчитывает сводку по исходным строкам. Чтение и замена - в одной транзакции
+    записи (BEGIN IMMEDIATE), поэтому параллельная запись не потеряется; исправленные
+    корзины попадают в ленту изменений, чтобы кэши по ней перестроились.
+    """
+    from .balances import invalidate_snapshots
+    from .models import DailyRollup, DataVersion
+    manager = DailyRollup.objects.using(using)
+    with db_transaction.atomic(using=using):
+        expected = expected_rollups(using)
+        actual = {
+            tuple(row[:5]): tuple(row[5:])
+            for row in manager.values_list(*BUCKET_FIELDS, 'amount', 'count').iterator()
+        }
+        changed = [bucket for bucket in expected.keys() | actual.keys() if expected.get(bucket) != actual.get(bucket)]
+        invalidate_snapshots(using=using)
+        manager.all().delete()
+        created = manager.bulk_create(
+            (
+                DailyRollup(amount=amount, count=count, **dict(zip(BUCKET_FIELDS, bucket)))
+                for bucket, (amount, count) in expected.items()
+            ),
+            batch_size=batch_size,
+        )
+        record_changes(changed, DataVersion.bump(DataVersion.DATA, using=using), using)
+        rebuild_usage(using)
+    return len(created)
+
+
+def _usage_subquery(field):
+    from .models import Transaction
+    return Subquery(
+        Transaction._base_manager.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(usage=Count('id')).values('usage')
+    )
+
+
+def rebuild_usage(using=None):
+    """Пересчитывает usage_count всех справочников: один UPDATE с подзапросом на модель"""
+    from .models import DataVersion
+    with db_transaction.atomic(using=using):
+        # Кэш счетчиков (hierarchy.get_usage) сверяется с версией данных
+        DataVersion.bump(DataVersion.DATA, using=using)
+        for field in USAGE_FIELDS:
+            usage_model(field)._base_manager.using(using).update(
+                usage_count=Coalesce(_usage_subquery(field), 0),
+            )
+
+
+def verify_usage(using=None):
+    """Список расхождений (модель, id, ожидаемое, фактическое) в счетчиках usage_count"""
+    mismatches = []
+    for field in USAGE_FIELDS:
+        model = usage_model(field)
+        rows = model._base_manager.using(using).annotate(
+            expected=Coalesce(_usage_subquery(field), 0),
+        ).exclude(usage_count=F('expected')).values_list('pk', 'expected', 'usage_count')
+        mismatches.extend((model._meta.model_name, pk, expected, actual) for pk, expected, actual in rows)
+    return mismatches
+
+
+def verify_rollups(using=None):
+    """Список расхождений (bucket, ожидаемое, фактическое); пустой - если сводка верна"""
+    from .models import DailyRollup
+    expected = expected_rollups(using)
+    actual = {
+        tuple(row[name] for name in BUCKET_FIELDS): (row['amount'], row['count'])
+        for row in DailyRollup.objects.using(using).values(*BUCKET_FIELDS, 'amount', 'count').iterator()
+    }
+    mismatches = []
+    for bucket in sorted(expected.keys() | actual.keys(), key=str):
+        if expected.get(bucket) != actual.get(bucket):
+            mismatches.append((bucket, expected.get(bucket), actual.get(bucket)))
+    return mismatches
@@ -0,0 +1,118 @@
+"""
+Массовые операции над транзакциями: смена статуса или категории и удаление.
+
+Записи выбираются списком id или текущим фильтром списка (TransactionFilterSet).
+Изменения проверяются один раз на весь пакет по кэшу справочников, а затем
+выполняются одним UPDATE или DELETE в одной транзакции БД. Сводки, снимки
+остатков и лента изменений поддерживаются TransactionQuerySet (bookkeeping),
+поисковый индекс - триггерами.
+"""
+from dataclasses import dataclass
+
+from django.core.exceptions import ValidationError
+from django.db import transaction as db_transaction
+
+from .filters import FilterError, IdListFilter
+from .hierarchy import get_hierarchy
+from .models import Transaction
+
+UPDATE = 'update'
+DELETE = 'delete'
+ACTIONS = (UPDATE, DELETE)
+MAX_IDS = 10000
+
+_ids_filter = IdListFilter('id', label='Записи')
+
+
+def parse_ids(value):
+    """Список id: [1, 2], "1,2" или ["1", "2"] - в отсортированный кортеж"""
+    if isinstance(value, (list, tuple)):
+        value = ','.join(str(item) for item in value)
+    text = str(value or '').replace(' ', '')
+    if not text:
+        return ()
+    try:
+        ids = _ids_filter.to_python(text)
+    except FilterError as error:
+        raise ValidationError(str(error))
+    if len(ids) > MAX_IDS:
+        raise ValidationError(f'Не больше {MAX_IDS} записей за раз - используйте выбор по фильтру')
+    return ids
+
+
+def _id(value, label):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f'{label}: неверный id "{value}"')
+
+
+def resolve_changes(data, hierarchy=None):
+    """
+    Новые значения полей по данным status/type/category/subcategory (пустые - без изменений).
+    Подкатегория однозначно задает категорию и тип, поэтому смена категории или типа
+    требует подкатегории: иначе у части строк иерархия стала бы несогласованной.
+    """
+    hierarchy = hierarchy or get_hierarchy()
+    status_id = _id(data.get('status'), 'Статус')
+    type_id = _id(data.get('type'), 'Тип')
+    category_id = _id(data.get('category'), 'Категория')
+    subcategory_id = _id(data.get('subcategory'), 'Подкатегория')
+
+    changes = {}
+    if status_id is not None:
+        if hierarchy.status(status_id) is None:
+            raise ValidationError(f'Статус с id "{status_id}" не найден в справочнике')
+        changes['status_id'] = status_id
+
+    if subcategory_id is None:
+        if category_id is not None or type_id is not None:
+            raise ValidationError('При смене типа или категории укажите подкатегорию')
+        return changes
+
+    subcategory = hierarchy.subcategory(subcategory_id)
+    if subcategory is None:
+        raise ValidationError(f'Подкатегория с id "{subcategory_id}" не найдена в справочнике')
+    category = subcategory.category
+    if category_id is not None and category_id != category.id:
+        raise ValidationError(f'Подкатегория "{subcategory}" не относится к выбранной категории')
+    if type_id is not None and type_id != category.type_id:
+        raise ValidationError(f'Категория "{category}" не относится к выбранному типу')
+    changes.update(type_id=category.type_id, category_id=category.id, subcategory_id=subcategory.id)
+    return changes
+
+
+def select(ids=(), filterset=None):
+    """Записи по списку id либо по примененному фильтру (пустой фильтр не выбирает все)"""
+    if ids:
+        return Transaction.objects.filter(pk__in=ids)
+    if filterset is None or not filterset.applied:
+        raise ValidationError('Не выбраны записи: отметьте строки или задайте фильтр')
+    if filterset.errors:
+        raise ValidationError('Исправьте фильтр: ' + '; '.join(filterset.errors.values()))
+    return filterset.filter(Transaction.objects.all())
+
+
+@dataclass(frozen=True)
+class BulkOperation:
+    action: str
+    changes: dict
+
+    @classmethod
+    def from_data(cls, action, data=None, hierarchy=None):
+        if action not in ACTIONS:
+            raise ValidationError(f'Неизвестное действие "{action}"')
+        changes = resolve_changes(data or {}, hierarchy) if action == UPDATE else {}
+        if action == UPDATE and not changes:
+            raise ValidationError('Не выбрано, что изменить')
+        return cls(action, changes)
+
+    def execute(self, queryset):
+        """Число измененных или удаленных записей"""
+        with db_transaction.atomic(using=queryset.db):
+            if self.action == DELETE:
+                deleted, per_model = queryset.delete()
+                return per_model.get(Transaction._meta.label, 0)
+            return queryset.update(**self.changes)
@@ -0,0 +1,271 @@
+"""
+Колоночная копия таблицы транзакций в памяти процесса (необязательно, нужен numpy).
+
+Каждая колонка - массив numpy: id, дата (порядковый номер дня), id статуса,
+типа, категории, подкатегории и сумма в копейках (int64). Фильтры превращаются
+в булевы маски, группировка и суммы - в np.unique + np.bincount, поэтому
+произвольный срез считается без обращения к БД.
+
+Копия загружается один раз, а затем догоняет БД по ленте BucketChange:
+строки дней, затронутых после версии копии, перечитываются заново.
+Изменения справочников (каскадные удаления идут мимо ленты) и отставание
+больше CHANGE_FEED_RETENTION приводят к полной перезагрузке.
+"""
+import threading
+
+from asgiref.sync import sync_to_async
+from django.db.models import BigIntegerField, ExpressionWrapper, F
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy не обязателен
+    np = None
+
+from .bookkeeping import CHANGE_FEED_RETENTION
+from .models import BucketChange, DataVersion, Transaction
+from .money import from_kopecks, to_kopecks
+from .stats import EXPENSE_TYPE, INCOME_TYPE, CategoryTotal, StatsResult, Totals
+
+COLUMNS = ('id', 'date', 'status', 'type', 'category', 'subcategory', 'amount')
+SOURCE_FIELDS = ('id', 'created_date', 'status_id', 'type_id', 'category_id', 'subcategory_id')
+# Сумма читается как есть - целыми копейками, без перевода в Decimal и обратно
+RAW_AMOUNT = ExpressionWrapper(F('amount'), output_field=BigIntegerField())
+# Поле модели -> колонка (для фильтров FilterSet)
+FIELD_COLUMNS = {
+    'created_date': 'date',
+    'status_id': 'status',
+    'type_id': 'type',
+    'category_id': 'category',
+    'subcategory_id': 'subcategory',
+    'amount': 'amount',
+}
+CHUNK_SIZE = 50000
+
+
+class UnsupportedFilter(ValueError):
+    """Фильтр не выражается через колонки копии - считать нужно в SQL"""
+
+
+def available():
+    return np is not None
+
+
+def supports(filterset):
+    """Все заданные фильтры выражаются через колонки копии"""
+    return all(
+        filterset.declared_filters[name].field in FIELD_COLUMNS
+        and filterset.declared_filters[name].lookup in ('exact', 'gte', 'lte')
+        for name in filterset.values
+    )
+
+
+def encode_value(column, value):
+    if column == 'date':
+        return value.toordinal()
+    if column == 'amount':
+        return to_kopecks(value)
+    return value
+
+
+def _empty_columns():
+    return {column: np.empty(0, dtype=np.int64) for column in COLUMNS}
+
+
+def _read_columns(queryset):
+    """Колонки из values_list().iterator() порциями, без моделей и без полного списка кортежей"""
+    chunks = {column: [] for column in COLUMNS}
+    rows = queryset.order_by().values_list(*SOURCE_FIELDS, RAW_AMOUNT).iterator(chunk_size=CHUNK_SIZE)
+    while True:
+        batch = [row for _, row in zip(range(CHUNK_SIZE), rows)]
+        if not batch:
+            break
+        pk, created_date, status_id, type_id, category_id, subcategory_id, amount = zip(*batch)
+        values = {
+            'id': pk,
+            'date': [day.toordinal() for day in created_date],
+            'status': status_id,
+            'type': type_id,
+            'category': category_id,
+            'subcategory': subcategory_id,
+            'amount': amount,
+        }
+        for column in COLUMNS:
+            chunks[column].append(np.fromiter(values[column], dtype=np.int64, count=len(batch)))
+    if not chunks['id']:
+        return _empty_columns()
+    return {column: np.concatenate(parts) for column, parts in chunks.items()}
+
+
+class ColumnStore:
+    """Неизменяемая копия: обновление создает новый объект, читатели старого не мешают"""
+
+    def __init__(self, columns, data_version, hierarchy_version):
+        self.columns = columns
+        self.data_version = data_version
+        self.hierarchy_version = hierarchy_version
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    @classmethod
+    def load(cls, using=None):
+        # Версии читаются до строк: все, что изменится позже, догонит следующая синхронизация
+        data_version = DataVersion.get(DataVersion.DATA, using=using)
+        hierarchy_version = DataVersion.get(DataVersion.HIERARCHY, using=using)
+        return cls(_read_columns(Transaction.objects.using(using)), data_version, hierarchy_version)
+
+    def refreshed(self, data_version, dates, using=None):
+        """Копия, в которой строки дней dates перечитаны из БД"""
+        ordinals = np.fromiter((day.toordinal() for day in dates), dtype=np.int64, count=len(dates))
+        keep = ~np.isin(self.columns['date'], ordinals)
+        fresh = _read_columns(Transaction.objects.using(using).filter(created_date__in=dates))
+        columns = {
+            column: np.concatenate([self.columns[column][keep], fresh[column]])
+            for column in COLUMNS
+        }
+        return ColumnStore(columns, data_version, self.hierarchy_version)
+
+    # Запросы
+
+    def mask(self, filterset=None):
+        """Булева маска строк по нормализованным значениям FilterSet"""
+        result = np.ones(len(self), dtype=bool)
+        if filterset is None:
+            return result
+        for name, value in filterset.values.items():
+            declared = filterset.declared_filters[name]
+            column = FIELD_COLUMNS.get(declared.field)
+            if column is None:
+                raise UnsupportedFilter(name)
+            data = self.columns[column]
+            if isinstance(value, tuple):
+                result &= np.isin(data, np.asarray(value, dtype=np.int64))
+            elif declared.lookup == 'gte':
+                result &= data >= encode_value(column, value)
+            elif declared.lookup == 'lte':
+                result &= data <= encode_value(column, value)
+            elif declared.lookup == 'exact':
+                result &= data == encode_value(column, value)
+            else:
+                raise UnsupportedFilter(name)
+        return result
+
+    def total(self, mask, type_ids=None):
+        """(сумма в копейках, число строк) по маске и, если задано, типам"""
+        if type_ids is not None:
+            mask = mask & np.isin(self.columns['type'], np.asarray(type_ids, dtype=np.int64))
+        return int(self.columns['amount'][mask].sum()), int(np.count_nonzero(mask))
+
+    def group_by(self, columns, mask=None):
+        """
+        {ключ (значения columns): (сумма в копейках, число строк)} по строкам маски.
+        Составной ключ сводится к плотному индексу через np.unique, суммы - np.bincount.
+        """
+        selected = slice(None) if mask is None else mask
+        keys = np.stack([self.columns[column][selected] for column in columns], axis=1)
+        if not len(keys):
+            return {}
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        # Веса bincount - float64: точны для сумм до 2**53 копеек
+        sums = np.bincount(inverse, weights=self.columns['amount'][selected], minlength=len(unique))
+        counts = np.bincount(inverse, minlength=len(unique))
+        return {
+            tuple(int(part) for part in key): (int(round(amount)), int(count))
+            for key, amount, count in zip(unique, sums, counts)
+        }
+
+
+_lock = threading.Lock()
+_store = None
+
+
+def get_store(using=None):
+    """
+    Актуальная копия. При неизменной версии данных - один запрос к DataVersion,
+    иначе перечитываются только дни из ленты изменений.
+    """
+    global _store
+    data_version = DataVersion.get(DataVersion.DATA, using=using)
+    store = _store
+    if store is not None and store.data_version == data_version:
+        return store
+    with _lock:
+        store = _store
+        if store is None or store.data_version != data_version:
+            _store = _synced(store, data_version, using)
+        return _store
+
+
+def _synced(store, data_version, using):
+    hierarchy_version = DataVersion.get(DataVersion.HIERARCHY, using=using)
+    if (
+        store is None
+        or store.hierarchy_version != hierarchy_version
+        or store.data_version > data_version
+        or data_version - store.data_version > CHANGE_FEED_RETENTION
+    ):
+        return ColumnStore.load(using)
+    dates = list(
+        BucketChange.objects.using(using)
+        .filter(version__gt=store.data_version, version__lte=data_version)
+        .order_by().values_list('created_date', flat=True).distinct()
+    )
+    return store.refreshed(data_version, dates, using)
+
+
+def reset_store():
+    global _store
+    _store = None
+
+
+class ColumnarStats:
+    """
+    Тот же результат, что у TransactionStats, но по колоночной копии.
+    Используется через TransactionStats.for_filters(..., engine='columnar').
+    """
+
+    def __init__(self, filterset=None, hierarchy=None, top_limit=10):
+        from .hierarchy import get_hierarchy
+        self.filterset = filterset
+        self.hierarchy = hierarchy or get_hierarchy()
+        self.top_limit = top_limit
+        self.income_ids = self.hierarchy.type_ids(INCOME_TYPE)
+        self.expense_ids = self.hierarchy.type_ids(EXPENSE_TYPE)
+
+    def _totals(self, store, mask):
+        income, _ = store.total(mask, self.income_ids)
+        expense, _ = store.total(mask, self.expense_ids)
+        return Totals(
+            count=int(np.count_nonzero(mask)),
+            income=from_kopecks(income),
+            expense=from_kopecks(expense),
+        )
+
+    def compute(self):
+        store = get_store()
+        everything = store.mask()
+        overall = self._totals(store, everything)
+        applied = self.filterset is not None and self.filterset.applied
+        mask = store.mask(self.filterset) if applied else everything
+        filtered = self._totals(store, mask) if applied else overall
+
+        groups = store.group_by(('category', 'type'), mask)
+        # Как в SQL: по убыванию суммы; при равенстве - по id категории
+        top = sorted(groups.items(), key=lambda item: (-item[1][0], item[0]))[:self.top_limit]
+        categories = []
+        for (category_id, type_id), (amount, count) in top:
+            category = self.hierarchy.category(category_id)
+            type_ = self.hierarchy.type(type_id)
+            categories.append(CategoryTotal(
+                category_id=category_id,
+                category_name=category.name if category else '',
+                type_id=type_id,
+                type_name=type_.name if type_ else '',
+                amount=from_kopecks(amount),
+                count=count,
+            ))
+        return StatsResult(overall=overall, filtered=filtered, categories=tuple(categories))
+
+    async def acompute(self):
+        return await sync_to_async(self.compute)()
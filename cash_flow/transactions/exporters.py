@@ -0,0 +1,122 @@
+"""
+Потоковый экспорт транзакций в CSV и JSON Lines.
+
+Строки читаются через values_list(...).iterator(chunk_size), без JOIN
+к справочникам: названия подставляются из кэша Hierarchy. В памяти держится
+только текущая порция, поэтому объем выгрузки не ограничен, а первые байты
+(заголовок) уходят клиенту еще до выполнения запроса к БД.
+"""
+import csv
+import io
+import json
+
+from asgiref.sync import sync_to_async
+
+from .hierarchy import get_hierarchy
+from .models import Transaction
+
+# Заголовки совпадают с COLUMN_ALIASES импорта: выгрузку можно загрузить обратно
+CSV_HEADER = ('ID', 'Дата', 'Статус', 'Тип', 'Категория', 'Подкатегория', 'Сумма', 'Комментарий')
+EXPORT_FIELDS = (
+    'id', 'created_date', 'status_id', 'type_id', 'category_id', 'subcategory_id', 'amount', 'comment',
+)
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+}
+
+
+class TransactionExporter:
+    def __init__(self, queryset=None, hierarchy=None, chunk_size=2000):
+        if queryset is None:
+            queryset = Transaction.objects.all()
+        self.queryset = queryset.order_by('-created_date', '-id')
+        self.hierarchy = hierarchy or get_hierarchy()
+        self.chunk_size = chunk_size
+        # Строк отдано к текущему моменту (ход фоновой выгрузки)
+        self.exported = 0
+
+    def _name(self, lookup, pk):
+        item = lookup(pk)
+        return item.name if item else ''
+
+    def rows(self):
+        """Кортежи (id, дата, статус, тип, категория, подкатегория, сумма, комментарий)"""
+        hierarchy = self.hierarchy
+        records = self.queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=self.chunk_size)
+        for pk, created_date, status_id, type_id, category_id, subcategory_id, amount, comment in records:
+            self.exported += 1
+            yield (
+                pk,
+                created_date,
+                self._name(hierarchy.status, status_id),
+                self._name(hierarchy.type, type_id),
+                self._name(hierarchy.category, category_id),
+                self._name(hierarchy.subcategory, subcategory_id),
+                amount,
+                comment or '',
+            )
+
+    def _batches(self, header, encode_row):
+        """Склеивает строки порциями по chunk_size, чтобы не отдавать их по одной"""
+        if header:
+            yield header
+        batch = []
+        for row in self.rows():
+            batch.append(encode_row(row))
+            if len(batch) >= self.chunk_size:
+                yield ''.join(batch)
+                batch = []
+        if batch:
+            yield ''.join(batch)
+
+    def csv(self, delimiter=';'):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=delimiter)
+
+        def encode_row(row):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            return buffer.getvalue()
+
+        # BOM нужен Excel, чтобы распознать UTF-8
+        return self._batches('\ufeff' + encode_row(CSV_HEADER), encode_row)
+
+    def jsonl(self):
+        def encode_row(row):
+            pk, created_date, status, type_, category, subcategory, amount, comment = row
+            return json.dumps({
+                'id': pk,
+                'created_date': created_date.isoformat(),
+                'status': status,
+                'type': type_,
+                'category': category,
+                'subcategory': subcategory,
+                'amount': str(amount),
+                'comment': comment,
+            }, ensure_ascii=False) + '\n'
+
+        return self._batches('', encode_row)
+
+    def stream(self, export_format):
+        if export_format == 'jsonl':
+            return self.jsonl()
+        return self.csv()
+
+    async def astream(self, export_format):
+        """
+        stream() для ASGI: иначе Django соберет синхронный поток в список целиком.
+        Каждая порция читается в синхронном потоке запроса - курсор и соединение те же.
+        """
+        chunks = self.stream(export_format)
+        done = object()
+        try:
+            while True:
+                chunk = await sync_to_async(next)(chunks, done)
+                if chunk is done:
+                    break
+                yield chunk
+        finally:
+            # Клиент отключился - закрываем курсор в том же потоке
+            await sync_to_async(chunks.close)()
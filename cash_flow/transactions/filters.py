@@ -0,0 +1,240 @@
+"""
+Фильтры списка транзакций по параметрам GET-запроса.
+
+Один и тот же разбор используется списком, экспортом, API и статистикой,
+чтобы все они видели ровно один и тот же набор записей. Параметры
+проверяются и приводятся к каноническому виду (?status=01 и ?status=1 -
+один и тот же фильтр), ошибочные значения не попадают в запрос, а
+описываются в errors.
+"""
+import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from django.utils.http import urlencode
+
+DATE_INPUT_FORMATS = ('%Y-%m-%d', '%d.%m.%Y')
+# Пределы значений, которые можно передать в запрос: целое SQLite - 64 бита со знаком,
+# сумма транзакции - 15 знаков, из них 2 после запятой
+MAX_ID = 2 ** 63 - 1
+MAX_AMOUNT = Decimal('9999999999999.99')
+
+
+def parse_id(value):
+    """Положительный id из строки или None: только цифры ASCII ('²' - тоже isdigit) в пределах 64 бит"""
+    value = str(value).strip()
+    if not (value.isascii() and value.isdigit()):
+        return None
+    number = int(value)
+    return number if 0 < number <= MAX_ID else None
+
+
+class FilterError(ValueError):
+    pass
+
+
+class Filter:
+    """Один параметр: разбор строки и условие Q для нормализованного значения"""
+
+    # Поле есть и в DailyRollup, и в ленте изменений BucketChange
+    bucket_field = True
+
+    def __init__(self, field, lookup='exact', label=''):
+        self.field = field
+        self.lookup = lookup
+        self.label = label
+        self.name = None
+
+    def raw(self, data):
+        value = data.get(self.name, '')
+        return value.strip() if isinstance(value, str) else value
+
+    def parse(self, data):
+        """Нормализованное значение или None, если параметр не задан"""
+        value = self.raw(data)
+        if value in (None, ''):
+            return None
+        return self.to_python(value)
+
+    def to_python(self, value):
+        return value
+
+    def to_string(self, value):
+        return str(value)
+
+    def to_q(self, value):
+        return Q(**{f'{self.field}__{self.lookup}': value})
+
+
+class DateFilter(Filter):
+    def to_python(self, value):
+        for date_format in DATE_INPUT_FORMATS:
+            try:
+                return datetime.datetime.strptime(value, date_format).date()
+            except ValueError:
+                continue
+        raise FilterError(f'{self.label}: неверная дата "{value}"')
+
+    def to_string(self, value):
+        return value.isoformat()
+
+
+class DecimalFilter(Filter):
+    bucket_field = False
+
+    def to_python(self, value):
+        try:
+            number = Decimal(value.replace(',', '.').replace(' ', ''))
+        except InvalidOperation:
+            raise FilterError(f'{self.label}: неверное число "{value}"')
+        if not number.is_finite():
+            raise FilterError(f'{self.label}: неверное число "{value}"')
+        if abs(number) > MAX_AMOUNT:
+            raise FilterError(f'{self.label}: слишком большое число "{value}"')
+        return number.quantize(Decimal('0.01'))
+
+
+class IdListFilter(Filter):
+    """Один или несколько id: ?status=1&status=2 или ?status=1,2"""
+
+    def raw(self, data):
+        values = data.getlist(self.name) if hasattr(data, 'getlist') else [data.get(self.name, '')]
+        parts = [part.strip() for value in values if value for part in str(value).split(',')]
+        return ','.join(part for part in parts if part)
+
+    def to_python(self, value):
+        ids = set()
+        for part in value.split(','):
+            pk = parse_id(part)
+            if pk is None:
+                raise FilterError(f'{self.label}: неверный id "{part}"')
+            ids.add(pk)
+        return tuple(sorted(ids))
+
+    def to_string(self, value):
+        return ','.join(str(pk) for pk in value)
+
+    def to_q(self, value):
+        # Одно значение - равенство: его обслуживает составной индекс (измерение, дата, id)
+        if len(value) == 1:
+            return Q(**{self.field: value[0]})
+        return Q(**{f'{self.field}__in': value})
+
+
+class SearchFilter(Filter):
+    """Полнотекстовый поиск по комментарию (см. search.py); в сводках комментариев нет"""
+
+    bucket_field = False
+
+    def to_python(self, value):
+        from .search import words
+        found = words(value)
+        if not found:
+            raise FilterError(f'{self.label}: нет слов для поиска')
+        # Каноническая форма - слова через пробел: "Реклама,  Яндекс" = "реклама яндекс"
+        return ' '.join(found)
+
+    def to_q(self, value):
+        from .search import search_q
+        return search_q(value)
+
+
+class FilterSetMeta(type):
+    def __new__(mcs, name, bases, attrs):
+        declared = {}
+        for base in bases:
+            declared.update(getattr(base, 'declared_filters', {}))
+        for key, value in list(attrs.items()):
+            if isinstance(value, Filter):
+                value.name = key
+                declared[key] = attrs.pop(key)
+        attrs['declared_filters'] = declared
+        return super().__new__(mcs, name, bases, attrs)
+
+
+class FilterSet(metaclass=FilterSetMeta):
+    """
+    values - нормализованные значения заданных параметров,
+    params - они же строками (для формы и ссылок), errors - ошибки разбора.
+    """
+
+    def __init__(self, data):
+        self.values = {}
+        self.errors = {}
+        for name, declared in self.declared_filters.items():
+            try:
+                value = declared.parse(data)
+            except FilterError as error:
+                self.errors[name] = str(error)
+                continue
+            if value is not None:
+                self.values[name] = value
+        self.params = {
+            name: declared.to_string(self.values[name]) if name in self.values else ''
+            for name, declared in self.declared_filters.items()
+        }
+
+    @property
+    def applied(self):
+        return bool(self.values)
+
+    def _q(self, bucket_only=False):
+        q = Q()
+        for name, value in self.values.items():
+            declared = self.declared_filters[name]
+            if bucket_only and not declared.bucket_field:
+                continue
+            q &= declared.to_q(value)
+        return q
+
+    @property
+    def q(self):
+        return self._q()
+
+    @property
+    def bucket_q(self):
+        """
+        Условие только по дате и измерениям - для DailyRollup и ленты изменений.
+        Для фильтров по сумме это надмножество нужных записей.
+        """
+        return self._q(bucket_only=True)
+
+    @property
+    def bucket_only(self):
+        """Все заданные фильтры выражаются через корзины (можно считать по DailyRollup)"""
+        return all(self.declared_filters[name].bucket_field for name in self.values)
+
+    @property
+    def condition(self):
+        """Условие для TransactionStats: None, если фильтры не заданы"""
+        return self.q if self.applied else None
+
+    def filter(self, queryset):
+        return queryset.filter(self.q) if self.applied else queryset
+
+    def querystring(self):
+        """Канонические параметры для ссылок: без пустых значений, в постоянном порядке"""
+        return urlencode([(name, value) for name, value in self.params.items() if value])
+
+    @property
+    def cache_key(self):
+        return self.querystring()
+
+
+class TransactionFilterSet(FilterSet):
+    date_from = DateFilter('created_date', 'gte', label='Дата с')
+    date_to = DateFilter('created_date', 'lte', label='Дата по')
+    status = IdListFilter('status_id', label='Статус')
+    type = IdListFilter('type_id', label='Тип')
+    category = IdListFilter('category_id', label='Категория')
+    subcategory = IdListFilter('subcategory_id', label='Подкатегория')
+    amount_min = DecimalFilter('amount', 'gte', label='Сумма от')
+    amount_max = DecimalFilter('amount', 'lte', label='Сумма до')
+    q = SearchFilter('comment', 'match', label='Поиск')
+
+
+class StatementFilterSet(FilterSet):
+    """Выписка: остатки хранятся в разрезе статусов, поэтому других фильтров нет"""
+    date_from = DateFilter('created_date', 'gte', label='Дата с')
+    date_to = DateFilter('created_date', 'lte', label='Дата по')
+    status = IdListFilter('status_id', label='Статус')
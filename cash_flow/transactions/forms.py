@@ -1,7 +1,68 @@
 from django import forms
+from .hierarchy import get_hierarchy
 from .models import Transaction, Status, Type, Category, Subcategory
 
+
+def model_instance(model, item):
+    """Экземпляр модели по элементу Hierarchy вместе с родителями (тип категории и т.д.) без запросов к БД"""
+    values = {'pk': item.id, 'name': item.name}
+    for field in model._meta.concrete_fields:
+        if field.is_relation and hasattr(item, field.name):
+            values[field.name] = model_instance(field.related_model, getattr(item, field.name))
+    instance = model(**values)
+    instance._state.adding = False
+    return instance
+
+
+class HierarchyChoiceField(forms.ChoiceField):
+    """
+    Выбор элемента справочника по кэшу Hierarchy вместо queryset:
+    ни отрисовка, ни проверка значения не обращаются к БД.
+    """
+    
+    def __init__(self, model, *args, empty_label='---------', **kwargs):
+        self.model = model
+        self.empty_label = empty_label
+        self._items = {}
+        super().__init__(*args, **kwargs)
+    
+    def set_items(self, items):
+        self._items = {item.id: item for item in items}
+        self.choices = [('', self.empty_label)] + [(item.id, item.name) for item in items]
+    
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            item = self._items[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+        # Объект не читается из БД: первичный ключ и родители берутся из кэша
+        return model_instance(self.model, item)
+    
+    def validate(self, value):
+        if value is None and self.required:
+            raise forms.ValidationError(self.error_messages['required'], code='required')
+    
+    def prepare_value(self, value):
+        if isinstance(value, self.model):
+            return value.pk
+        return value
+    
+    def has_changed(self, initial, data):
+        return str(self.prepare_value(initial) or '') != str(data or '')
+
+
 class TransactionForm(forms.ModelForm):
+    status = HierarchyChoiceField(Status, label='Статус *')
+    type = HierarchyChoiceField(Type, label='Тип операции *')
+    category = HierarchyChoiceField(Category, label='Категория *')
+    subcategory = HierarchyChoiceField(Subcategory, label='Подкатегория *')
+    
     class Meta:
         model = Transaction
         fields = ['created_date', 'status', 'type', 'category', 'subcategory', 'amount', 'comment']
@@ -37,7 +98,7 @@ class TransactionForm(forms.ModelForm):
             'comment': 'Комментарий',
         }
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, hierarchy=None, **kwargs):
         super().__init__(*args, **kwargs)
         
         # Добавляем классы Bootstrap ко всем полям
@@ -58,28 +119,36 @@ class TransactionForm(forms.ModelForm):
             from django.utils import timezone
             self.fields['created_date'].initial = timezone.now().date()
         
+        # Справочники берутся из кэша, а не из отдельных запросов к БД
+        if hierarchy is None:
+            hierarchy = get_hierarchy()
+        self.fields['status'].set_items(hierarchy.statuses)
+        self.fields['type'].set_items(hierarchy.types)
+        
         # Динамическая загрузка категорий и подкатегорий
         if 'type' in self.data:
             try:
                 type_id = int(self.data.get('type'))
-                self.fields['category'].queryset = Category.objects.filter(type_id=type_id)
+                self.fields['category'].set_items(hierarchy.categories_for_type(type_id))
             except (ValueError, TypeError):
-                self.fields['category'].queryset = Category.objects.none()
+                self.fields['category'].set_items(())
         elif self.instance.pk:
-            self.fields['category'].queryset = self.instance.type.category_set.all()
+            self.fields['category'].set_items(hierarchy.categories_for_type(self.instance.type_id))
         else:
-            self.fields['category'].queryset = Category.objects.none()
+            self.fields['category'].set_items(())
         
         if 'category' in self.data:
             try:
                 category_id = int(self.data.get('category'))
-                self.fields['subcategory'].queryset = Subcategory.objects.filter(category_id=category_id)
+                self.fields['subcategory'].set_items(hierarchy.subcategories_for_category(category_id))
             except (ValueError, TypeError):
-                self.fields['subcategory'].queryset = Subcategory.objects.none()
+                self.fields['subcategory'].set_items(())
         elif self.instance.pk:
-            self.fields['subcategory'].queryset = self.instance.category.subcategory_set.all()
+            self.fields['subcategory'].set_items(
+                hierarchy.subcategories_for_category(self.instance.category_id)
+            )
         else:
-            self.fields['subcategory'].queryset = Subcategory.objects.none()
+            self.fields['subcategory'].set_items(())
     
     def clean_amount(self):
         amount = self.cleaned_data.get('amount')
@@ -149,4 +218,18 @@ class SubcategoryForm(forms.ModelForm):
         labels = {
             'name': 'Название подкатегории',
             'category': 'Категория',
-        }
\ No newline at end of file
+        }
+
+class ImportForm(forms.Form):
+    file = forms.FileField(
+        label='Файл выписки (CSV или XLSX)',
+        widget=forms.ClearableFileInput(attrs={
+            'class': 'form-control',
+            'accept': '.csv,.xlsx',
+        }),
+    )
+    background = forms.BooleanField(
+        label='Загрузить в фоне (для больших файлов)',
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
@@ -0,0 +1,101 @@
+"""
+Кэш отрендеренных фрагментов списка транзакций (общая статистика, статистика по фильтрам и страница таблицы).
+
+Ключ - нормализованные фильтры (и курсор для страницы) плюс версия
+справочников. Вместе с HTML хранится версия данных на момент заполнения.
+Если версия с тех пор выросла, лента BucketChange показывает, задели ли
+новые записи дни и измерения этого фильтра: если нет, фрагмент остается
+действительным, и запись в кэше продлевается до текущей версии.
+"""
+import hashlib
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .bookkeeping import CHANGE_FEED_RETENTION
+from .models import BucketChange
+
+DEFAULT_TIMEOUT = 300
+
+
+class FragmentCounters:
+    """Счетчики попаданий по видам фрагментов (в пределах процесса)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def add(self, kind, outcome):
+        with self._lock:
+            self._counts[kind, outcome] += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        kinds = sorted({kind for kind, outcome in counts})
+        return {
+            kind: {
+                outcome: counts.get((kind, outcome), 0)
+                for outcome in ('hits', 'revalidated', 'misses')
+            }
+            for kind in kinds
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+counters = FragmentCounters()
+
+
+def get_cache():
+    return caches[getattr(settings, 'FRAGMENT_CACHE_ALIAS', 'default')]
+
+
+class Fragment:
+    """
+    Один кэшируемый фрагмент. condition - условие Q по полям корзины
+    (дата и измерения), которым фильтр ограничивает записи.
+    """
+
+    def __init__(self, kind, key_parts, condition, data_version):
+        digest = hashlib.sha1('|'.join(str(part) for part in key_parts).encode()).hexdigest()
+        self.kind = kind
+        self.key = f'fragment:{kind}:{digest}'
+        self.condition = condition
+        self.data_version = data_version
+        self.timeout = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+    async def aget(self):
+        """HTML фрагмента или None, если его нужно построить заново"""
+        cache = get_cache()
+        entry = await cache.aget(self.key)
+        if entry is None:
+            counters.add(self.kind, 'misses')
+            return None
+
+        version, html = entry
+        if version == self.data_version:
+            counters.add(self.kind, 'hits')
+            return html
+
+        # Лента хранит не все версии - слишком старую запись не проверить
+        if version > self.data_version or self.data_version - version > CHANGE_FEED_RETENTION:
+            counters.add(self.kind, 'misses')
+            return None
+        changed = await BucketChange.objects.filter(
+            version__gt=version, version__lte=self.data_version,
+        ).filter(self.condition).aexists()
+        if changed:
+            counters.add(self.kind, 'misses')
+            return None
+
+        await cache.aset(self.key, (self.data_version, html), self.timeout)
+        counters.add(self.kind, 'revalidated')
+        return html
+
+    async def aset(self, html):
+        await get_cache().aset(self.key, (self.data_version, html), self.timeout)
@@ -0,0 +1,267 @@
+"""
+Кэш справочников (статусы, типы, категории, подкатегории) в памяти процесса.
+
+Справочники маленькие и меняются редко, поэтому целиком хранятся
+в неизменяемом объекте Hierarchy. Актуальность проверяется по счетчику
+DataVersion.HIERARCHY, который увеличивается при любом изменении справочника,
+поэтому кэш корректен и при нескольких рабочих процессах.
+"""
+import hashlib
+import json
+import threading
+from functools import cached_property
+
+from asgiref.sync import sync_to_async
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from django.db import transaction as db_transaction
+
+from .models import DataVersion, Status, Type, Category, Subcategory
+from .routers import snapshot_alias
+
+
+@dataclass(frozen=True)
+class StatusItem:
+    id: int
+    name: str
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.name
+
+
+@dataclass(frozen=True)
+class TypeItem:
+    id: int
+    name: str
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.name
+
+
+@dataclass(frozen=True)
+class CategoryItem:
+    id: int
+    name: str
+    type: TypeItem
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def type_id(self):
+        return self.type.id
+
+    def __str__(self):
+        return self.name
+
+
+@dataclass(frozen=True)
+class SubcategoryItem:
+    id: int
+    name: str
+    category: CategoryItem
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def category_id(self):
+        return self.category.id
+
+    def __str__(self):
+        return self.name
+
+
+class Hierarchy:
+    """Неизменяемый снимок справочников: тип → категории → подкатегории, плюс статусы"""
+
+    def __init__(self, version, statuses, types, categories, subcategories):
+        self.version = version
+        # Порядок совпадает с Meta.ordering моделей
+        self.statuses = tuple(sorted(statuses, key=lambda item: item.name))
+        self.types = tuple(sorted(types, key=lambda item: item.name))
+        self.categories = tuple(sorted(categories, key=lambda item: (item.type.name, item.name)))
+        self.subcategories = tuple(sorted(subcategories, key=lambda item: (item.category.name, item.name)))
+
+        self._statuses = MappingProxyType({item.id: item for item in self.statuses})
+        self._types = MappingProxyType({item.id: item for item in self.types})
+        self._categories = MappingProxyType({item.id: item for item in self.categories})
+        self._subcategories = MappingProxyType({item.id: item for item in self.subcategories})
+
+        by_type = {item.id: [] for item in self.types}
+        for category in sorted(self.categories, key=lambda item: item.name):
+            by_type[category.type.id].append(category)
+        by_category = {item.id: [] for item in self.categories}
+        for subcategory in sorted(self.subcategories, key=lambda item: item.name):
+            by_category[subcategory.category.id].append(subcategory)
+        self._by_type = MappingProxyType({key: tuple(value) for key, value in by_type.items()})
+        self._by_category = MappingProxyType({key: tuple(value) for key, value in by_category.items()})
+
+    @classmethod
+    def load(cls, version):
+        # Все справочники - одним снимком базы: иначе категория, добавленная между
+        # запросами, ссылалась бы на тип, которого нет в прочитанном списке
+        using = snapshot_alias()
+        with db_transaction.atomic(using=using):
+            types = {
+                row['id']: TypeItem(row['id'], row['name'])
+                for row in Type.objects.using(using).values('id', 'name')
+            }
+            categories = {
+                row['id']: CategoryItem(row['id'], row['name'], types[row['type_id']])
+                for row in Category.objects.using(using).values('id', 'name', 'type_id')
+            }
+            statuses = [StatusItem(row['id'], row['name']) for row in Status.objects.using(using).values('id', 'name')]
+            subcategories = [
+                SubcategoryItem(row['id'], row['name'], categories[row['category_id']])
+                for row in Subcategory.objects.using(using).values('id', 'name', 'category_id')
+            ]
+        return cls(
+            version,
+            statuses=statuses,
+            types=types.values(),
+            categories=categories.values(),
+            subcategories=subcategories,
+        )
+
+    def status(self, pk):
+        return self._statuses.get(pk)
+
+    def type(self, pk):
+        return self._types.get(pk)
+
+    def category(self, pk):
+        return self._categories.get(pk)
+
+    def subcategory(self, pk):
+        return self._subcategories.get(pk)
+
+    def categories_for_type(self, type_id):
+        return self._by_type.get(type_id, ())
+
+    def subcategories_for_category(self, category_id):
+        return self._by_category.get(category_id, ())
+
+    def type_ids(self, name):
+        return tuple(item.id for item in self.types if item.name == name)
+
+    def tree(self):
+        """Дерево тип → категории → подкатегории для клиента"""
+        return {
+            'version': self.version,
+            'types': [
+                {
+                    'id': type_.id,
+                    'name': type_.name,
+                    'categories': [
+                        {
+                            'id': category.id,
+                            'name': category.name,
+                            'subcategories': [
+                                {'id': subcategory.id, 'name': subcategory.name}
+                                for subcategory in self.subcategories_for_category(category.id)
+                            ],
+                        }
+                        for category in self.categories_for_type(type_.id)
+                    ],
+                }
+                for type_ in self.types
+            ],
+        }
+
+    @cached_property
+    def document(self):
+        """(JSON-дерево в байтах, сильный ETag) - считается один раз на версию справочников"""
+        content = json.dumps(self.tree(), ensure_ascii=False, separators=(',', ':')).encode()
+        return content, '"%s"' % hashlib.sha1(content).hexdigest()
+
+
+_lock = threading.Lock()
+_cached = None
+
+
+def get_hierarchy():
+    """
+    Текущий снимок справочников. Стоит одного запроса к DataVersion;
+    сами справочники перечитываются только после изменения версии.
+    """
+    global _cached
+    version = DataVersion.get(DataVersion.HIERARCHY)
+    cached = _cached
+    if cached is not None and cached.version == version:
+        return cached
+    with _lock:
+        if _cached is None or _cached.version != version:
+            _cached = Hierarchy.load(version)
+        return _cached
+
+
+async def aget_hierarchy():
+    """Асинхронный вариант get_hierarchy: при неизменной версии - один запрос без потока"""
+    version = await DataVersion.aget(DataVersion.HIERARCHY)
+    cached = _cached
+    if cached is not None and cached.version == version:
+        return cached
+    return await sync_to_async(get_hierarchy)()
+
+
+def invalidate_hierarchy():
+    """Увеличивает версию справочников во всех процессах"""
+    global _cached
+    DataVersion.bump(DataVersion.HIERARCHY)
+    _cached = None
+
+
+@dataclass(frozen=True)
+class Usage:
+    """Счетчики usage_count справочников: {'status': {id: число транзакций}, ...}"""
+    version: int
+    counts: MappingProxyType
+
+    @classmethod
+    def load(cls, version):
+        models = {'status': Status, 'type': Type, 'category': Category, 'subcategory': Subcategory}
+        return cls(version, MappingProxyType({
+            model_type: MappingProxyType(dict(model.objects.values_list('id', 'usage_count')))
+            for model_type, model in models.items()
+        }))
+
+    def rows(self, model_type, items):
+        """Пары (запись справочника, число транзакций) для шаблона"""
+        counts = self.counts[model_type]
+        return [(item, counts.get(item.id, 0)) for item in items]
+
+
+_usage = None
+
+
+def get_usage():
+    """
+    Счетчики меняются при каждой записи транзакций, поэтому хранятся отдельно
+    от Hierarchy и проверяются по DataVersion.DATA: один запрос, пока данные не менялись.
+    """
+    global _usage
+    version = DataVersion.get(DataVersion.DATA)
+    cached = _usage
+    if cached is not None and cached.version == version:
+        return cached
+    with _lock:
+        if _usage is None or _usage.version != version:
+            _usage = Usage.load(version)
+        return _usage
+
+
+def reset_usage():
+    global _usage
+    _usage = None
@@ -0,0 +1,309 @@
+"""
+Потоковый импорт банковских выписок (CSV/XLSX).
+
+Файл читается построчно и не загружается в память целиком. Названия
+справочников сопоставляются по кэшу Hierarchy, строки проверяются теми же
+полями, что и в TransactionForm, а вставка идет через bulk_create порциями,
+каждая порция - в своей транзакции БД.
+"""
+import csv
+import datetime
+import io
+import time
+import zipfile
+from dataclasses import dataclass, field
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import transaction as db_transaction
+
+from .forms import TransactionForm
+from .hierarchy import get_hierarchy
+from .models import Transaction
+
+# Допустимые заголовки столбцов (без учета регистра)
+COLUMN_ALIASES = {
+    'created_date': ('created_date', 'date', 'дата', 'дата операции', 'дата создания'),
+    'status': ('status', 'статус'),
+    'type': ('type', 'тип', 'тип операции'),
+    'category': ('category', 'категория'),
+    'subcategory': ('subcategory', 'подкатегория'),
+    'amount': ('amount', 'сумма', 'сумма (руб)'),
+    'comment': ('comment', 'комментарий'),
+}
+REQUIRED_COLUMNS = ('created_date', 'status', 'type', 'category', 'subcategory', 'amount')
+DATE_INPUT_FORMATS = ['%Y-%m-%d', '%d.%m.%Y', '%d.%m.%y', '%d/%m/%Y']
+
+
+class ImportFileError(Exception):
+    """Файл нельзя импортировать целиком: неизвестный формат, нет столбцов и т.п."""
+
+
+def _normalize_header(header):
+    columns = {}
+    for index, title in enumerate(header):
+        title = str(title or '').strip().lower()
+        for name, aliases in COLUMN_ALIASES.items():
+            if title in aliases and name not in columns:
+                columns[name] = index
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        raise ImportFileError(f'В файле нет обязательных столбцов: {", ".join(missing)}')
+    return columns
+
+
+def _rows(header, records, first_line):
+    columns = _normalize_header(header)
+    for line, record in enumerate(records, start=first_line):
+        if not any(value not in (None, '') for value in record):
+            continue
+        yield line, {
+            name: record[index] if index < len(record) else None
+            for name, index in columns.items()
+        }
+
+
+def _guarded(read, errors, message):
+    """
+    Строки из read() с ошибками чтения файла (кодировка, поврежденная структура)
+    в виде ImportFileError - и при открытии, и посреди файла
+    """
+    try:
+        yield from read()
+    except ImportFileError:
+        raise
+    except errors as error:
+        raise ImportFileError(message(error)) from error
+
+
+def _csv_error(error):
+    if isinstance(error, UnicodeDecodeError):
+        return 'Файл не в кодировке UTF-8: сохраните выписку как "CSV UTF-8"'
+    return f'Файл CSV поврежден: {error}'
+
+
+def read_csv(fileobj, delimiter=None, encoding='utf-8-sig'):
+    """Строки CSV в виде (номер строки, dict). Разделитель ',' или ';' определяется сам"""
+    def read():
+        nonlocal fileobj, delimiter
+        if isinstance(fileobj.read(0), bytes):
+            fileobj = io.TextIOWrapper(fileobj, encoding=encoding, newline='')
+        first = fileobj.readline()
+        if delimiter is None:
+            delimiter = ';' if first.count(';') > first.count(',') else ','
+        header = next(csv.reader([first], delimiter=delimiter), [])
+        return _rows(header, csv.reader(fileobj, delimiter=delimiter), first_line=2)
+
+    return _guarded(read, (UnicodeDecodeError, csv.Error), _csv_error)
+
+
+def read_xlsx(fileobj):
+    """Строки первого листа XLSX в режиме read_only (потоково)"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFileError('Для импорта XLSX установите пакет openpyxl')
+
+    def read():
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        records = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(records, ())
+        return _rows(header, records, first_line=2)
+
+    # openpyxl сообщает о поврежденной книге разными исключениями: zip, XML, значения ячеек
+    return _guarded(
+        read, (zipfile.BadZipFile, KeyError, ValueError, IndexError, SyntaxError, OSError),
+        lambda error: 'Файл XLSX поврежден или не является книгой Excel',
+    )
+
+
+def read_file(fileobj, name, delimiter=None):
+    name = name.lower()
+    if name.endswith('.csv') or name.endswith('.txt'):
+        return read_csv(fileobj, delimiter=delimiter)
+    if name.endswith('.xlsx'):
+        return read_xlsx(fileobj)
+    raise ImportFileError('Поддерживаются только файлы CSV и XLSX')
+
+
+class RowValidator:
+    """
+    Проверка строки выписки по тем же правилам, что и TransactionForm:
+    поля формы для даты, суммы и комментария, иерархия тип → категория →
+    подкатегория - по кэшу справочников вместо запросов к БД.
+    """
+
+    def __init__(self, hierarchy=None):
+        hierarchy = hierarchy or get_hierarchy()
+        self.statuses = {item.name.lower(): item.id for item in hierarchy.statuses}
+        self.types = {item.name.lower(): item.id for item in hierarchy.types}
+        self.categories = {(item.type.id, item.name.lower()): item.id for item in hierarchy.categories}
+        self.subcategories = {
+            (item.category.id, item.name.lower()): item.id for item in hierarchy.subcategories
+        }
+        fields = TransactionForm.base_fields
+        self.date_field = forms.DateField(input_formats=DATE_INPUT_FORMATS)
+        self.amount_field = fields['amount']
+        self.comment_field = fields['comment']
+
+    def _lookup(self, mapping, key, label, value):
+        try:
+            return mapping[key]
+        except KeyError:
+            raise ValidationError(f'{label} "{value}" не найден(а) в справочнике')
+
+    def resolve(self, text):
+        """Id статуса, типа, категории и подкатегории по названиям из строки"""
+        status_id = self._lookup(self.statuses, text('status').lower(), 'Статус', text('status'))
+        type_id = self._lookup(self.types, text('type').lower(), 'Тип', text('type'))
+        category_id = self._lookup(
+            self.categories, (type_id, text('category').lower()), 'Категория', text('category'),
+        )
+        subcategory_id = self._lookup(
+            self.subcategories, (category_id, text('subcategory').lower()),
+            'Подкатегория', text('subcategory'),
+        )
+        return status_id, type_id, category_id, subcategory_id
+
+    def clean(self, row):
+        """Возвращает несохраненный Transaction или поднимает ValidationError"""
+        def text(name):
+            value = row.get(name)
+            return '' if value is None else str(value).strip()
+
+        created_date = row.get('created_date')
+        if isinstance(created_date, datetime.datetime):
+            created_date = created_date.date()
+        if not isinstance(created_date, datetime.date):
+            created_date = self.date_field.clean(text('created_date'))
+
+        amount = row.get('amount')
+        if isinstance(amount, str):
+            amount = amount.replace('\xa0', '').replace(' ', '').replace(',', '.')
+        amount = self.amount_field.clean(amount)
+        if amount <= 0:
+            raise ValidationError('Сумма должна быть больше нуля')
+
+        status_id, type_id, category_id, subcategory_id = self.resolve(text)
+        return Transaction(
+            created_date=created_date,
+            status_id=status_id,
+            type_id=type_id,
+            category_id=category_id,
+            subcategory_id=subcategory_id,
+            amount=amount,
+            comment=self.comment_field.clean(text('comment')) or None,
+        )
+
+
+class IdRowValidator(RowValidator):
+    """Те же проверки, но справочники заданы id (для JSON API)"""
+
+    def __init__(self, hierarchy=None):
+        self.hierarchy = hierarchy or get_hierarchy()
+        super().__init__(self.hierarchy)
+
+    def _item(self, lookup, label, value):
+        try:
+            item = lookup(int(value))
+        except (TypeError, ValueError):
+            item = None
+        if item is None:
+            raise ValidationError(f'{label} с id "{value}" не найден(а) в справочнике')
+        return item
+
+    def resolve(self, text):
+        hierarchy = self.hierarchy
+        status = self._item(hierarchy.status, 'Статус', text('status'))
+        type_ = self._item(hierarchy.type, 'Тип', text('type'))
+        category = self._item(hierarchy.category, 'Категория', text('category'))
+        subcategory = self._item(hierarchy.subcategory, 'Подкатегория', text('subcategory'))
+        if category.type_id != type_.id:
+            raise ValidationError(f'Категория "{category}" не относится к типу "{type_}"')
+        if subcategory.category_id != category.id:
+            raise ValidationError(f'Подкатегория "{subcategory}" не относится к категории "{category}"')
+        return status.id, type_.id, category.id, subcategory.id
+
+
+@dataclass
+class ImportResult:
+    processed: int = 0
+    created: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'processed': self.processed,
+            'created': self.created,
+            'error_count': self.error_count,
+            'errors': [{'line': line, 'message': message} for line, message in self.errors],
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+class TransactionImporter:
+    """
+    Импорт потока строк (номер строки, dict). В памяти держится только
+    текущая порция из chunk_size строк; она вставляется одной транзакцией
+    через bulk_create пакетами по batch_size.
+    """
+
+    def __init__(self, batch_size=1000, chunk_size=10000, max_errors=1000,
+                 dry_run=False, hierarchy=None, progress=None):
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.dry_run = dry_run
+        self.validator = RowValidator(hierarchy)
+        self.progress = progress
+
+    def run(self, rows):
+        result = ImportResult()
+        try:
+            self._run(rows, result)
+        except ImportFileError as error:
+            # Порции до ошибки уже зафиксированы - об этом нужно сказать
+            if result.created:
+                raise ImportFileError(f'{error}. До ошибки добавлено записей: {result.created}') from error
+            raise
+        return result
+
+    def _run(self, rows, result):
+        started = time.monotonic()
+        chunk = []
+        for line, row in rows:
+            result.processed += 1
+            try:
+                chunk.append(self.validator.clean(row))
+            except ValidationError as error:
+                result.error_count += 1
+                if len(result.errors) < self.max_errors:
+                    result.errors.append((line, '; '.join(error.messages)))
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk, result)
+                chunk = []
+                result.elapsed = time.monotonic() - started
+                if self.progress:
+                    self.progress(result)
+        self._flush(chunk, result)
+        result.elapsed = time.monotonic() - started
+        if self.progress:
+            self.progress(result)
+
+    def _flush(self, chunk, result):
+        if not chunk or self.dry_run:
+            return
+        with db_transaction.atomic():
+            Transaction.objects.bulk_create(chunk, batch_size=self.batch_size)
+        result.created += len(chunk)
+
+
+def import_file(fileobj, name, delimiter=None, **options):
+    return TransactionImporter(**options).run(read_file(fileobj, name, delimiter=delimiter))
@@ -0,0 +1,377 @@
+"""
+Фоновые задачи без внешнего брокера: очередь - таблица Job в той же базе.
+
+Представление ставит задачу (enqueue) и сразу отвечает, ход работы
+опрашивается по api/v1/jobs/<id>/. Воркер (manage.py run_jobs) забирает
+задачи условным UPDATE и выполняет их в пуле потоков или процессов.
+Обработчик получает JobContext: через него записывает ход работы и узнает
+об отмене. После ошибки задача повторяется с удваивающейся задержкой, пока
+не исчерпаны попытки. Задачи воркера, который перестал обновлять отметку
+(процесс убит), возвращаются в очередь.
+
+Файлы задач (загруженные выписки, готовые выгрузки) лежат в JOB_FILES_DIR;
+входные файлы из payload['cleanup'] удаляются, когда задача завершена.
+"""
+import datetime
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, close_old_connections
+from django.db.models import F
+from django.http import QueryDict
+from django.utils import timezone
+
+from .bookkeeping import rebuild_rollups
+from .exporters import FORMATS, TransactionExporter
+from .filters import TransactionFilterSet
+from .importers import import_file
+from .models import Job, Transaction
+from .routers import read_only_view
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETRY_DELAY = 30        # секунд до первого повтора, дальше вдвое больше
+DEFAULT_STALE_AFTER = 300       # секунд без отметки воркера
+DEFAULT_RETENTION_DAYS = 7      # завершенные задачи и их файлы
+PROGRESS_INTERVAL = 0.5         # секунд между записями хода работы в БД
+PURGE_INTERVAL = 3600
+FINAL_WRITE_ATTEMPTS = 5        # итог задачи пишется, даже если база долго занята другой записью
+
+HANDLERS = {}
+
+
+class JobCancelled(Exception):
+    """Пользователь отменил задачу: она завершается без повторов"""
+
+
+def handler(kind, max_attempts=3):
+    """Регистрирует обработчик задач вида kind: func(context) -> JSON-совместимый результат"""
+    def register(func):
+        func.max_attempts = max_attempts
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def files_dir():
+    path = Path(getattr(settings, 'JOB_FILES_DIR', settings.BASE_DIR / 'job_files'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def file_path(name):
+    # Только имя внутри каталога задач - без путей из payload
+    return files_dir() / Path(name).name
+
+
+def save_upload(uploaded):
+    """Сохраняет загруженный файл в каталог задач; возвращает его имя"""
+    name = f'upload-{uuid.uuid4().hex}{Path(uploaded.name).suffix.lower()}'
+    with open(file_path(name), 'wb') as fileobj:
+        for chunk in uploaded.chunks():
+            fileobj.write(chunk)
+    return name
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# Постановка и отмена
+
+def enqueue(kind, payload=None, max_attempts=None):
+    if kind not in HANDLERS:
+        raise ValueError(f'Неизвестный вид задачи: {kind}')
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        max_attempts=max_attempts or HANDLERS[kind].max_attempts,
+    )
+
+
+def cancel(job):
+    """Задача в очереди отменяется сразу, выполняемая - на ближайшей записи хода работы"""
+    if Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+        status=Job.CANCELLED, cancel_requested=True, finished_at=timezone.now(),
+    ):
+        remove_files(job.payload)
+        return True
+    return bool(Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(cancel_requested=True))
+
+
+def remove_files(payload):
+    for name in payload.get('cleanup', ()):
+        try:
+            file_path(name).unlink()
+        except FileNotFoundError:
+            pass
+
+
+# Выполнение
+
+class JobContext:
+    def __init__(self, job):
+        self.job = job
+        self.payload = job.payload
+        self._written = None
+
+    def progress(self, done, total=None, message=None, force=False):
+        """Записывает ход работы (не чаще PROGRESS_INTERVAL) и поднимает JobCancelled, если запрошена отмена"""
+        now = time.monotonic()
+        if not force and self._written is not None and now - self._written < PROGRESS_INTERVAL:
+            return
+        self._written = now
+        changes = {'progress': done, 'heartbeat_at': timezone.now()}
+        if total is not None:
+            changes['total'] = total
+        if message is not None:
+            changes['message'] = message[:255]
+        # Одна запись и проверка отмены: при запрошенной отмене строка не обновится
+        try:
+            updated = Job.objects.filter(pk=self.job.pk, cancel_requested=False).update(**changes)
+        except OperationalError:
+            # База занята долгой записью другой задачи - ход работы обновится в следующий раз
+            logger.warning('Задача %s: ход работы не записан, база занята', self.job.pk)
+            return
+        if not updated:
+            raise JobCancelled()
+
+
+def _final_update(queryset, **changes):
+    for attempt in range(FINAL_WRITE_ATTEMPTS):
+        try:
+            return queryset.update(**changes)
+        except OperationalError:
+            if attempt == FINAL_WRITE_ATTEMPTS - 1:
+                raise
+            time.sleep(1)
+
+
+def finish(job, status, result=None, error=''):
+    _final_update(
+        Job.objects.filter(pk=job.pk),
+        status=status, result=result, error=error, finished_at=timezone.now(), heartbeat_at=None,
+    )
+    remove_files(job.payload)
+
+
+def fail(job, error):
+    if job.attempts < job.max_attempts:
+        delay = _setting('JOB_RETRY_DELAY', DEFAULT_RETRY_DELAY) * 2 ** (job.attempts - 1)
+        retried = _final_update(
+            Job.objects.filter(pk=job.pk, status=Job.RUNNING, cancel_requested=False),
+            status=Job.QUEUED, error=error, worker='', heartbeat_at=None,
+            run_after=timezone.now() + datetime.timedelta(seconds=delay),
+        )
+        if retried:
+            return
+    finish(job, Job.FAILED, error=error)
+
+
+def execute(job_id):
+    """Выполняет задачу, уже взятую воркером (claim), и записывает итог"""
+    job = Job.objects.get(pk=job_id)
+    try:
+        result = HANDLERS[job.kind](JobContext(job))
+    except JobCancelled:
+        finish(job, Job.CANCELLED)
+    except Exception:
+        logger.exception('Задача %s (%s), попытка %s', job.pk, job.kind, job.attempts)
+        fail(job, traceback.format_exc())
+    else:
+        finish(job, Job.SUCCEEDED, result=result)
+
+
+def claim(worker, limit=1):
+    """Id задач, взятых воркером; условный UPDATE - задачу получит только один воркер"""
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status=Job.QUEUED, run_after__lte=now)
+        .order_by('run_after', 'id').values_list('pk', flat=True)[:limit]
+    )
+    return [
+        pk for pk in candidates
+        if Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, worker=worker, attempts=F('attempts') + 1, started_at=now, heartbeat_at=now,
+        )
+    ]
+
+
+def run_pending(worker='inline', limit=None):
+    """Выполняет готовые задачи по одной в текущем потоке; возвращает их число"""
+    count = 0
+    while limit is None or count < limit:
+        claimed = claim(worker)
+        if not claimed:
+            break
+        execute(claimed[0])
+        count += 1
+    return count
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи воркеров, переставших обновлять отметку; исчерпавшие попытки - ошибка"""
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        heartbeat_at__lt=timezone.now() - datetime.timedelta(seconds=_setting('JOB_STALE_AFTER', DEFAULT_STALE_AFTER)),
+    )
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, error='Воркер остановился во время выполнения', finished_at=timezone.now(),
+    )
+    return failed + stale.update(status=Job.QUEUED, worker='', heartbeat_at=None)
+
+
+def purge_finished(days=None):
+    """Удаляет завершенные задачи старше days дней вместе с их файлами"""
+    days = days if days is not None else _setting('JOB_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    old = Job.objects.filter(status__in=Job.FINISHED, finished_at__lt=timezone.now() - datetime.timedelta(days=days))
+    results = set()
+    for payload, result in old.values_list('payload', 'result'):
+        remove_files(payload)
+        if result and result.get('file'):
+            results.add(result['file'])
+    deleted = old.delete()[0]
+    # Один файл может быть результатом нескольких задач (кэш отчетов по версии данных):
+    # он удаляется, только когда на него не ссылается ни одна оставшаяся задача
+    if results:
+        results -= set(Job.objects.filter(result__file__in=results).values_list('result__file', flat=True))
+        remove_files({'cleanup': sorted(results)})
+    return deleted
+
+
+def _run_in_pool(job_id):
+    # Соединения потоков пула живут между задачами - закрываются по CONN_MAX_AGE
+    close_old_connections()
+    try:
+        execute(job_id)
+    finally:
+        close_old_connections()
+
+
+class Worker:
+    def __init__(self, concurrency=2, processes=False, poll_interval=1.0, name=None, log=None):
+        self.concurrency = concurrency
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.log = log or (lambda message: None)
+        self.stop_event = threading.Event()
+
+    def executor(self):
+        if self.processes:
+            # spawn: дочерний процесс открывает свои соединения с БД, а не наследует открытые.
+            # Инициализатор - сам django.setup: этот модуль нельзя импортировать до загрузки приложений
+            return ProcessPoolExecutor(
+                self.concurrency, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+            )
+        return ThreadPoolExecutor(self.concurrency, thread_name_prefix='job')
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self, once=False):
+        """Обрабатывает очередь до stop(); once - только пока в ней есть готовые задачи"""
+        executor = self.executor()
+        running = {}
+        purged_at = None
+        try:
+            while not self.stop_event.is_set():
+                now = time.monotonic()
+                if purged_at is None or now - purged_at > PURGE_INTERVAL:
+                    purge_finished()
+                    purged_at = now
+                requeue_stale()
+                free = self.concurrency - len(running)
+                for job_id in claim(self.name, free) if free else ():
+                    self.log(f'Задача {job_id} запущена')
+                    running[executor.submit(_run_in_pool, job_id)] = job_id
+                if not running:
+                    if once:
+                        break
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+                try:
+                    Job.objects.filter(pk__in=running.values(), status=Job.RUNNING).update(heartbeat_at=timezone.now())
+                except OperationalError:
+                    logger.warning('Отметка воркера не записана, база занята')
+                done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        future.result()
+                    except BrokenProcessPool:
+                        # Дочерний процесс упал, пул непригоден: его задачи вернутся в очередь по отметке воркера
+                        logger.error('Пул процессов аварийно завершился, задачи: %s', [job_id, *running.values()])
+                        executor.shutdown(wait=False)
+                        executor = self.executor()
+                        running.clear()
+                        break
+                    self.log(f'Задача {job_id} завершена')
+        finally:
+            executor.shutdown(wait=True)
+
+
+# Обработчики
+
+@handler('import', max_attempts=1)
+def import_job(context):
+    # Без повторов: порции выписки фиксируются по мере загрузки, повтор задублировал бы строки
+    payload = context.payload
+
+    def progress(result):
+        context.progress(result.processed, message=f'Добавлено: {result.created}, ошибок: {result.error_count}')
+
+    with open(file_path(payload['file']), 'rb') as fileobj:
+        result = import_file(fileobj, payload['name'], delimiter=payload.get('delimiter'), progress=progress)
+    return result.as_dict()
+
+
+@handler('export')
+@read_only_view
+def export_job(context):
+    # Чтение - через соединение на чтение, как у потоковой выгрузки: в SQLite (WAL) запись хода
+    # работы на соединении с открытым курсором чтения упала бы, если база изменилась после его начала
+    export_format = context.payload.get('format', 'csv')
+    if export_format not in FORMATS:
+        export_format = 'csv'
+    content_type, extension = FORMATS[export_format]
+    filterset = TransactionFilterSet(QueryDict(context.payload.get('query', '')))
+    transactions = filterset.filter(Transaction.objects.all())
+    total = transactions.count()
+    context.progress(0, total, 'Выгрузка', force=True)
+
+    exporter = TransactionExporter(transactions)
+    name = f'export-{context.job.pk}.{extension}'
+    path = file_path(name)
+    try:
+        with open(path, 'w', encoding='utf-8', newline='') as fileobj:
+            for chunk in exporter.stream(export_format):
+                fileobj.write(chunk)
+                context.progress(exporter.exported, total)
+            context.progress(exporter.exported, total, force=True)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return {
+        'file': name,
+        'filename': f'transactions.{extension}',
+        'content_type': content_type,
+        'rows': exporter.exported,
+    }
+
+
+@handler('rebuild_rollups')
+def rebuild_rollups_job(context):
+    context.progress(0, message='Пересчет сводок и счетчиков', force=True)
+    return {'buckets': rebuild_rollups(context.payload.get('database', DEFAULT_DB_ALIAS))}
@@ -0,0 +1,91 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+DEFAULT_URLS = ('/', '/ajax/load-categories/?type_id=1', '/api/v1/stats/')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность обработчиков WSGI (пул потоков) '
+        'и ASGI (asyncio) под параллельной нагрузкой, без сетевого сервера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на каждый режим')
+        parser.add_argument('--concurrency', type=int, default=16, help='Одновременных клиентов')
+        parser.add_argument(
+            '--url', action='append', dest='urls',
+            help='Адрес для нагрузки (можно указать несколько раз)',
+        )
+
+    def handle(self, *args, **options):
+        urls = options['urls'] or DEFAULT_URLS
+        total = options['requests']
+        concurrency = options['concurrency']
+        plan = [urls[index % len(urls)] for index in range(total)]
+
+        # Тестовые клиенты обращаются к хосту testserver
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            self.compare(plan, urls, concurrency)
+
+    def compare(self, plan, urls, concurrency):
+        self.stdout.write(f'Запросов: {len(plan)}, одновременно: {concurrency}, адреса: {", ".join(urls)}')
+        for mode, runner in (('WSGI', self.run_wsgi), ('ASGI', self.run_asgi)):
+            # Прогрев: кэш справочников, шаблоны, соединения
+            runner(urls, min(concurrency, len(urls)))
+            started = time.perf_counter()
+            latencies, errors = runner(plan, concurrency)
+            elapsed = time.perf_counter() - started
+            self.report(mode, latencies, errors, elapsed)
+
+    def report(self, mode, latencies, errors, elapsed):
+        latencies = sorted(latencies)
+        p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)] if latencies else 0
+        self.stdout.write(
+            f'{mode}: {len(latencies) / elapsed:.1f} запр/с, '
+            f'p50 {statistics.median(latencies) * 1000:.1f} мс, p95 {p95 * 1000:.1f} мс, '
+            f'ошибок: {errors}'
+        )
+
+    def run_wsgi(self, plan, concurrency):
+        def worker(urls):
+            client = Client()
+            latencies, errors = [], 0
+            try:
+                for url in urls:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    latencies.append(time.perf_counter() - started)
+                    errors += response.status_code != 200
+            finally:
+                connections.close_all()
+            return latencies, errors
+
+        shares = [plan[index::concurrency] for index in range(concurrency)]
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(worker, shares))
+        return [value for latencies, _ in results for value in latencies], sum(e for _, e in results)
+
+    def run_asgi(self, plan, concurrency):
+        async def main():
+            client = AsyncClient()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def fetch(url):
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.get(url)
+                    return time.perf_counter() - started, response.status_code != 200
+
+            return await asyncio.gather(*(fetch(url) for url in plan))
+
+        results = asyncio.run(main())
+        return [latency for latency, _ in results], sum(error for _, error in results)
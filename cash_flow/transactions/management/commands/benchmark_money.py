@@ -0,0 +1,116 @@
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Context, Decimal
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from transactions.money import from_kopecks
+
+# Как хранит суммы DecimalField в SQLite (тип decimal, NUMERIC) и как MoneyField (BIGINT копеек)
+STORAGES = (
+    ('decimal (REAL)', 'decimal', lambda kopecks: f'{kopecks // 100}.{kopecks % 100:02d}'),
+    ('копейки (BIGINT)', 'bigint', lambda kopecks: kopecks),
+)
+
+QUERIES = (
+    ('сумма за все время', 'SELECT SUM(amount) FROM amounts'),
+    ('суммы по типам', 'SELECT type_id, SUM(amount) FROM amounts GROUP BY type_id'),
+    (
+        'суммы по месяцам и типам',
+        "SELECT strftime('%Y-%m', created_date), type_id, SUM(amount) FROM amounts GROUP BY 1, 2",
+    ),
+    # Построчное чтение (выгрузка, колоночная копия): преобразование каждой суммы в Decimal
+    ('чтение 1 млн сумм', 'SELECT id, amount FROM amounts LIMIT 1000000'),
+)
+
+KOPECK = Decimal('0.01')
+
+
+def decimal_converter():
+    """Преобразование, которое Django делает для DecimalField в SQLite: float - Decimal"""
+    create_decimal = Context(prec=17).create_decimal_from_float
+    return lambda value: create_decimal(value).quantize(KOPECK) if value is not None else None
+
+
+class Command(BaseCommand):
+    help = (
+        'Агрегаты по суммам в SQLite: хранение DecimalField (REAL) против целых копеек (MoneyField) - '
+        'время SUM/GROUP BY с преобразованием в Decimal и расхождение с точной суммой'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000, help='Строк в каждой таблице')
+        parser.add_argument('--repeat', type=int, default=3, help='Повторов каждого запроса (берется лучший)')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Строк: {options["rows"]}, повторов: {options["repeat"]}')
+        with tempfile.TemporaryDirectory() as directory:
+            results = {}
+            exact = None
+            for index, (name, column_type, encode) in enumerate(STORAGES):
+                path = Path(directory) / f'money_{index}.sqlite3'
+                started = time.perf_counter()
+                total = self.prepare(path, column_type, encode, options)
+                self.stdout.write(f'{name}: база заполнена за {time.perf_counter() - started:.1f} с')
+                exact = from_kopecks(total)
+                convert = decimal_converter() if column_type == 'decimal' else from_kopecks
+                results[name] = self.measure(path, convert, options['repeat'])
+
+            self.stdout.write(f'Точная сумма: {exact}')
+            for query_name, _ in QUERIES:
+                self.stdout.write(f'{query_name}:')
+                for name, _, _ in STORAGES:
+                    elapsed, rows = results[name][query_name]
+                    line = f'  {name}: {elapsed * 1000:.1f} мс'
+                    if query_name == QUERIES[0][0]:
+                        line += f', сумма {rows[0][-1]}, расхождение {rows[0][-1] - exact}'
+                    self.stdout.write(line)
+
+    def prepare(self, path, column_type, encode, options):
+        """Таблица amounts с одинаковыми данными для каждого варианта; возвращает точную сумму в копейках"""
+        conn = sqlite3.connect(path, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode = OFF')
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute(
+                f'CREATE TABLE amounts (id integer PRIMARY KEY, created_date date NOT NULL, '
+                f'type_id integer NOT NULL, amount {column_type} NOT NULL)'
+            )
+            rng = random.Random(options['seed'])
+            start = date(2020, 1, 1)
+            total = 0
+            conn.execute('BEGIN')
+            batch = []
+            for index in range(options['rows']):
+                kopecks = rng.randrange(1, 10_000_000)
+                total += kopecks
+                batch.append(((start + timedelta(days=index % 1800)).isoformat(), index % 2 + 1, encode(kopecks)))
+                if len(batch) == 100_000:
+                    conn.executemany('INSERT INTO amounts (created_date, type_id, amount) VALUES (?, ?, ?)', batch)
+                    batch = []
+            conn.executemany('INSERT INTO amounts (created_date, type_id, amount) VALUES (?, ?, ?)', batch)
+            conn.execute('COMMIT')
+            return total
+        finally:
+            conn.close()
+
+    def measure(self, path, convert, repeat):
+        conn = sqlite3.connect(path)
+        try:
+            results = {}
+            for query_name, sql in QUERIES:
+                best = None
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    rows = [(*row[:-1], convert(row[-1])) for row in conn.execute(sql)]
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                results[query_name] = (best, rows)
+            return results
+        finally:
+            conn.close()
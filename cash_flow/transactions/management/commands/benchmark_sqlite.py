@@ -0,0 +1,224 @@
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from transactions.backends.sqlite3.base import apply_pragmas
+
+# Настройки SQLite по умолчанию (как у django.db.backends.sqlite3) и рабочий профиль
+STOCK_PROFILE = {'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'}, 'transaction_mode': 'DEFERRED'}
+
+WRITE_STATEMENTS = (
+    # То же, что делают сохранение транзакции и Deltas.apply: чтение версии, запись строки,
+    # UPSERT корзины, новая версия данных и запись в ленте изменений
+    ('SELECT value FROM transactions_dataversion WHERE name = ?', lambda row: ('data',)),
+    (
+        'INSERT INTO transactions_transaction '
+        '(created_date, amount, comment, status_id, type_id, category_id, subcategory_id) '
+        'VALUES (?, ?, ?, 1, 1, 1, 1)',
+        lambda row: (row[0], row[1], 'benchmark'),
+    ),
+    (
+        'INSERT INTO transactions_dailyrollup '
+        '(created_date, status_id, type_id, category_id, subcategory_id, amount, count) '
+        'VALUES (?, 1, 1, 1, 1, ?, 1) '
+        'ON CONFLICT (created_date, status_id, type_id, category_id, subcategory_id) '
+        'DO UPDATE SET amount = amount + excluded.amount, count = count + 1',
+        lambda row: row,
+    ),
+    (
+        "INSERT INTO transactions_dataversion (name, value) VALUES ('data', 1) "
+        'ON CONFLICT (name) DO UPDATE SET value = value + 1',
+        lambda row: (),
+    ),
+    (
+        'INSERT INTO transactions_bucketchange '
+        '(version, created_date, status_id, type_id, category_id, subcategory_id) '
+        "VALUES ((SELECT value FROM transactions_dataversion WHERE name = 'data'), ?, 1, 1, 1, 1)",
+        lambda row: (row[0],),
+    ),
+)
+
+READ_STATEMENTS = (
+    # Первая страница списка и сводка по периоду из DailyRollup
+    (
+        'SELECT id, created_date, amount, status_id, type_id, category_id, subcategory_id, comment '
+        'FROM transactions_transaction ORDER BY created_date DESC, id DESC LIMIT 50',
+        (),
+    ),
+    (
+        'SELECT COUNT(*), SUM(count), SUM(amount) FROM transactions_dailyrollup WHERE created_date >= ?',
+        ((date.today() - timedelta(days=30)).isoformat(),),
+    ),
+)
+
+
+def is_locked(error):
+    message = str(error)
+    return 'locked' in message or 'busy' in message
+
+
+class Command(BaseCommand):
+    help = (
+        'Параллельные чтение и запись в копии схемы SQLite: настройки по умолчанию '
+        'против профиля из settings.DATABASES (WAL, PRAGMA, BEGIN IMMEDIATE)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Потоков чтения')
+        parser.add_argument('--writers', type=int, default=4, help='Потоков записи')
+        parser.add_argument('--duration', type=float, default=5.0, help='Секунд на каждый профиль')
+        parser.add_argument('--rows', type=int, default=20000, help='Транзакций в базе перед замером')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Замер имеет смысл только для SQLite')
+        options_dict = settings.DATABASES['default'].get('OPTIONS', {})
+        tuned = {
+            'pragmas': options_dict.get('pragmas') or {},
+            'transaction_mode': options_dict.get('transaction_mode') or 'DEFERRED',
+        }
+        schema = self.schema()
+
+        self.stdout.write(
+            f'Читателей: {options["readers"]}, писателей: {options["writers"]}, '
+            f'{options["duration"]} с на профиль, строк: {options["rows"]}'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for index, (name, profile) in enumerate((('по умолчанию', STOCK_PROFILE), ('рабочий', tuned))):
+                path = Path(directory) / f'benchmark_{index}.sqlite3'
+                self.prepare(path, schema, options['rows'])
+                self.report(name, profile, self.run(path, profile, options))
+
+    def schema(self):
+        """Таблицы и индексы приложения из основной базы (она должна быть смигрирована)"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT sql FROM sqlite_master WHERE tbl_name LIKE 'transactions\\_%' ESCAPE '\\' "
+                "AND type IN ('table', 'index') AND sql IS NOT NULL "
+                # Поисковый индекс FTS5 (виртуальная и служебные таблицы) в замере не участвует
+                "AND tbl_name NOT LIKE '%\\_fts%' ESCAPE '\\' "
+                "ORDER BY type = 'index'"
+            )
+            statements = [row[0] for row in cursor.fetchall()]
+        if not statements:
+            raise CommandError('Нет таблиц приложения: выполните migrate')
+        return statements
+
+    def prepare(self, path, schema, rows):
+        conn = sqlite3.connect(path, isolation_level=None)
+        try:
+            conn.execute('BEGIN')
+            for statement in schema:
+                conn.execute(statement)
+            start = date.today() - timedelta(days=365)
+            conn.executemany(
+                'INSERT INTO transactions_transaction '
+                '(created_date, amount, comment, status_id, type_id, category_id, subcategory_id) '
+                'VALUES (?, ?, NULL, 1, 1, 1, 1)',
+                (
+                    # Суммы - в копейках, как их хранит MoneyField
+                    ((start + timedelta(days=index % 365)).isoformat(), index % 1000 * 100)
+                    for index in range(rows)
+                ),
+            )
+            conn.execute(
+                'INSERT INTO transactions_dailyrollup '
+                '(created_date, status_id, type_id, category_id, subcategory_id, amount, count) '
+                'SELECT created_date, 1, 1, 1, 1, SUM(amount), COUNT(*) '
+                'FROM transactions_transaction GROUP BY created_date'
+            )
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def run(self, path, profile, options):
+        stop = threading.Event()
+        results = {'read': [], 'write': [], 'locked': 0}
+        lock = threading.Lock()
+
+        def connect():
+            conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            apply_pragmas(conn, profile['pragmas'])
+            return conn
+
+        def reader():
+            conn = connect()
+            latencies, locked = [], 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    for sql, params in READ_STATEMENTS:
+                        conn.execute(sql, params).fetchall()
+                except sqlite3.OperationalError as error:
+                    if not is_locked(error):
+                        raise
+                    locked += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+            conn.close()
+            with lock:
+                results['read'].extend(latencies)
+                results['locked'] += locked
+
+        def writer(seed):
+            conn = connect()
+            rng = random.Random(seed)
+            latencies, locked = [], 0
+            while not stop.is_set():
+                row = ((date.today() - timedelta(days=rng.randrange(60))).isoformat(), rng.randrange(1, 5000) * 100)
+                started = time.perf_counter()
+                try:
+                    conn.execute(f'BEGIN {profile["transaction_mode"]}')
+                    for sql, params in WRITE_STATEMENTS:
+                        conn.execute(sql, params(row)).fetchall()
+                    conn.execute('COMMIT')
+                except sqlite3.OperationalError as error:
+                    if not is_locked(error):
+                        raise
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    locked += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+            conn.close()
+            with lock:
+                results['write'].extend(latencies)
+                results['locked'] += locked
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(index,)) for index in range(options['writers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        results['elapsed'] = time.perf_counter() - started
+        return results
+
+    def report(self, name, profile, results):
+        def summary(latencies):
+            if not latencies:
+                return '0 оп/с'
+            latencies = sorted(latencies)
+            p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+            return (
+                f'{len(latencies) / results["elapsed"]:.0f} оп/с, '
+                f'p50 {statistics.median(latencies) * 1000:.2f} мс, p95 {p95 * 1000:.2f} мс'
+            )
+
+        journal = profile['pragmas'].get('journal_mode', 'DELETE')
+        self.stdout.write(f'Профиль "{name}" ({journal}, BEGIN {profile["transaction_mode"]}):')
+        self.stdout.write(f'  чтение: {summary(results["read"])}')
+        self.stdout.write(f'  запись: {summary(results["write"])}')
+        self.stdout.write(f'  ошибок "database is locked": {results["locked"]}')
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from transactions.benchmarks import BenchmarkRunner, compare, default_scenarios, load_baseline, save_baseline
+from transactions.models import Transaction
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет основные страницы через тестовый клиент: перцентили времени, число SQL-запросов '
+        'и пик памяти; сравнивает с базовой линией и завершается ошибкой при регрессии'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Замеров на сценарий')
+        parser.add_argument('--warmup', type=int, default=2, help='Прогревочных запросов на сценарий')
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            help='Только указанные сценарии (можно несколько раз)',
+        )
+        parser.add_argument('--baseline', help='JSON с базовой линией для сравнения')
+        parser.add_argument('--save-baseline', help='Сохранить результаты как базовую линию в JSON')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Допустимый рост времени и памяти относительно базовой линии (доля)',
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = load_baseline(options['baseline'])
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Не удалось прочитать базовую линию: {error}')
+
+        rows = Transaction.objects.count()
+        scenarios = default_scenarios()
+        if options['scenarios']:
+            unknown = set(options['scenarios']) - {scenario.name for scenario in scenarios}
+            if unknown:
+                raise CommandError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+            scenarios = [scenario for scenario in scenarios if scenario.name in options['scenarios']]
+
+        self.stdout.write(f'Транзакций: {rows}, замеров на сценарий: {options["iterations"]}')
+        runner = BenchmarkRunner(options['iterations'], options['warmup'])
+        results = []
+        # Тестовый клиент обращается к хосту testserver
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for scenario in scenarios:
+                result = runner.run(scenario)
+                results.append(result)
+                self.stdout.write(
+                    f'{result.name}: p50 {result.p50_ms} мс, p95 {result.p95_ms} мс, p99 {result.p99_ms} мс, '
+                    f'SQL {result.queries}, память {result.peak_kb} КБ'
+                    + (f', ошибок {result.errors}' if result.errors else '')
+                )
+
+        if options['save_baseline']:
+            save_baseline(options['save_baseline'], results, rows)
+            self.stdout.write(f'Базовая линия сохранена в {options["save_baseline"]}')
+
+        if baseline is not None:
+            if baseline.get('rows') and abs(rows - baseline['rows']) > baseline['rows'] * 0.1:
+                self.stderr.write(
+                    f'Внимание: в базовой линии {baseline["rows"]} транзакций, сейчас {rows} - сравнение неточно'
+                )
+            regressions = compare(results, baseline.get('scenarios', {}), options['tolerance'])
+            for line in regressions:
+                self.stderr.write(line)
+            if regressions:
+                raise CommandError(f'Регрессий: {len(regressions)}')
+            self.stdout.write(self.style.SUCCESS('Регрессий относительно базовой линии нет'))
@@ -0,0 +1,59 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.synthetic import TransactionGenerator
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими транзакциями по существующим справочникам (для замеров)'
+
+    def add_arguments(self, parser):
+        today = datetime.date.today()
+        parser.add_argument('--count', type=int, default=1_000_000, help='Сколько транзакций создать')
+        parser.add_argument(
+            '--start', type=datetime.date.fromisoformat, default=today - datetime.timedelta(days=3 * 365),
+            help='Первая дата (ГГГГ-ММ-ДД), по умолчанию три года назад',
+        )
+        parser.add_argument(
+            '--end', type=datetime.date.fromisoformat, default=today,
+            help='Последняя дата (ГГГГ-ММ-ДД), по умолчанию сегодня',
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель Ципфа для популярности подкатегорий и статусов (0 - равномерно)',
+        )
+        parser.add_argument(
+            '--recent-bias', type=float, default=1.0,
+            help='Смещение дат к концу периода (0 - равномерно)',
+        )
+        parser.add_argument('--comments', type=float, default=0.3, help='Доля строк с комментарием')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Строк в одном пакете')
+        parser.add_argument('--seed', type=int, help='Для воспроизводимых данных')
+
+    def handle(self, *args, **options):
+        try:
+            generator = TransactionGenerator(
+                options['start'], options['end'],
+                skew=options['skew'],
+                recent_bias=options['recent_bias'],
+                comment_ratio=options['comments'],
+                seed=options['seed'],
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        verbosity = options['verbosity']
+        step = max(options['count'] // 20, options['batch_size'])
+        reported = [0]
+
+        def progress(result):
+            if verbosity > 1 and result.created - reported[0] >= step:
+                reported[0] = result.created
+                self.stdout.write(f'  {result.created} строк, {result.rows_per_second:.0f} строк/с')
+
+        result = generator.generate(options['count'], options['batch_size'], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано транзакций: {result.created} за {result.elapsed:.1f} с '
+            f'({result.rows_per_second:.0f} строк/с)'
+        ))
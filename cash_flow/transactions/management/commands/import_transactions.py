@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.importers import ImportFileError, import_file
+
+
+class Command(BaseCommand):
+    help = 'Потоковый импорт транзакций из банковской выписки (CSV или XLSX)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу .csv или .xlsx')
+        parser.add_argument('--delimiter', help='Разделитель CSV (по умолчанию определяется сам)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Строк в одном INSERT')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Строк в одной транзакции БД')
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить строки')
+
+    def handle(self, *args, **options):
+        verbosity = options['verbosity']
+
+        def progress(result):
+            if verbosity > 1:
+                self.stdout.write(
+                    f'  {result.processed} строк, {result.rows_per_second:.0f} строк/с'
+                )
+
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                result = import_file(
+                    fileobj, options['path'],
+                    delimiter=options['delimiter'],
+                    batch_size=options['batch_size'],
+                    chunk_size=options['chunk_size'],
+                    dry_run=options['dry_run'],
+                    progress=progress,
+                )
+        except (OSError, ImportFileError) as error:
+            raise CommandError(str(error))
+
+        for line, message in result.errors[:50]:
+            self.stderr.write(f'Строка {line}: {message}')
+        if result.error_count > 50:
+            self.stderr.write(f'... и еще {result.error_count - 50} ошибок')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {result.processed}, добавлено: {result.created}, '
+            f'ошибок: {result.error_count}. '
+            f'Время: {result.elapsed:.2f} с ({result.rows_per_second:.0f} строк/с)'
+        ))
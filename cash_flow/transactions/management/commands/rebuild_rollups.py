@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.bookkeeping import rebuild_rollups, verify_rollups, verify_usage
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневные сводки (DailyRollup) и счетчики использования справочников по исходным транзакциям'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только сравнить сводку с исходными данными, ничего не меняя',
+        )
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if options['verify']:
+            mismatches = verify_rollups(using)
+            for bucket, expected, actual in mismatches[:20]:
+                self.stdout.write(f'{bucket}: ожидалось {expected}, в сводке {actual}')
+            if mismatches:
+                raise CommandError(f'Сводка расходится с данными в {len(mismatches)} корзинах')
+            usage = verify_usage(using)
+            for model_name, pk, expected, actual in usage[:20]:
+                self.stdout.write(f'{model_name} {pk}: ожидалось {expected}, в счетчике {actual}')
+            if usage:
+                raise CommandError(f'Счетчики использования расходятся с данными у {len(usage)} записей')
+            self.stdout.write(self.style.SUCCESS('Сводка и счетчики совпадают с исходными данными'))
+            return
+
+        created = rebuild_rollups(using)
+        self.stdout.write(self.style.SUCCESS(f'Сводка и счетчики пересчитаны: {created} корзин'))
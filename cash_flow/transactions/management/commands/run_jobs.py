@@ -0,0 +1,38 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from transactions.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = 'Воркер фоновых задач (импорт, выгрузка, пересчет сводок): очередь в таблице Job той же базы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help='Задач одновременно')
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Пул процессов вместо потоков (для задач, занятых вычислениями в Python)',
+        )
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Секунд между опросами очереди')
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и выйти')
+        parser.add_argument('--name', help='Имя воркера в задачах (по умолчанию хост:pid)')
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        worker = Worker(
+            concurrency=options['concurrency'],
+            processes=options['processes'],
+            poll_interval=options['poll_interval'],
+            name=options['name'],
+            log=log,
+        )
+        # SIGTERM - дождаться выполняемых задач и выйти
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+        self.stdout.write(f'Воркер {worker.name}: {options["concurrency"]} '
+                          f'{"процессов" if options["processes"] else "потоков"}')
+        try:
+            worker.run(once=options['once'])
+        except KeyboardInterrupt:
+            worker.stop()
+        self.stdout.write(self.style.SUCCESS('Воркер остановлен'))
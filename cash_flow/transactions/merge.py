@@ -0,0 +1,86 @@
+"""
+Слияние дублей в справочниках: запись A заменяется записью B и удаляется.
+
+Транзакции переносятся обновлением TransactionQuerySet.update, поэтому сводки,
+снимки остатков и счетчики usage_count остаются согласованными (bookkeeping).
+Для статуса и подкатегории это один UPDATE. Дочерние записи категории или типа
+переносятся под B; одноименные с уже имеющимися у B сливаются с ними.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction as db_transaction
+
+from .models import Category, Status, Subcategory, Transaction, Type
+
+MODELS = {
+    'status': Status,
+    'type': Type,
+    'category': Category,
+    'subcategory': Subcategory,
+}
+
+
+def _merge_status(source, target):
+    return Transaction.objects.filter(status=source).update(status=target)
+
+
+def _merge_subcategory(source, target):
+    category = target.category
+    return Transaction.objects.filter(subcategory=source).update(
+        subcategory=target, category=category, type=category.type_id,
+    )
+
+
+def _merge_category(source, target):
+    moved = 0
+    twins = {sub.name: sub for sub in Subcategory.objects.filter(category=target)}
+    for sub in Subcategory.objects.filter(category=source, name__in=twins):
+        moved += _merge_subcategory(sub, twins[sub.name])
+        sub.delete()
+    Subcategory.objects.filter(category=source).update(category=target)
+    moved += Transaction.objects.filter(category=source).update(category=target, type=target.type_id)
+    return moved
+
+
+def _merge_type(source, target):
+    moved = 0
+    twins = {category.name: category for category in Category.objects.filter(type=target)}
+    for category in Category.objects.filter(type=source, name__in=twins):
+        moved += _merge_category(category, twins[category.name])
+        category.delete()
+    Category.objects.filter(type=source).update(type=target)
+    moved += Transaction.objects.filter(type=source).update(type=target)
+    return moved
+
+
+MERGERS = {
+    'status': _merge_status,
+    'type': _merge_type,
+    'category': _merge_category,
+    'subcategory': _merge_subcategory,
+}
+
+
+def merge(model_type, source_id, target_id):
+    """
+    Сливает запись source_id в target_id и удаляет source_id.
+    Возвращает (target, число перенесенных транзакций).
+    """
+    model = MODELS.get(model_type)
+    if model is None:
+        raise ValidationError('Неверный тип справочника')
+    try:
+        source_id, target_id = int(source_id), int(target_id)
+    except (TypeError, ValueError):
+        raise ValidationError('Выберите, что и с чем объединить')
+    if source_id == target_id:
+        raise ValidationError('Нельзя объединить запись саму с собой')
+    with db_transaction.atomic():
+        # Блокировка на запись (IMMEDIATE) берется до чтения: справочник не изменится до commit
+        items = model.objects.select_for_update().in_bulk([source_id, target_id])
+        if len(items) != 2:
+            raise ValidationError('Запись справочника не найдена')
+        source, target = items[source_id], items[target_id]
+        moved = MERGERS[model_type](source, target)
+        # Удаление вызывает сигнал справочников: кэш иерархии и снимки сбрасываются
+        source.delete()
+    return target, moved
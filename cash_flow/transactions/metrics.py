@@ -0,0 +1,276 @@
+"""
+Метрики запросов в памяти процесса и их вывод в текстовом формате Prometheus.
+
+RequestMetricsMiddleware открывает для запроса объект RequestStats
+(в contextvar - виден и в потоках sync_to_async асинхронных представлений).
+В него пишут:
+- обертка execute_wrapper, поставленная на каждое подключение к БД при создании
+  (вне запроса она только вызывает исходный execute);
+- обертка над render шаблонного движка Django (только шаблоны верхнего уровня -
+  вложенные include входят в их время).
+По завершении запроса итоги добавляются в гистограммы и счетчики по имени
+URL (resolver_match.view_name). Запись - несколько сложений под общей блокировкой.
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+
+PREFIX = 'cashflow'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+UNMATCHED = 'unmatched'
+
+
+class RequestStats:
+    __slots__ = ('request', 'queries', 'db_time', 'template_time')
+
+    def __init__(self, request=None):
+        self.request = request
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+_current = ContextVar('request_stats', default=None)
+
+
+class Histogram:
+    """Накопительная гистограмма Prometheus: счетчики по верхним границам, сумма и количество"""
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            yield bound, total
+
+
+class ViewMetrics:
+    __slots__ = ('latency', 'queries', 'size', 'db_time', 'template_time')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._responses = {}
+
+    def observe(self, view, method, status, elapsed, stats, size=None):
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                metrics = self._views[view] = ViewMetrics()
+            metrics.latency.observe(elapsed)
+            metrics.queries.observe(stats.queries)
+            metrics.db_time += stats.db_time
+            metrics.template_time += stats.template_time
+            if size is not None:
+                metrics.size.observe(size)
+            key = (view, method, str(status))
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._responses.clear()
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        with self._lock:
+            lines = []
+            self._render_counter(
+                lines, 'http_requests_total', 'Ответы по представлению, методу и коду',
+                ((dict(view=view, method=method, status=status), value)
+                 for (view, method, status), value in sorted(self._responses.items())),
+            )
+            views = sorted(self._views.items())
+            self._render_histogram(
+                lines, 'http_request_duration_seconds', 'Время ответа',
+                ((view, metrics.latency) for view, metrics in views),
+            )
+            self._render_histogram(
+                lines, 'db_queries_per_request', 'SQL-запросов на один ответ',
+                ((view, metrics.queries) for view, metrics in views),
+            )
+            self._render_counter(
+                lines, 'db_query_seconds_total', 'Суммарное время SQL-запросов',
+                ((dict(view=view), metrics.db_time) for view, metrics in views),
+            )
+            self._render_counter(
+                lines, 'template_render_seconds_total', 'Суммарное время отрисовки шаблонов',
+                ((dict(view=view), metrics.template_time) for view, metrics in views),
+            )
+            self._render_histogram(
+                lines, 'http_response_size_bytes', 'Размер тела ответа (без потоковых)',
+                ((view, metrics.size) for view, metrics in views if metrics.size.count),
+            )
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_counter(lines, name, help_text, samples):
+        lines.append(f'# HELP {PREFIX}_{name} {help_text}')
+        lines.append(f'# TYPE {PREFIX}_{name} counter')
+        for labels, value in samples:
+            lines.append(f'{PREFIX}_{name}{format_labels(labels)} {format_value(value)}')
+
+    @staticmethod
+    def _render_histogram(lines, name, help_text, histograms):
+        lines.append(f'# HELP {PREFIX}_{name} {help_text}')
+        lines.append(f'# TYPE {PREFIX}_{name} histogram')
+        for view, histogram in histograms:
+            for bound, total in histogram.cumulative():
+                labels = format_labels({'view': view, 'le': format_value(bound)})
+                lines.append(f'{PREFIX}_{name}_bucket{labels} {total}')
+            labels = format_labels({'view': view, 'le': '+Inf'})
+            lines.append(f'{PREFIX}_{name}_bucket{labels} {histogram.count}')
+            lines.append(f'{PREFIX}_{name}_sum{format_labels({"view": view})} {format_value(histogram.sum)}')
+            lines.append(f'{PREFIX}_{name}_count{format_labels({"view": view})} {histogram.count}')
+
+
+def format_labels(labels):
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels.items()
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+registry = MetricsRegistry()
+
+
+# Сбор данных
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - started
+        stats.queries += 1
+
+
+def instrument_connection(sender, connection, **kwargs):
+    # Сигнал приходит и при переподключении того же объекта - обертка ставится один раз
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def _timed_render(render):
+    def wrapper(self, *args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return render(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            stats.template_time += time.perf_counter() - started
+    wrapper.metrics_wrapped = True
+    return wrapper
+
+
+def install():
+    """Подключает сбор метрик к БД и шаблонам (из AppConfig.ready)"""
+    from django.db import connections
+    from django.template.backends.django import Template
+
+    connection_created.connect(instrument_connection, dispatch_uid='transactions_metrics')
+    # Подключения, открытые до ready (например, при проверках), тоже учитываются
+    for connection in connections.all(initialized_only=True):
+        instrument_connection(None, connection)
+    if not getattr(Template.render, 'metrics_wrapped', False):
+        Template.render = _timed_render(Template.render)
+
+
+def response_size(response):
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None and match.view_name else UNMATCHED
+
+
+def current_view():
+    """Имя URL текущего запроса; None - вне запроса (команды, фоновые задачи)"""
+    stats = _current.get()
+    if stats is None or stats.request is None:
+        return None
+    return view_name(stats.request)
+
+
+class RequestMetricsMiddleware:
+    """Время, SQL и шаблоны каждого запроса - в registry по имени URL"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats(request)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats(request)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, stats, elapsed):
+        registry.observe(
+            view_name(request), request.method, response.status_code, elapsed, stats, response_size(response),
+        )
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_rollups(apps, schema_editor):
+    Transaction = apps.get_model('transactions', 'Transaction')
+    DailyRollup = apps.get_model('transactions', 'DailyRollup')
+    fields = ('created_date', 'status_id', 'type_id', 'category_id', 'subcategory_id')
+    rows = Transaction.objects.order_by().values(*fields).annotate(
+        bucket_amount=models.Sum('amount'),
+        bucket_count=models.Count('id'),
+    )
+    DailyRollup.objects.bulk_create(
+        (
+            DailyRollup(
+                amount=row['bucket_amount'],
+                count=row['bucket_count'],
+                **{name: row[name] for name in fields}
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0005_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_date', models.DateField(verbose_name='Дата')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=17, verbose_name='Сумма (руб)')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество записей')),
+                ('category', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='transactions.category', verbose_name='Категория')),
+                ('status', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='transactions.status', verbose_name='Статус')),
+                ('subcategory', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='transactions.subcategory', verbose_name='Подкатегория')),
+                ('type', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='transactions.type', verbose_name='Тип')),
+            ],
+            options={
+                'verbose_name': 'Дневная сводка',
+                'verbose_name_plural': 'Дневные сводки',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrollup',
+            constraint=models.UniqueConstraint(fields=('created_date', 'status', 'type', 'category', 'subcategory'), name='daily_rollup_bucket_unique'),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
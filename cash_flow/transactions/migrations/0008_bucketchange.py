@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0007_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BucketChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(verbose_name='Версия данных')),
+                ('created_date', models.DateField(verbose_name='Дата')),
+                ('status_id', models.IntegerField(verbose_name='Статус')),
+                ('type_id', models.IntegerField(verbose_name='Тип')),
+                ('category_id', models.IntegerField(verbose_name='Категория')),
+                ('subcategory_id', models.IntegerField(verbose_name='Подкатегория')),
+            ],
+            options={
+                'verbose_name': 'Изменение корзины',
+                'verbose_name_plural': 'Лента изменений',
+                'indexes': [models.Index(fields=['version', 'created_date'], name='bucket_change_version_idx')],
+            },
+        ),
+    ]
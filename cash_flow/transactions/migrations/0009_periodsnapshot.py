@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0008_bucketchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц')),
+                ('income', models.DecimalField(decimal_places=2, default=0, max_digits=17, verbose_name='Поступления')),
+                ('expense', models.DecimalField(decimal_places=2, default=0, max_digits=17, verbose_name='Списания')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Количество записей')),
+                ('status', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='transactions.status', verbose_name='Статус')),
+            ],
+            options={
+                'verbose_name': 'Снимок на конец месяца',
+                'verbose_name_plural': 'Снимки на конец месяца',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='periodsnapshot',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__isnull', False)), fields=('month', 'status'), name='period_snapshot_status_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='periodsnapshot',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__isnull', True)), fields=('month',), name='period_snapshot_total_unique'),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+import transactions.models
+
+
+# Индекс с внешним содержимым: текст хранится только в transactions_transaction,
+# FTS5 держит лишь инвертированный индекс. prefix - отдельные индексы префиксов
+# длиной 2-4 символа, чтобы поиск "рекл*" не перебирал весь словарь.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE transactions_transaction_fts USING fts5(
+        comment,
+        content='transactions_transaction',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3 4'
+    )
+    """,
+    """
+    CREATE TRIGGER transactions_transaction_fts_insert AFTER INSERT ON transactions_transaction BEGIN
+        INSERT INTO transactions_transaction_fts (rowid, comment) VALUES (new.id, new.comment);
+    END
+    """,
+    """
+    CREATE TRIGGER transactions_transaction_fts_delete AFTER DELETE ON transactions_transaction BEGIN
+        INSERT INTO transactions_transaction_fts (transactions_transaction_fts, rowid, comment)
+        VALUES ('delete', old.id, old.comment);
+    END
+    """,
+    """
+    CREATE TRIGGER transactions_transaction_fts_update AFTER UPDATE OF comment ON transactions_transaction BEGIN
+        INSERT INTO transactions_transaction_fts (transactions_transaction_fts, rowid, comment)
+        VALUES ('delete', old.id, old.comment);
+        INSERT INTO transactions_transaction_fts (rowid, comment) VALUES (new.id, new.comment);
+    END
+    """,
+    # Индекс по уже существующим строкам
+    "INSERT INTO transactions_transaction_fts (transactions_transaction_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS transactions_transaction_fts_insert',
+    'DROP TRIGGER IF EXISTS transactions_transaction_fts_delete',
+    'DROP TRIGGER IF EXISTS transactions_transaction_fts_update',
+    'DROP TABLE IF EXISTS transactions_transaction_fts',
+]
+
+
+def create_fts(apps, schema_editor):
+    # FTS5 есть только в SQLite; на других СУБД поиск работает через icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0009_periodsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionSearch',
+            fields=[
+                ('transaction', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search', serialize=False, to='transactions.transaction', verbose_name='Транзакция')),
+                ('comment', transactions.models.SearchTextField(verbose_name='Комментарий')),
+                ('rank', models.FloatField(verbose_name='Релевантность')),
+            ],
+            options={
+                'verbose_name': 'Поисковый индекс',
+                'verbose_name_plural': 'Поисковый индекс',
+                'db_table': 'transactions_transaction_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
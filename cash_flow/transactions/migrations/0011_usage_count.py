@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:11
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_usage_counts(apps, schema_editor):
+    # Счетчики для уже существующих транзакций
+    Transaction = apps.get_model('transactions', 'Transaction')
+    alias = schema_editor.connection.alias
+    for model_name, field in (
+        ('Status', 'status'),
+        ('Type', 'type'),
+        ('Category', 'category'),
+        ('Subcategory', 'subcategory'),
+    ):
+        model = apps.get_model('transactions', model_name)
+        counts = Transaction.objects.using(alias).order_by().values(field).annotate(usage=Count('id'))
+        for row in counts:
+            model.objects.using(alias).filter(pk=row[field]).update(usage_count=row['usage'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0010_transaction_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='usage_count',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Транзакций'),
+        ),
+        migrations.AddField(
+            model_name='status',
+            name='usage_count',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Транзакций'),
+        ),
+        migrations.AddField(
+            model_name='subcategory',
+            name='usage_count',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Транзакций'),
+        ),
+        migrations.AddField(
+            model_name='type',
+            name='usage_count',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Транзакций'),
+        ),
+        migrations.RunPython(fill_usage_counts, migrations.RunPython.noop),
+    ]
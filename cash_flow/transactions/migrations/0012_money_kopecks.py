@@ -0,0 +1,103 @@
+from decimal import Decimal
+
+import django.core.validators
+from django.db import migrations, models
+
+import transactions.money
+
+
+# Суммы переводятся в копейки через временную колонку: ALTER с numeric на bigint
+# в некоторых СУБД округлил бы значения до рублей
+AMOUNT_FIELDS = [
+    ('transaction', 'transactions_transaction', 'amount', 15),
+    ('dailyrollup', 'transactions_dailyrollup', 'amount', 17),
+    ('periodsnapshot', 'transactions_periodsnapshot', 'income', 17),
+    ('periodsnapshot', 'transactions_periodsnapshot', 'expense', 17),
+]
+
+# Пересоздание таблицы транзакций (SQLite) удаляет триггеры поискового индекса
+FTS_TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS transactions_transaction_fts_insert AFTER INSERT ON transactions_transaction BEGIN
+        INSERT INTO transactions_transaction_fts (rowid, comment) VALUES (new.id, new.comment);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS transactions_transaction_fts_delete AFTER DELETE ON transactions_transaction BEGIN
+        INSERT INTO transactions_transaction_fts (transactions_transaction_fts, rowid, comment)
+        VALUES ('delete', old.id, old.comment);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS transactions_transaction_fts_update AFTER UPDATE OF comment ON transactions_transaction BEGIN
+        INSERT INTO transactions_transaction_fts (transactions_transaction_fts, rowid, comment)
+        VALUES ('delete', old.id, old.comment);
+        INSERT INTO transactions_transaction_fts (rowid, comment) VALUES (new.id, new.comment);
+    END
+    """,
+]
+
+
+def restore_fts_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in FTS_TRIGGERS_SQL:
+        schema_editor.execute(statement)
+
+
+def convert(model_name, table, field, max_digits):
+    temporary = f'{field}_kopecks'
+    return [
+        migrations.AddField(
+            model_name=model_name,
+            name=temporary,
+            field=transactions.money.MoneyField(default=0, max_digits=max_digits),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(
+            f'UPDATE {table} SET {temporary} = CAST(ROUND({field} * 100) AS BIGINT)',
+            f'UPDATE {table} SET {field} = {temporary} / 100.0',
+        ),
+        migrations.RemoveField(model_name=model_name, name=field),
+        migrations.RenameField(model_name=model_name, old_name=temporary, new_name=field),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0011_usage_count'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='transaction_type_amount_idx',
+        ),
+        *[operation for args in AMOUNT_FIELDS for operation in convert(*args)],
+        migrations.AlterField(
+            model_name='transaction',
+            name='amount',
+            field=transactions.money.MoneyField(validators=[django.core.validators.MinValueValidator(Decimal('0.01'))], verbose_name='Сумма (руб)'),
+        ),
+        migrations.AlterField(
+            model_name='dailyrollup',
+            name='amount',
+            field=transactions.money.MoneyField(default=0, max_digits=17, verbose_name='Сумма (руб)'),
+        ),
+        migrations.AlterField(
+            model_name='periodsnapshot',
+            name='income',
+            field=transactions.money.MoneyField(default=0, max_digits=17, verbose_name='Поступления'),
+        ),
+        migrations.AlterField(
+            model_name='periodsnapshot',
+            name='expense',
+            field=transactions.money.MoneyField(default=0, max_digits=17, verbose_name='Списания'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['type', 'created_date', 'amount'], name='transaction_type_amount_idx'),
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+    ]
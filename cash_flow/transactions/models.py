@@ -1,9 +1,61 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import IntegrityError, models, router
+from django.db import transaction as db_transaction
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 
+from .money import MoneyField
+
+class DataVersion(models.Model):
+    """
+    Счетчики версий данных, общие для всех процессов.
+
+    Кэши в памяти процесса сравнивают свою версию с версией в БД
+    и перестраиваются, если она изменилась.
+    """
+    HIERARCHY = 'hierarchy'
+    # Любое изменение транзакций или справочников
+    DATA = 'data'
+    
+    name = models.CharField(max_length=50, primary_key=True, verbose_name="Название")
+    value = models.BigIntegerField(default=0, verbose_name="Версия")
+    
+    class Meta:
+        verbose_name = "Версия данных"
+        verbose_name_plural = "Версии данных"
+    
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+    
+    @classmethod
+    def get(cls, name, using=None):
+        value = cls.objects.using(using).filter(name=name).values_list('value', flat=True).first()
+        return value or 0
+    
+    @classmethod
+    async def aget(cls, name, using=None):
+        value = await cls.objects.using(using).filter(name=name).values_list('value', flat=True).afirst()
+        return value or 0
+    
+    @classmethod
+    def bump(cls, name, using=None):
+        """Увеличивает счетчик и возвращает новое значение (видно только в этой транзакции до commit)"""
+        manager = cls.objects.db_manager(using)
+        with db_transaction.atomic(using=using):
+            if not manager.filter(name=name).update(value=models.F('value') + 1):
+                try:
+                    with db_transaction.atomic(using=using):
+                        manager.create(name=name, value=1)
+                except IntegrityError:
+                    manager.filter(name=name).update(value=models.F('value') + 1)
+            return cls.get(name, using=using)
+
+
 class Status(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name="Название")
+    # Число транзакций со ссылкой на запись; поддерживается bookkeeping.apply_usage
+    usage_count = models.BigIntegerField(default=0, editable=False, verbose_name="Транзакций")
     
     class Meta:
         verbose_name = "Статус"
@@ -15,6 +67,7 @@ class Status(models.Model):
 
 class Type(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name="Название")
+    usage_count = models.BigIntegerField(default=0, editable=False, verbose_name="Транзакций")
     
     class Meta:
         verbose_name = "Тип"
@@ -27,6 +80,7 @@ class Type(models.Model):
 class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name="Название")
     type = models.ForeignKey(Type, on_delete=models.CASCADE, verbose_name="Тип")
+    usage_count = models.BigIntegerField(default=0, editable=False, verbose_name="Транзакций")
     
     class Meta:
         verbose_name = "Категория"
@@ -40,6 +94,7 @@ class Category(models.Model):
 class Subcategory(models.Model):
     name = models.CharField(max_length=100, verbose_name="Название")
     category = models.ForeignKey(Category, on_delete=models.CASCADE, verbose_name="Категория")
+    usage_count = models.BigIntegerField(default=0, editable=False, verbose_name="Транзакций")
     
     class Meta:
         verbose_name = "Подкатегория"
@@ -50,6 +105,60 @@ class Subcategory(models.Model):
     def __str__(self):
         return f"{self.name}"
 
+class TransactionQuerySet(models.QuerySet):
+    """
+    Массовые операции над транзакциями поддерживают сводные данные
+    (см. bookkeeping) в той же транзакции БД, что и сама запись.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .bookkeeping import Deltas
+        with db_transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            deltas = Deltas()
+            for obj in objs:
+                deltas.add_instance(obj, 1)
+            deltas.apply(using=self.db)
+        return objs
+
+    def update(self, **kwargs):
+        from .bookkeeping import Deltas, affects_buckets
+        if not affects_buckets(self.model, kwargs):
+            with db_transaction.atomic(using=self.db):
+                # Сводки не меняются, но версия данных и лента изменений - да
+                deltas = Deltas()
+                deltas.touch(self)
+                rows = super().update(**kwargs)
+                deltas.apply(using=self.db)
+            return rows
+        with db_transaction.atomic(using=self.db):
+            deltas = Deltas()
+            if deltas.add_constant_update(self, kwargs):
+                rows = super().update(**kwargs)
+            else:
+                # Значения-выражения: пересчитываем затронутые строки до и после
+                pks = list(self.values_list('pk', flat=True))
+                deltas.add_pks(self.model, pks, -1, using=self.db)
+                rows = super().update(**kwargs)
+                deltas.add_pks(self.model, pks, 1, using=self.db)
+            deltas.apply(using=self.db)
+        return rows
+
+    update.alters_data = True
+
+    def delete(self):
+        from .bookkeeping import Deltas
+        with db_transaction.atomic(using=self.db):
+            deltas = Deltas()
+            deltas.add_queryset(self, -1)
+            result = super().delete()
+            deltas.apply(using=self.db)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class Transaction(models.Model):
     created_date = models.DateField(
         default=timezone.now, 
@@ -58,27 +167,31 @@ class Transaction(models.Model):
     status = models.ForeignKey(
         Status, 
         on_delete=models.PROTECT, 
+        db_index=False,
         verbose_name="Статус"
     )
     type = models.ForeignKey(
         Type, 
         on_delete=models.PROTECT, 
+        db_index=False,
         verbose_name="Тип"
     )
     category = models.ForeignKey(
         Category, 
         on_delete=models.PROTECT, 
+        db_index=False,
         verbose_name="Категория"
     )
     subcategory = models.ForeignKey(
         Subcategory, 
         on_delete=models.PROTECT, 
+        db_index=False,
         verbose_name="Подкатегория"
     )
-    amount = models.DecimalField(
+    # Хранится в копейках, наружу - Decimal (см. money.py)
+    amount = MoneyField(
         max_digits=15, 
-        decimal_places=2,
-        validators=[MinValueValidator(0.01)],
+        validators=[MinValueValidator(Decimal('0.01'))],
         verbose_name="Сумма (руб)"
     )
     comment = models.TextField(
@@ -89,13 +202,237 @@ class Transaction(models.Model):
     )
    
     
+    objects = TransactionQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Транзакция"
         verbose_name_plural = "Транзакции"
         ordering = ['-created_date', '-id']
+        # Каждый фильтр списка - равенство по измерению + сортировка по дате,
+        # поэтому измерение идет первым, а (created_date, id) - следом.
+        # Индексы по одиночным внешним ключам отключены: их покрывают составные.
+        indexes = [
+            models.Index(fields=['created_date', 'id'], name='transaction_date_idx'),
+            models.Index(fields=['status', 'created_date', 'id'], name='transaction_status_date_idx'),
+            models.Index(fields=['type', 'created_date', 'id'], name='transaction_type_date_idx'),
+            models.Index(fields=['category', 'created_date', 'id'], name='transaction_category_date_idx'),
+            models.Index(fields=['subcategory', 'created_date', 'id'], name='transaction_subcat_date_idx'),
+            # Покрывающий индекс для сумм пополнений/списаний за период
+            models.Index(fields=['type', 'created_date', 'amount'], name='transaction_type_amount_idx'),
+        ]
     
     def __str__(self):
         return f"{self.created_date} - {self.amount}р. - {self.type} - {self.category}"
     
     def get_amount_display(self):
         return f"{self.amount:,.2f} р.".replace(',', ' ')
+    
+    def save(self, *args, **kwargs):
+        from .bookkeeping import Deltas
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with db_transaction.atomic(using=using):
+            deltas = Deltas()
+            # Старое состояние читаем из БД, а не из экземпляра: он мог устареть
+            if self.pk is not None:
+                deltas.add_queryset(type(self)._base_manager.using(using).filter(pk=self.pk), -1)
+            super().save(*args, **kwargs)
+            deltas.add_instance(self, 1)
+            deltas.apply(using=using)
+    
+    def delete(self, *args, **kwargs):
+        from .bookkeeping import Deltas
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with db_transaction.atomic(using=using):
+            deltas = Deltas()
+            deltas.add_queryset(type(self)._base_manager.using(using).filter(pk=self.pk), -1)
+            result = super().delete(*args, **kwargs)
+            deltas.apply(using=using)
+        return result
+
+
+
+class SearchTextField(models.TextField):
+    """Колонка виртуальной таблицы FTS5: поддерживает lookup match (оператор MATCH)"""
+
+
+@SearchTextField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class TransactionSearch(models.Model):
+    """
+    Полнотекстовый индекс комментариев - виртуальная таблица FTS5 с внешним
+    содержимым (transactions_transaction). Создается и поддерживается
+    триггерами из миграции 0010, Django ее не создает. rowid = id транзакции,
+    rank - оценка bm25 (меньше - лучше), заполнена только вместе с MATCH.
+    """
+    transaction = models.OneToOneField(
+        Transaction, on_delete=models.DO_NOTHING, primary_key=True,
+        db_column='rowid', related_name='search', verbose_name="Транзакция",
+    )
+    comment = SearchTextField(verbose_name="Комментарий")
+    rank = models.FloatField(verbose_name="Релевантность")
+    
+    class Meta:
+        managed = False
+        db_table = 'transactions_transaction_fts'
+        verbose_name = "Поисковый индекс"
+        verbose_name_plural = "Поисковый индекс"
+
+class DailyRollup(models.Model):
+    """
+    Сводка транзакций за день в разрезе всех измерений фильтра.
+
+    Имена полей совпадают с Transaction, поэтому одни и те же условия Q
+    применимы к обеим таблицам.
+    """
+    created_date = models.DateField(verbose_name="Дата")
+    status = models.ForeignKey(Status, on_delete=models.CASCADE, db_index=False, verbose_name="Статус")
+    type = models.ForeignKey(Type, on_delete=models.CASCADE, db_index=False, verbose_name="Тип")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, db_index=False, verbose_name="Категория")
+    subcategory = models.ForeignKey(Subcategory, on_delete=models.CASCADE, db_index=False, verbose_name="Подкатегория")
+    amount = MoneyField(max_digits=17, default=0, verbose_name="Сумма (руб)")
+    count = models.IntegerField(default=0, verbose_name="Количество записей")
+    
+    class Meta:
+        verbose_name = "Дневная сводка"
+        verbose_name_plural = "Дневные сводки"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['created_date', 'status', 'type', 'category', 'subcategory'],
+                name='daily_rollup_bucket_unique',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.created_date} - {self.amount}р. ({self.count})"
+
+
+class BucketChange(models.Model):
+    """
+    Лента изменений: какие корзины (день + измерения) затронула запись
+    с данной версией DataVersion.DATA. По ней кэши проверяют, касаются ли
+    их изменения, случившиеся после заполнения. Имена полей совпадают
+    с Transaction, поэтому к ленте применимы условия фильтров списка.
+    """
+    version = models.BigIntegerField(verbose_name="Версия данных")
+    created_date = models.DateField(verbose_name="Дата")
+    status_id = models.IntegerField(verbose_name="Статус")
+    type_id = models.IntegerField(verbose_name="Тип")
+    category_id = models.IntegerField(verbose_name="Категория")
+    subcategory_id = models.IntegerField(verbose_name="Подкатегория")
+    
+    class Meta:
+        verbose_name = "Изменение корзины"
+        verbose_name_plural = "Лента изменений"
+        indexes = [
+            models.Index(fields=['version', 'created_date'], name='bucket_change_version_idx'),
+        ]
+    
+    def __str__(self):
+        return f"v{self.version}: {self.created_date}"
+
+
+class PeriodSnapshot(models.Model):
+    """
+    Итоги на конец месяца нарастающим итогом: все транзакции с начала учета
+    по последний день месяца month. status=None - по всем статусам.
+
+    Остаток на любую дату - снимок предыдущего месяца плюс сумма за неполный
+    месяц по DailyRollup (см. balances.py). Изменение задним числом удаляет
+    снимки с месяца изменения, они пересчитываются при следующем запросе.
+    """
+    month = models.DateField(verbose_name="Месяц")
+    status = models.ForeignKey(
+        Status, on_delete=models.CASCADE, null=True, blank=True, db_index=False, verbose_name="Статус"
+    )
+    income = MoneyField(max_digits=17, default=0, verbose_name="Поступления")
+    expense = MoneyField(max_digits=17, default=0, verbose_name="Списания")
+    count = models.BigIntegerField(default=0, verbose_name="Количество записей")
+    
+    class Meta:
+        verbose_name = "Снимок на конец месяца"
+        verbose_name_plural = "Снимки на конец месяца"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['month', 'status'], condition=models.Q(status__isnull=False),
+                name='period_snapshot_status_unique',
+            ),
+            models.UniqueConstraint(
+                fields=['month'], condition=models.Q(status__isnull=True),
+                name='period_snapshot_total_unique',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.month:%m.%Y} ({self.status or 'все'}): {self.income - self.expense}р."
+
+
+class Job(models.Model):
+    """
+    Фоновая задача (импорт, выгрузка, пересчет сводок, отчет).
+
+    Очередь - сама таблица: воркер (manage.py run_jobs) забирает задачу
+    условным UPDATE ... WHERE status='queued', поэтому одну задачу не возьмут
+    два воркера и брокер сообщений не нужен. Обработчики задач - в jobs.py.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (SUCCEEDED, 'Готово'),
+        (FAILED, 'Ошибка'),
+        (CANCELLED, 'Отменена'),
+    ]
+    FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+    
+    kind = models.CharField(max_length=50, verbose_name="Вид")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED, verbose_name="Состояние")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Параметры")
+    result = models.JSONField(null=True, blank=True, verbose_name="Результат")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    progress = models.BigIntegerField(default=0, verbose_name="Выполнено")
+    total = models.BigIntegerField(null=True, blank=True, verbose_name="Всего")
+    message = models.CharField(max_length=255, blank=True, verbose_name="Этап")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name="Максимум попыток")
+    # Не раньше этого момента: отложенный повтор после ошибки
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Запуск не раньше")
+    cancel_requested = models.BooleanField(default=False, verbose_name="Запрошена отмена")
+    worker = models.CharField(max_length=100, blank=True, verbose_name="Воркер")
+    # Обновляется воркером, пока задача выполняется; по нему находятся задачи упавших воркеров
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Отметка воркера")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начата")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершена")
+    
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} #{self.pk}: {self.get_status_display()}"
+    
+    @property
+    def finished(self):
+        return self.status in self.FINISHED
+    
+    @property
+    def percent(self):
+        if not self.total:
+            return None
+        return min(100, round(self.progress * 100 / self.total))
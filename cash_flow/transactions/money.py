@@ -0,0 +1,83 @@
+"""
+Денежные суммы: в Python - Decimal с двумя знаками, в БД - целое число копеек.
+
+DecimalField в SQLite хранится как REAL, и SUM() складывает числа с плавающей
+точкой, а каждая строка затем превращается в Decimal. Целые копейки складываются
+точно и без преобразований; MoneyField переводит их в рубли только на выходе,
+в том числе для агрегатов (Sum('amount') возвращает Decimal).
+"""
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django import forms
+from django.core import validators
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.utils.functional import cached_property
+
+KOPECK = Decimal('0.01')
+
+
+def to_kopecks(amount):
+    """Decimal в рублях - целые копейки (доли копейки округляются, как в DecimalField)"""
+    return int(amount.quantize(KOPECK, rounding=ROUND_HALF_UP).scaleb(2))
+
+
+def from_kopecks(value):
+    """Целые копейки - Decimal в рублях с двумя знаками"""
+    return Decimal(int(value)).scaleb(-2)
+
+
+class MoneyField(models.BigIntegerField):
+    """
+    Сумма в рублях, хранимая в копейках (BIGINT). Снаружи ведет себя как
+    DecimalField(decimal_places=2): значения, формы, админка и фильтры по Decimal.
+    """
+    description = 'Сумма в копейках'
+    decimal_places = 2
+    default_error_messages = {
+        'invalid': '"%(value)s" - не число',
+    }
+
+    def __init__(self, *args, max_digits=15, **kwargs):
+        self.max_digits = max_digits
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.max_digits != 15:
+            kwargs['max_digits'] = self.max_digits
+        return name, path, args, kwargs
+
+    @cached_property
+    def validators(self):
+        # Проверки диапазона BIGINT относятся к копейкам, а не к рублям - вместо них число знаков
+        return [*self.default_validators, validators.DecimalValidator(self.max_digits, 2), *self._validators]
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return from_kopecks(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal):
+            return value
+        try:
+            if isinstance(value, float):
+                return Decimal(str(value))
+            return Decimal(value)
+        except (InvalidOperation, TypeError, ValueError):
+            raise ValidationError(self.error_messages['invalid'], code='invalid', params={'value': value})
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None:
+            return None
+        return to_kopecks(self.to_python(value))
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{
+            'form_class': forms.DecimalField,
+            'max_digits': self.max_digits,
+            'decimal_places': self.decimal_places,
+            **kwargs,
+        })
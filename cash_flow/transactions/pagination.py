@@ -0,0 +1,170 @@
+import base64
+import binascii
+import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# Направления курсора: n - следующая страница, p - предыдущая, l - последняя
+NEXT = 'n'
+PREVIOUS = 'p'
+LAST = 'l'
+
+
+def encode_cursor(direction, created_date=None, pk=None):
+    """Упаковывает позицию в ленте в непрозрачную строку для URL"""
+    if direction == LAST:
+        raw = LAST
+    else:
+        raw = f"{direction}{created_date.isoformat()}:{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Обратная операция к encode_cursor: возвращает (direction, date, pk)"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, position = raw[:1], raw[1:]
+        if direction == LAST and not position:
+            return LAST, None, None
+        if direction not in (NEXT, PREVIOUS):
+            raise InvalidCursor(token)
+        date_part, pk_part = position.split(':')
+        return direction, datetime.date.fromisoformat(date_part), int(pk_part)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise InvalidCursor(token)
+
+
+def _position(row):
+    """Ключ (created_date, id) строки: модели или словаря из values()"""
+    if isinstance(row, dict):
+        return row['created_date'], row['id']
+    return row.created_date, row.pk
+
+
+class CursorPage:
+    """Страница ленты транзакций; повторяет интерфейс Page, нужный шаблонам"""
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        return encode_cursor(NEXT, *_position(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous:
+            return None
+        return encode_cursor(PREVIOUS, *_position(self.object_list[0]))
+
+    @property
+    def last_cursor(self):
+        return encode_cursor(LAST)
+
+
+class CursorPaginator:
+    """
+    Постраничный вывод по ключу (created_date, id) без OFFSET и COUNT(*).
+
+    Каждая страница - это поиск по индексу от границы предыдущей страницы,
+    поэтому глубокие страницы стоят столько же, сколько первая.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def _first_query(self):
+        return self.queryset.order_by('-created_date', '-id')[:self.per_page + 1]
+
+    def _query(self, cursor):
+        """Запрос для страницы по курсору: (direction, queryset) или None для первой страницы"""
+        if not cursor:
+            return None
+        direction, created_date, pk = decode_cursor(cursor)
+        if direction == NEXT:
+            queryset = (
+                self.queryset.filter(created_date__lte=created_date)
+                .filter(Q(created_date__lt=created_date) | Q(id__lt=pk))
+                .order_by('-created_date', '-id')
+            )
+        elif direction == PREVIOUS:
+            queryset = (
+                self.queryset.filter(created_date__gte=created_date)
+                .filter(Q(created_date__gt=created_date) | Q(id__gt=pk))
+                .order_by('created_date', 'id')
+            )
+        else:
+            queryset = self.queryset.order_by('created_date', 'id')
+        return direction, queryset[:self.per_page + 1]
+
+    def _build(self, direction, rows):
+        """Страница из прочитанных строк; None, если нужна первая страница"""
+        if direction == NEXT:
+            page = CursorPage(rows[:self.per_page], len(rows) > self.per_page, True)
+        elif direction == PREVIOUS:
+            if len(rows) <= self.per_page:
+                # Дошли до начала ленты - показываем полноценную первую страницу
+                return None
+            page = CursorPage(rows[:self.per_page][::-1], True, True)
+        else:
+            page = CursorPage(rows[:self.per_page][::-1], False, len(rows) > self.per_page)
+
+        # Записи на границе могли быть удалены - возвращаемся к началу
+        if not page.object_list:
+            return None
+        return page
+
+    def _first_page(self, rows):
+        return CursorPage(rows[:self.per_page], len(rows) > self.per_page, False)
+
+    def page(self, cursor=None):
+        query = self._query(cursor)
+        if query is not None:
+            direction, queryset = query
+            page = self._build(direction, list(queryset))
+            if page is not None:
+                return page
+        return self._first_page(list(self._first_query()))
+
+    async def apage(self, cursor=None):
+        query = self._query(cursor)
+        if query is not None:
+            direction, queryset = query
+            page = self._build(direction, [row async for row in queryset])
+            if page is not None:
+                return page
+        return self._first_page([row async for row in self._first_query()])
+
+    def approximate_count(self, limit=10000):
+        """
+        Ограниченный подсчет: не более limit + 1 строк.
+
+        Возвращает (count, exact); при exact=False известно лишь,
+        что записей больше limit.
+        """
+        count = self.queryset.order_by()[:limit + 1].count()
+        return min(count, limit), count <= limit
+
+    async def aapproximate_count(self, limit=10000):
+        count = await self.queryset.order_by()[:limit + 1].acount()
+        return min(count, limit), count <= limit
@@ -0,0 +1,283 @@
+"""
+Отрисовка отчета о движении денежных средств в XLSX и PDF.
+
+Модуль не импортирует Django: он выполняется в дочерних процессах пула
+(см. reports.py) и получает уже посчитанные данные ReportData - названия
+справочников подставлены, суммы сгруппированы по месяцам. openpyxl и reportlab
+необязательны: без пакета соответствующий формат недоступен.
+"""
+import datetime
+import importlib.util
+import io
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+
+# Формат: (MIME-тип, нужный пакет)
+FORMATS = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'openpyxl'),
+    'pdf': ('application/pdf', 'reportlab'),
+}
+# Шрифты с кириллицей для PDF (встроенные шрифты reportlab ее не содержат)
+PDF_FONTS = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+    '/Library/Fonts/Arial Unicode.ttf',
+    'C:/Windows/Fonts/arial.ttf',
+)
+PDF_MONTHS_PER_TABLE = 6
+MONTH_NAMES = ('январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль',
+               'август', 'сентябрь', 'октябрь', 'ноябрь', 'декабрь')
+
+
+class ReportRenderError(Exception):
+    """Формат нельзя построить: нет пакета или шрифта"""
+
+
+def available(report_format):
+    return report_format in FORMATS and importlib.util.find_spec(FORMATS[report_format][1]) is not None
+
+
+def month_label(month):
+    return f'{MONTH_NAMES[month.month - 1]} {month.year}'
+
+
+@dataclass(frozen=True)
+class ReportRow:
+    month: datetime.date
+    status: str
+    type: str
+    category: str
+    subcategory: str
+    income: bool
+    amount: Decimal
+    count: int
+
+    @property
+    def signed(self):
+        """Поступления с плюсом, списания с минусом"""
+        return self.amount if self.income else -self.amount
+
+
+@dataclass(frozen=True)
+class ReportData:
+    title: str
+    period: str
+    # Примененные фильтры: пары (название, значение) строками
+    filters: tuple
+    months: tuple
+    rows: tuple
+    created: datetime.datetime
+
+    def monthly(self):
+        """(месяц, поступления, списания, сальдо, операций) по каждому месяцу периода"""
+        totals = {month: [Decimal('0'), Decimal('0'), 0] for month in self.months}
+        for row in self.rows:
+            total = totals[row.month]
+            total[0 if row.income else 1] += row.amount
+            total[2] += row.count
+        return [
+            (month, income, expense, income - expense, count)
+            for month, (income, expense, count) in totals.items()
+        ]
+
+    def pivot(self, *fields):
+        """Строки (значения fields, сальдо по месяцам периода, итог), по убыванию оборота"""
+        amounts = defaultdict(lambda: defaultdict(Decimal))
+        for row in self.rows:
+            amounts[tuple(getattr(row, name) for name in fields)][row.month] += row.signed
+        result = [
+            (key, [by_month.get(month, Decimal('0')) for month in self.months], sum(by_month.values(), Decimal('0')))
+            for key, by_month in amounts.items()
+        ]
+        result.sort(key=lambda item: (-abs(item[2]), item[0]))
+        return result
+
+    def sections(self):
+        """Разрезы отчета: (название, заголовки ключа, строки pivot)"""
+        return (
+            ('Статусы', ('Статус',), self.pivot('status')),
+            ('Категории', ('Тип', 'Категория'), self.pivot('type', 'category')),
+            ('Подкатегории', ('Тип', 'Категория', 'Подкатегория'), self.pivot('type', 'category', 'subcategory')),
+        )
+
+
+def render(data, report_format, pdf_font=None):
+    """Файл отчета в виде bytes (выполняется в процессе пула)"""
+    if not available(report_format):
+        package = FORMATS.get(report_format, (None, report_format))[1]
+        raise ReportRenderError(f'Для отчетов {report_format.upper()} установите пакет {package}')
+    if report_format == 'xlsx':
+        return render_xlsx(data)
+    return render_pdf(data, pdf_font)
+
+
+def render_xlsx(data):
+    from openpyxl import Workbook
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    money_format = '#,##0.00'
+    bold = Font(bold=True)
+    workbook = Workbook()
+
+    def sheet(title, header, rows, money_from, widths):
+        worksheet = workbook.create_sheet(title)
+        worksheet.append(header)
+        for cell in worksheet[1]:
+            cell.font = bold
+        for row in rows:
+            worksheet.append(row)
+        for column in worksheet.iter_cols(min_row=2, min_col=money_from + 1):
+            for cell in column:
+                cell.number_format = money_format
+        for index, width in enumerate(widths, start=1):
+            worksheet.column_dimensions[get_column_letter(index)].width = width
+        worksheet.freeze_panes = worksheet.cell(row=2, column=money_from + 1)
+        return worksheet
+
+    summary = workbook.active
+    summary.title = 'Сводка'
+    summary.append([data.title])
+    summary['A1'].font = Font(bold=True, size=14)
+    summary.append(['Период', data.period])
+    for label, value in data.filters:
+        summary.append([label, value])
+    summary.append(['Сформирован', data.created.strftime('%d.%m.%Y %H:%M')])
+    summary.append([])
+    header_row = summary.max_row + 1
+    summary.append(['Месяц', 'Поступления', 'Списания', 'Сальдо', 'Операций'])
+    for cell in summary[header_row]:
+        cell.font = bold
+    monthly = data.monthly()
+    for month, income, expense, balance, count in monthly:
+        summary.append([month_label(month), income, expense, balance, count])
+    summary.append([
+        'Итого',
+        sum((item[1] for item in monthly), Decimal('0')),
+        sum((item[2] for item in monthly), Decimal('0')),
+        sum((item[3] for item in monthly), Decimal('0')),
+        sum(item[4] for item in monthly),
+    ])
+    for cell in summary[summary.max_row]:
+        cell.font = bold
+    for row in summary.iter_rows(min_row=header_row + 1, min_col=2, max_col=4):
+        for cell in row:
+            cell.number_format = money_format
+    for letter, width in zip('ABCDE', (28, 16, 16, 16, 10)):
+        summary.column_dimensions[letter].width = width
+
+    month_headers = [month_label(month) for month in data.months]
+    for title, key_headers, rows in data.sections():
+        sheet(
+            title,
+            [*key_headers, *month_headers, 'Итого'],
+            ([*key, *amounts, total] for key, amounts, total in rows),
+            len(key_headers),
+            [24] * len(key_headers) + [14] * (len(month_headers) + 1),
+        )
+
+    sheet(
+        'Данные',
+        ['Месяц', 'Статус', 'Тип', 'Категория', 'Подкатегория', 'Сумма', 'Операций'],
+        ([row.month, row.status, row.type, row.category, row.subcategory, row.amount, row.count] for row in data.rows),
+        5,
+        (12, 16, 16, 24, 24, 14, 10),
+    )
+    details = workbook['Данные']
+    for (cell,) in details.iter_rows(min_row=2, max_col=1):
+        cell.number_format = 'mm.yyyy'
+    for (cell,) in details.iter_rows(min_row=2, min_col=7, max_col=7):
+        cell.number_format = '0'
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def find_pdf_font(path=None):
+    for candidate in ((path,) if path else PDF_FONTS):
+        if os.path.isfile(candidate):
+            return candidate
+    raise ReportRenderError('Для PDF нужен TTF-шрифт с кириллицей: укажите путь в REPORT_PDF_FONT')
+
+
+def _amount(value):
+    # Пробел - разделитель разрядов, как в интерфейсе
+    return f'{value:,.2f}'.replace(',', '\xa0')
+
+
+def render_pdf(data, pdf_font=None):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib.units import mm
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    font = 'ReportFont'
+    pdfmetrics.registerFont(TTFont(font, find_pdf_font(pdf_font)))
+    title_style = ParagraphStyle('title', fontName=font, fontSize=14, leading=18, spaceAfter=4 * mm)
+    heading_style = ParagraphStyle('heading', fontName=font, fontSize=11, leading=14, spaceBefore=4 * mm, spaceAfter=2 * mm)
+    text_style = ParagraphStyle('text', fontName=font, fontSize=9, leading=12)
+
+    def table(rows, numeric_from):
+        result = Table(rows, repeatRows=1, hAlign='LEFT')
+        result.setStyle(TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), font),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e9ecef')),
+            ('ALIGN', (numeric_from, 0), (-1, -1), 'RIGHT'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ]))
+        return result
+
+    story = [Paragraph(data.title, title_style), Paragraph(f'Период: {data.period}', text_style)]
+    for label, value in data.filters:
+        story.append(Paragraph(f'{label}: {value}', text_style))
+    story.append(Paragraph(f'Сформирован: {data.created:%d.%m.%Y %H:%M}', text_style))
+
+    story.append(Paragraph('Итоги по месяцам', heading_style))
+    monthly = data.monthly()
+    rows = [['Месяц', 'Поступления', 'Списания', 'Сальдо', 'Операций']]
+    rows += [
+        [month_label(month), _amount(income), _amount(expense), _amount(balance), str(count)]
+        for month, income, expense, balance, count in monthly
+    ]
+    rows.append([
+        'Итого',
+        _amount(sum((item[1] for item in monthly), Decimal('0'))),
+        _amount(sum((item[2] for item in monthly), Decimal('0'))),
+        _amount(sum((item[3] for item in monthly), Decimal('0'))),
+        str(sum(item[4] for item in monthly)),
+    ])
+    story.append(table(rows, 1))
+
+    # Широкие разрезы делятся на таблицы по PDF_MONTHS_PER_TABLE месяцев, чтобы поместиться на страницу
+    for title, key_headers, pivot in data.sections():
+        story.append(Paragraph(f'{title} (поступления +, списания -)', heading_style))
+        for start in range(0, len(data.months), PDF_MONTHS_PER_TABLE):
+            months = data.months[start:start + PDF_MONTHS_PER_TABLE]
+            last = start + PDF_MONTHS_PER_TABLE >= len(data.months)
+            header = [*key_headers, *(month_label(month) for month in months)]
+            if last:
+                header.append('Итого')
+            rows = [header]
+            for key, amounts, total in pivot:
+                row = [*key, *(_amount(value) for value in amounts[start:start + len(months)])]
+                if last:
+                    row.append(_amount(total))
+                rows.append(row)
+            story.append(table(rows, len(key_headers)))
+            story.append(Spacer(1, 3 * mm))
+
+    buffer = io.BytesIO()
+    document = SimpleDocTemplate(
+        buffer, pagesize=landscape(A4), title=data.title,
+        leftMargin=10 * mm, rightMargin=10 * mm, topMargin=10 * mm, bottomMargin=10 * mm,
+    )
+    document.build(story)
+    return buffer.getvalue()
@@ -0,0 +1,237 @@
+"""
+Помесячные отчеты о движении денежных средств (XLSX, PDF) за произвольный период.
+
+Данные отчета - один сгруппированный запрос: суммы и число операций по месяцу,
+статусу, типу, категории и подкатегории. Если все фильтры выражаются через
+корзины, источник - дневные сводки DailyRollup, иначе - сами транзакции.
+Названия справочников подставляются из кэша Hierarchy.
+
+Файл строится фоновой задачей 'report' (jobs.py), а сама отрисовка идет в пуле
+процессов: report_render.py не зависит от Django, несколько отчетов строятся
+параллельно и не держат GIL воркера. Готовый файл лежит в каталоге задач под
+именем из формата, фильтра и версии данных - пока данные не менялись,
+повторный запрос того же отчета отдается сразу, без задачи.
+"""
+import datetime
+import hashlib
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.http import QueryDict
+from django.utils import timezone
+
+from . import report_render
+from .balances import month_start, next_month
+from .filters import TransactionFilterSet
+from .hierarchy import get_hierarchy
+from .jobs import file_path, handler
+from .models import DailyRollup, DataVersion, Transaction
+from .report_render import FORMATS, ReportData, ReportRow
+from .routers import read_only_view
+from .stats import INCOME_TYPE
+
+DEFAULT_RENDER_WORKERS = 2
+# Больше колонок-месяцев отчет не показывает: длинный период - огромный файл
+MAX_MONTHS = 120
+TITLE = 'Движение денежных средств по месяцам'
+# Фильтры по справочникам: параметр - способ найти запись в Hierarchy
+DICTIONARY_FILTERS = ('status', 'type', 'category', 'subcategory')
+
+LAST_MONTH = month_start(datetime.date.max)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def available_formats():
+    return [report_format for report_format in FORMATS if report_render.available(report_format)]
+
+
+def cache_name(filterset, report_format, data_version):
+    digest = hashlib.sha1(f'{report_format}|{filterset.cache_key}|{data_version}'.encode()).hexdigest()[:16]
+    return f'report-{digest}.{report_format}'
+
+
+def cached_report(filterset, report_format):
+    """Имя готового файла для текущей версии данных или None"""
+    name = cache_name(filterset, report_format, DataVersion.get(DataVersion.DATA))
+    return name if file_path(name).exists() else None
+
+
+def download_name(filterset, report_format):
+    date_from, date_to = filterset.values.get('date_from'), filterset.values.get('date_to')
+    period = '-'.join(f'{value:%Y-%m}' for value in (date_from, date_to) if value)
+    return f'cash-flow{"-" + period if period else ""}.{report_format}'
+
+
+def month_range(first, last):
+    months = []
+    month = month_start(first)
+    while month <= last:
+        months.append(month)
+        if month == LAST_MONTH:
+            break
+        month = next_month(month)
+    return tuple(months)
+
+
+def span_error(first, last):
+    """Сообщение об ошибке, если период с first по last длиннее MAX_MONTHS месяцев"""
+    if first and last and (last.year - first.year) * 12 + last.month - first.month >= MAX_MONTHS:
+        return f'Период отчета - не больше {MAX_MONTHS} месяцев: уточните даты'
+    return None
+
+
+def period_error(filterset):
+    """span_error для периода фильтра; недостающие границы - по дневным сводкам"""
+    first, last = filterset.values.get('date_from'), filterset.values.get('date_to')
+    if first is None or last is None:
+        days = DailyRollup.objects.order_by('created_date').values_list('created_date', flat=True)
+        first = first or days.first()
+        last = last or days.last()
+    return span_error(first, last)
+
+
+def describe_filters(filterset, hierarchy):
+    """Примененные фильтры (кроме периода) для шапки отчета"""
+    described = []
+    for name, value in filterset.values.items():
+        if name in ('date_from', 'date_to'):
+            continue
+        label = filterset.declared_filters[name].label
+        if name in DICTIONARY_FILTERS:
+            lookup = getattr(hierarchy, name)
+            described.append((label, ', '.join(item.name for item in map(lookup, value) if item is not None)))
+        else:
+            described.append((label, filterset.params[name]))
+    return tuple(described)
+
+
+def build_data(filterset, hierarchy=None):
+    """ReportData по фильтру - один запрос с группировкой по месяцу и всем измерениям"""
+    hierarchy = hierarchy or get_hierarchy()
+    income_ids = set(hierarchy.type_ids(INCOME_TYPE))
+    use_rollup = filterset.bucket_only
+    source = DailyRollup if use_rollup else Transaction
+    grouped = filterset.filter(source.objects.order_by()).annotate(
+        month=TruncMonth('created_date'),
+    ).values('month', 'status_id', 'type_id', 'category_id', 'subcategory_id').annotate(
+        total_amount=Sum('amount'),
+        total_count=Sum('count') if use_rollup else Count('id'),
+    ).order_by('month', 'status_id', 'type_id', 'category_id', 'subcategory_id')
+
+    def name(item):
+        return item.name if item is not None else ''
+
+    rows = tuple(
+        ReportRow(
+            month=row['month'],
+            status=name(hierarchy.status(row['status_id'])),
+            type=name(hierarchy.type(row['type_id'])),
+            category=name(hierarchy.category(row['category_id'])),
+            subcategory=name(hierarchy.subcategory(row['subcategory_id'])),
+            income=row['type_id'] in income_ids,
+            amount=row['total_amount'],
+            count=row['total_count'],
+        )
+        for row in grouped if row['total_count']
+    )
+
+    # Период - по фильтру, недостающие границы - по данным; пустые месяцы остаются в отчете
+    date_from, date_to = filterset.values.get('date_from'), filterset.values.get('date_to')
+    first = date_from or (rows[0].month if rows else None)
+    last = date_to or (max(row.month for row in rows) if rows else None)
+    error = span_error(first, last)
+    if error:
+        raise ValueError(error)
+    months = month_range(first, last) if first and last else ()
+    if date_from or date_to:
+        period = ' '.join(filter(None, (
+            f'с {date_from:%d.%m.%Y}' if date_from else '',
+            f'по {date_to:%d.%m.%Y}' if date_to else '',
+        )))
+    else:
+        period = 'все время'
+
+    return ReportData(
+        title=TITLE,
+        period=period,
+        filters=describe_filters(filterset, hierarchy),
+        months=months,
+        rows=rows,
+        created=timezone.localtime(),
+    )
+
+
+def render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: дочерним процессам не нужны ни Django, ни соединения родителя
+            _pool = ProcessPoolExecutor(
+                getattr(settings, 'REPORT_RENDER_WORKERS', DEFAULT_RENDER_WORKERS),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def render(data, report_format):
+    """Файл отчета (bytes); REPORT_RENDER_WORKERS = 0 - в текущем процессе"""
+    global _pool
+    font = getattr(settings, 'REPORT_PDF_FONT', None)
+    # Воркер run_jobs --processes уже выполняет задачу в дочернем процессе: второй пул там
+    # не нужен и не дал бы процессу завершиться
+    if not getattr(settings, 'REPORT_RENDER_WORKERS', DEFAULT_RENDER_WORKERS) or multiprocessing.parent_process():
+        return report_render.render(data, report_format, font)
+    pool = render_pool()
+    try:
+        return pool.submit(report_render.render, data, report_format, font).result()
+    except BrokenProcessPool:
+        # Следующий отчет создаст новый пул; этот повторит задача
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise
+
+
+def build_report(filterset, report_format, progress=None):
+    """Имя файла отчета в каталоге задач: готовый для текущей версии данных или построенный"""
+    # Версия читается раньше данных: запись между ними только пометит файл устаревшей версией,
+    # и он не будет выдан
+    name = cache_name(filterset, report_format, DataVersion.get(DataVersion.DATA))
+    path = file_path(name)
+    if path.exists():
+        return name
+    if progress:
+        progress('Запрос данных')
+    data = build_data(filterset)
+    if progress:
+        progress('Построение файла')
+    content = render(data, report_format)
+    # Через временный файл: одновременная задача с тем же отчетом не увидит недописанный
+    temporary = path.with_name(f'{path.name}.{uuid.uuid4().hex}.tmp')
+    temporary.write_bytes(content)
+    os.replace(temporary, path)
+    return name
+
+
+@handler('report')
+@read_only_view
+def report_job(context):
+    report_format = context.payload.get('format')
+    if report_format not in FORMATS:
+        raise ValueError(f'Неизвестный формат отчета: {report_format}')
+    filterset = TransactionFilterSet(QueryDict(context.payload.get('query', '')))
+    name = build_report(filterset, report_format, progress=lambda message: context.progress(0, message=message, force=True))
+    return {
+        'file': name,
+        'filename': download_name(filterset, report_format),
+        'content_type': FORMATS[report_format][0],
+    }
@@ -0,0 +1,72 @@
+"""
+Маршрутизация запросов между соединениями на запись и на чтение.
+
+Представления, помеченные read_only_view, читают через отдельное соединение
+(DATABASES['replica'] - тот же файл SQLite, открытый с query_only). В режиме
+WAL такие чтения не конкурируют с записью. Все остальное, а также любое
+чтение внутри открытой транзакции на запись, идет в default: иначе запрос
+не увидел бы еще не зафиксированные изменения.
+"""
+import contextvars
+import functools
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+READ_ALIAS = 'replica'
+
+_read_only = contextvars.ContextVar('read_only_view', default=False)
+
+
+def read_alias():
+    return READ_ALIAS if READ_ALIAS in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+def snapshot_alias():
+    """
+    Соединение для согласованного чтения нескольких таблиц в одной транзакции:
+    внутри транзакции на запись - default, иначе replica (BEGIN DEFERRED
+    без блокировки записи, в WAL - один снимок базы).
+    """
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    return read_alias()
+
+
+def read_only_view(view):
+    """Помечает представление как только читающее (для синхронных и async)"""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            token = _read_only.set(True)
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                _read_only.reset(token)
+    else:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            token = _read_only.set(True)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                _read_only.reset(token)
+    return wrapper
+
+
+class ReadWriteRouter:
+    def db_for_read(self, model, **hints):
+        if not _read_only.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Оба псевдонима указывают на одну базу
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,61 @@
+"""
+Полнотекстовый поиск по комментариям транзакций (SQLite FTS5).
+
+Запрос пользователя разбирается на слова; каждое слово ищется как префикс
+("рекл" находит "Реклама"), все слова должны встретиться в комментарии.
+Синтаксис FTS5 (кавычки, OR, NEAR, *) из ввода не пропускается - слова
+передаются в MATCH только в кавычках, поэтому ошибочный ввод не ломает запрос.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import F, Q
+
+from .models import Transaction, TransactionSearch
+
+WORD_RE = re.compile(r'\w+')
+MAX_WORDS = 8
+
+
+def words(text):
+    """Слова запроса в нижнем регистре, без повторов, в исходном порядке"""
+    result = []
+    for word in WORD_RE.findall(text.lower()):
+        if word not in result:
+            result.append(word)
+    return result[:MAX_WORDS]
+
+
+def match_expression(text):
+    """Выражение для MATCH: каждое слово - префикс, все слова обязательны"""
+    return ' '.join(f'"{word}"*' for word in words(text))
+
+
+def fts_available(using=None):
+    alias = using or router.db_for_read(Transaction)
+    return connections[alias].vendor == 'sqlite'
+
+
+def search_q(text, using=None):
+    """
+    Условие для Transaction. MATCH стоит в подзапросе: так условие можно
+    использовать и в filter(), и в агрегатах с filter= (статистика).
+    """
+    if not fts_available(using):
+        condition = Q()
+        for word in words(text):
+            condition &= Q(comment__icontains=word)
+        return condition
+    matches = TransactionSearch.objects.filter(comment__match=match_expression(text))
+    return Q(id__in=matches.values('transaction_id'))
+
+
+def ranked(queryset, text):
+    """Совпадения по релевантности (bm25), при равной - сначала новые"""
+    if not words(text):
+        return queryset.none()
+    if not fts_available(queryset.db):
+        return queryset.filter(search_q(text, queryset.db)).order_by('-created_date', '-id')
+    return queryset.filter(search__comment__match=match_expression(text)).annotate(
+        rank=F('search__rank'),
+    ).order_by('rank', '-id')
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+
+from .balances import invalidate_snapshots
+from .hierarchy import invalidate_hierarchy
+from .models import DataVersion, Status, Type, Category, Subcategory
+
+
+def dictionary_changed(sender, **kwargs):
+    # Сигналы приходят и для каскадных удалений (тип → категории → подкатегории)
+    invalidate_hierarchy()
+    # Названия справочников видны в списке транзакций
+    DataVersion.bump(DataVersion.DATA)
+    # Поступления и списания определяются по названиям типов - снимки остатков пересчитываем
+    invalidate_snapshots()
+
+
+for model in (Status, Type, Category, Subcategory):
+    post_save.connect(dictionary_changed, sender=model, dispatch_uid=f'hierarchy_{model.__name__}_save')
+    post_delete.connect(dictionary_changed, sender=model, dispatch_uid=f'hierarchy_{model.__name__}_delete')
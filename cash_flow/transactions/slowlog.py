@@ -0,0 +1,232 @@
+"""
+Журнал медленных SQL-запросов в памяти процесса.
+
+Обертка execute_wrapper (ставится на каждое подключение, как и сбор метрик)
+замеряет каждый запрос; все, что дольше SLOW_QUERY_THRESHOLD_MS, попадает
+в кольцевой буфер последних SLOW_QUERY_LOG_SIZE записей с представлением,
+из которого пришел запрос, параметрами и временем. Запросы сводятся по отпечатку -
+тексту SQL без литералов и параметров, - и для каждого отпечатка один раз
+снимается план (EXPLAIN QUERY PLAN в SQLite) на том же подключении.
+Сводка по отпечаткам отсортирована по суммарному времени: наверху то,
+что дороже всего обходится в целом, а не самый долгий единичный запрос.
+"""
+import datetime
+import hashlib
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.backends.signals import connection_created
+
+from .metrics import current_view
+
+DEFAULT_THRESHOLD_MS = 100
+DEFAULT_LOG_SIZE = 500
+# Вне запроса (команды, фоновые задачи)
+NO_VIEW = '-'
+
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDERS = re.compile(r'%s|\?')
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACES = re.compile(r'\s+')
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+# Запросы самого журнала (точки сохранения вокруг EXPLAIN) не записываются
+_explaining = ContextVar('slowlog_explaining', default=False)
+
+
+def normalize(sql):
+    """SQL без литералов и параметров: списки IN (...) и VALUES любой длины сводятся к одному виду"""
+    sql = _STRINGS.sub('?', sql)
+    sql = _NUMBERS.sub('?', sql)
+    sql = _PLACEHOLDERS.sub('?', sql)
+    sql = _LISTS.sub('(...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def digest(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+def fingerprint(sql):
+    return digest(normalize(sql))
+
+
+def redact(params):
+    """Параметры без значений - только типы"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: f'<{type(value).__name__}>' for key, value in params.items()}
+    return tuple(f'<{type(value).__name__}>' for value in params)
+
+
+@dataclass(frozen=True)
+class SlowQuery:
+    at: datetime.datetime
+    alias: str
+    view: str
+    fingerprint: str
+    sql: str
+    params: object
+    duration_ms: float
+
+
+@dataclass
+class FingerprintStats:
+    fingerprint: str
+    normalized: str
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    views: Counter = field(default_factory=Counter)
+    # Строки плана; None - план еще не снят или запрос не SELECT
+    plan: tuple = None
+    explained: bool = False
+    last: SlowQuery = None
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+    @property
+    def top_views(self):
+        return self.views.most_common()
+
+
+class SlowQueryLog:
+    def __init__(self, size=None):
+        self._lock = threading.Lock()
+        self.reset(size)
+
+    def reset(self, size=None):
+        size = size or getattr(settings, 'SLOW_QUERY_LOG_SIZE', DEFAULT_LOG_SIZE)
+        with self._lock:
+            self.size = size
+            self._entries = deque(maxlen=size)
+            self._fingerprints = {}
+
+    def add(self, entry, normalized):
+        """Запоминает запрос; True - план для этого отпечатка еще не снимался (снимать вызывающему)"""
+        with self._lock:
+            self._entries.append(entry)
+            stats = self._fingerprints.get(entry.fingerprint)
+            if stats is None:
+                # Отпечатков не больше, чем записей в буфере: вытесняется самый дешевый
+                if len(self._fingerprints) >= self.size:
+                    cheapest = min(self._fingerprints.values(), key=lambda item: item.total_ms)
+                    del self._fingerprints[cheapest.fingerprint]
+                stats = self._fingerprints[entry.fingerprint] = FingerprintStats(entry.fingerprint, normalized)
+            stats.count += 1
+            stats.total_ms += entry.duration_ms
+            stats.max_ms = max(stats.max_ms, entry.duration_ms)
+            stats.views[entry.view] += 1
+            stats.last = entry
+            explain = not stats.explained
+            stats.explained = True
+            return explain
+
+    def set_plan(self, key, plan):
+        with self._lock:
+            stats = self._fingerprints.get(key)
+            if stats is not None:
+                stats.plan = plan
+
+    def entries(self):
+        """Последние записи, новые первыми"""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def summary(self):
+        """Отпечатки по убыванию суммарного времени"""
+        with self._lock:
+            return sorted(self._fingerprints.values(), key=lambda item: item.total_ms, reverse=True)
+
+
+slow_log = SlowQueryLog()
+
+
+def threshold_ms():
+    return getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', DEFAULT_THRESHOLD_MS)
+
+
+def explain(connection, sql, params):
+    """План запроса на том же подключении; ошибка не должна ломать исходный запрос"""
+    sqlite = connection.vendor == 'sqlite'
+    prefix = 'EXPLAIN QUERY PLAN ' if sqlite else 'EXPLAIN '
+    # В PostgreSQL ошибка EXPLAIN прервала бы всю открытую транзакцию - нужна точка сохранения
+    savepoint = connection.in_atomic_block and not sqlite
+    token = _explaining.set(True)
+    try:
+        with transaction.atomic(using=connection.alias) if savepoint else nullcontext():
+            with connection.cursor() as cursor:
+                # Курсор драйвера в обход execute_wrappers: план не замеряется и не считается в метриках
+                cursor.cursor.execute(prefix + sql, params)
+                rows = cursor.cursor.fetchall()
+    except DatabaseError as exc:
+        return (f'План недоступен: {exc}',)
+    finally:
+        _explaining.reset(token)
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail) - отступ по глубине вложенности
+        depth = {0: -1}
+        lines = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node] + detail)
+        return tuple(lines)
+    return tuple(' '.join(str(value) for value in row) for row in rows)
+
+
+def record_slow_query(execute, sql, params, many, context):
+    threshold = threshold_ms()
+    if threshold is None or _explaining.get():
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration_ms = (time.perf_counter() - started) * 1000
+    if duration_ms < threshold:
+        return result
+
+    connection = context['connection']
+    normalized = normalize(sql)
+    key = digest(normalized)
+    if many:
+        # executemany: параметры - наборы строк, их может быть очень много
+        logged_params = None
+    elif getattr(settings, 'SLOW_QUERY_REDACT_PARAMS', True):
+        logged_params = redact(params)
+    else:
+        logged_params = params
+    entry = SlowQuery(
+        at=datetime.datetime.now(datetime.timezone.utc),
+        alias=connection.alias,
+        view=current_view() or NO_VIEW,
+        fingerprint=key,
+        sql=sql,
+        params=logged_params,
+        duration_ms=round(duration_ms, 3),
+    )
+    if slow_log.add(entry, normalized) and not many and _EXPLAINABLE.match(sql):
+        slow_log.set_plan(key, explain(connection, sql, params))
+    return result
+
+
+def instrument_connection(sender, connection, **kwargs):
+    if record_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_slow_query)
+
+
+def install():
+    """Подключает журнал ко всем подключениям (из AppConfig.ready)"""
+    from django.db import connections
+
+    connection_created.connect(instrument_connection, dispatch_uid='transactions_slowlog')
+    for connection in connections.all(initialized_only=True):
+        instrument_connection(None, connection)
@@ -1,64 +1,68 @@
-// AJAX функции для динамической загрузки категорий и подкатегорий
+// Зависимые списки категорий и подкатегорий в форме транзакции.
+// Дерево справочников загружается один раз (браузер кэширует его по ETag),
+// дальше списки фильтруются на клиенте без запросов к серверу.
 document.addEventListener('DOMContentLoaded', function() {
     const typeSelect = document.getElementById('id_type');
     const categorySelect = document.getElementById('id_category');
     const subcategorySelect = document.getElementById('id_subcategory');
 
-    // Загрузка категорий при изменении типа
-    if (typeSelect && categorySelect) {
-        typeSelect.addEventListener('change', function() {
-            const typeId = this.value;
-            if (typeId) {
-                loadCategories(typeId);
-            } else {
-                categorySelect.innerHTML = '<option value="">---------</option>';
-                subcategorySelect.innerHTML = '<option value="">---------</option>';
-            }
-        });
+    if (!typeSelect || !categorySelect || !subcategorySelect) {
+        return;
     }
 
-    // Загрузка подкатегорий при изменении категории
-    if (categorySelect && subcategorySelect) {
-        categorySelect.addEventListener('change', function() {
-            const categoryId = this.value;
-            if (categoryId) {
-                loadSubcategories(categoryId);
-            } else {
-                subcategorySelect.innerHTML = '<option value="">---------</option>';
-            }
+    const form = typeSelect.closest('form');
+    const hierarchyUrl = (form && form.dataset.hierarchyUrl) || '/ajax/hierarchy/';
+
+    // id типа -> категории, id категории -> подкатегории
+    const categoriesByType = new Map();
+    const subcategoriesByCategory = new Map();
+
+    function fillSelect(select, items, emptyLabel) {
+        const selected = select.value;
+        select.innerHTML = '';
+        const empty = document.createElement('option');
+        empty.value = '';
+        empty.textContent = emptyLabel;
+        select.appendChild(empty);
+        items.forEach(function(item) {
+            const option = document.createElement('option');
+            option.value = item.id;
+            option.textContent = item.name;
+            select.appendChild(option);
         });
+        // Сохраняем выбор, если он остался допустимым
+        select.value = items.some(item => String(item.id) === selected) ? selected : '';
     }
 
-    function loadCategories(typeId) {
-        fetch(`/ajax/load-categories/?type_id=${typeId}`)
-            .then(response => response.json())
-            .then(data => {
-                categorySelect.innerHTML = '<option value="">---------</option>';
-                data.forEach(function(category) {
-                    const option = document.createElement('option');
-                    option.value = category.id;
-                    option.textContent = category.name;
-                    categorySelect.appendChild(option);
-                });
-                
-                // Сброс подкатегорий
-                subcategorySelect.innerHTML = '<option value="">---------</option>';
-            })
-            .catch(error => console.error('Error loading categories:', error));
+    function updateCategories() {
+        const categories = categoriesByType.get(typeSelect.value) || [];
+        fillSelect(categorySelect, categories, typeSelect.value ? '---------' : 'Сначала выберите тип');
+        updateSubcategories();
     }
 
-    function loadSubcategories(categoryId) {
-        fetch(`/ajax/load-subcategories/?category_id=${categoryId}`)
-            .then(response => response.json())
-            .then(data => {
-                subcategorySelect.innerHTML = '<option value="">---------</option>';
-                data.forEach(function(subcategory) {
-                    const option = document.createElement('option');
-                    option.value = subcategory.id;
-                    option.textContent = subcategory.name;
-                    subcategorySelect.appendChild(option);
-                });
-            })
-            .catch(error => console.error('Error loading subcategories:', error));
+    function updateSubcategories() {
+        const subcategories = subcategoriesByCategory.get(categorySelect.value) || [];
+        fillSelect(
+            subcategorySelect, subcategories,
+            categorySelect.value ? '---------' : 'Сначала выберите категорию'
+        );
     }
-});
\ No newline at end of file
+
+    fetch(hierarchyUrl, {credentials: 'same-origin'})
+        .then(response => response.json())
+        .then(tree => {
+            tree.types.forEach(function(type) {
+                categoriesByType.set(String(type.id), type.categories);
+                type.categories.forEach(function(category) {
+                    subcategoriesByCategory.set(String(category.id), category.subcategories);
+                });
+            });
+
+            typeSelect.addEventListener('change', updateCategories);
+            categorySelect.addEventListener('change', updateSubcategories);
+
+            // Тип могли сменить до загрузки дерева; допустимый выбор сохранится
+            updateCategories();
+        })
+        .catch(error => console.error('Error loading hierarchy:', error));
+});
@@ -0,0 +1,200 @@
+"""
+Статистика по транзакциям: общие и отфильтрованные итоги, топ категорий.
+
+Итоги считаются одним запросом с условной агрегацией по id типов,
+которые берутся из кэша справочников, без JOIN к таблице типов.
+По умолчанию источник - дневные сводки DailyRollup.
+"""
+import asyncio
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+
+from .hierarchy import get_hierarchy
+from .models import DailyRollup, Transaction
+
+INCOME_TYPE = 'Пополнение'
+EXPENSE_TYPE = 'Списание'
+
+
+def money(value):
+    """Сумма строкой с копейками: SQLite возвращает SUM без масштаба (10 вместо 10.00)"""
+    return f'{value:.2f}'
+
+
+@dataclass(frozen=True)
+class Totals:
+    count: int
+    income: Decimal
+    expense: Decimal
+
+    @property
+    def balance(self):
+        return self.income - self.expense
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'income': money(self.income),
+            'expense': money(self.expense),
+            'balance': money(self.balance),
+        }
+
+
+@dataclass(frozen=True)
+class CategoryTotal:
+    category_id: int
+    category_name: str
+    type_id: int
+    type_name: str
+    amount: Decimal
+    count: int
+
+    @property
+    def is_income(self):
+        return self.type_name == INCOME_TYPE
+
+    def as_dict(self):
+        return {
+            'category_id': self.category_id,
+            'category': self.category_name,
+            'type_id': self.type_id,
+            'type': self.type_name,
+            'amount': money(self.amount),
+            'count': self.count,
+        }
+
+
+@dataclass(frozen=True)
+class StatsResult:
+    overall: Totals
+    filtered: Totals
+    categories: tuple
+
+    def as_dict(self):
+        return {
+            'overall': self.overall.as_dict(),
+            'filtered': self.filtered.as_dict(),
+            'categories': [item.as_dict() for item in self.categories],
+        }
+
+
+class TransactionStats:
+    """
+    Сервис статистики. filters - условие Q по полям Transaction;
+    DailyRollup использует те же имена полей, поэтому условие подходит
+    обоим источникам. Источник строк (use_rollup=False) нужен для условий,
+    которых нет в сводке.
+    """
+
+    def __init__(self, filters=None, hierarchy=None, use_rollup=True, top_limit=10):
+        self.filters = filters if filters is not None else Q()
+        self.hierarchy = hierarchy or get_hierarchy()
+        self.use_rollup = use_rollup
+        self.top_limit = top_limit
+        self.income_ids = self.hierarchy.type_ids(INCOME_TYPE)
+        self.expense_ids = self.hierarchy.type_ids(EXPENSE_TYPE)
+
+    @classmethod
+    def for_filters(cls, filterset, engine=None, **kwargs):
+        """
+        Статистика по FilterSet; фильтры по сумме считаются по строкам, а не по сводке.
+        engine='columnar' - по колоночной копии в памяти (columnar.py), если установлен
+        numpy и фильтры выражаются через ее колонки; иначе SQL.
+        По умолчанию engine берется из settings.TRANSACTION_STATS_ENGINE.
+        """
+        engine = engine or getattr(settings, 'TRANSACTION_STATS_ENGINE', 'sql')
+        if engine == 'columnar':
+            from . import columnar
+            if columnar.available() and columnar.supports(filterset):
+                return columnar.ColumnarStats(
+                    filterset, hierarchy=kwargs.get('hierarchy'), top_limit=kwargs.get('top_limit', 10),
+                )
+        kwargs.setdefault('use_rollup', filterset.bucket_only)
+        return cls(filterset.condition, **kwargs)
+
+    @property
+    def queryset(self):
+        model = DailyRollup if self.use_rollup else Transaction
+        return model.objects.order_by()
+
+    def _count(self, condition=None):
+        if self.use_rollup:
+            return Sum('count', filter=condition)
+        return Count('id', filter=condition)
+
+    def _sum(self, type_ids, condition=None):
+        if not type_ids:
+            return None
+        type_condition = Q(type_id__in=type_ids)
+        if condition is not None:
+            type_condition &= condition
+        return Sum('amount', filter=type_condition)
+
+    def _totals_expressions(self):
+        condition = self.filters if self.filters else None
+        expressions = {
+            'overall_count': self._count(),
+            'overall_income': self._sum(self.income_ids),
+            'overall_expense': self._sum(self.expense_ids),
+        }
+        if condition is not None:
+            expressions.update({
+                'filtered_count': self._count(condition),
+                'filtered_income': self._sum(self.income_ids, condition),
+                'filtered_expense': self._sum(self.expense_ids, condition),
+            })
+        return {name: expression for name, expression in expressions.items() if expression is not None}
+
+    def _build_totals(self, row):
+        def totals(prefix):
+            return Totals(
+                count=row.get(f'{prefix}_count') or 0,
+                income=row.get(f'{prefix}_income') or Decimal('0'),
+                expense=row.get(f'{prefix}_expense') or Decimal('0'),
+            )
+
+        overall = totals('overall')
+        return overall, totals('filtered') if self.filters else overall
+
+    def totals(self):
+        """Общие и отфильтрованные итоги за один запрос"""
+        return self._build_totals(self.queryset.aggregate(**self._totals_expressions()))
+
+    async def atotals(self):
+        return self._build_totals(await self.queryset.aaggregate(**self._totals_expressions()))
+
+    def _top_categories_query(self):
+        return self.queryset.filter(self.filters).values('category_id', 'type_id').annotate(
+            total_amount=Sum('amount'),
+            total_count=self._count(),
+        ).order_by('-total_amount')[:self.top_limit]
+
+    def _build_category(self, row):
+        category = self.hierarchy.category(row['category_id'])
+        type_ = self.hierarchy.type(row['type_id'])
+        return CategoryTotal(
+            category_id=row['category_id'],
+            category_name=category.name if category else '',
+            type_id=row['type_id'],
+            type_name=type_.name if type_ else '',
+            amount=row['total_amount'] or Decimal('0'),
+            count=row['total_count'] or 0,
+        )
+
+    def top_categories(self):
+        return tuple(self._build_category(row) for row in self._top_categories_query())
+
+    async def atop_categories(self):
+        return tuple([self._build_category(row) async for row in self._top_categories_query()])
+
+    def compute(self):
+        overall, filtered = self.totals()
+        return StatsResult(overall=overall, filtered=filtered, categories=self.top_categories())
+
+    async def acompute(self):
+        """Асинхронный compute: итоги и топ категорий запрашиваются одновременно"""
+        (overall, filtered), categories = await asyncio.gather(self.atotals(), self.atop_categories())
+        return StatsResult(overall=overall, filtered=filtered, categories=categories)
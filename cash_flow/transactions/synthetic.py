@@ -0,0 +1,114 @@
+"""
+Синтетические транзакции для замеров производительности.
+
+Строки строятся по существующим справочникам: подкатегория задает категорию
+и тип, поэтому иерархия всегда согласована. Популярность подкатегорий
+и статусов подчиняется закону Ципфа (skew): несколько записей встречаются
+часто, остальные - редко, как в реальном учете. recent_bias смещает даты
+к концу периода. Запись идет через bulk_create пакетами, так что сводки,
+счетчики и поисковый индекс заполняются тем же путем, что и при импорте.
+"""
+import datetime
+import itertools
+import math
+import random
+import time
+from dataclasses import dataclass
+
+from .hierarchy import get_hierarchy
+from .models import Transaction
+from .money import from_kopecks
+from .stats import INCOME_TYPE
+
+# Медиана и разброс (логнормальное распределение) сумм в копейках
+INCOME_AMOUNT = (math.log(4_000_000), 0.8)
+EXPENSE_AMOUNT = (math.log(150_000), 1.2)
+MAX_KOPECKS = 10 ** 13 - 1
+COMMENT_WORDS = (
+    'оплата', 'счет', 'договор', 'аванс', 'возврат', 'реклама', 'сервер', 'домен',
+    'продление', 'поставщик', 'клиент', 'заказ', 'доставка', 'такси', 'аренда',
+    'подписка', 'налог', 'премия', 'перевод', 'комиссия', 'ежемесячно', 'сентябрь',
+)
+
+
+def zipf_cum_weights(count, skew):
+    """Накопленные веса 1/rank**skew для choices(cum_weights=...)"""
+    return list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+@dataclass
+class GenerationResult:
+    created: int
+    elapsed: float
+
+    @property
+    def rows_per_second(self):
+        return self.created / self.elapsed if self.elapsed else 0
+
+
+class TransactionGenerator:
+    def __init__(self, start, end, skew=1.1, recent_bias=0.0, comment_ratio=0.3, seed=None, hierarchy=None):
+        if end < start:
+            raise ValueError('Конец периода раньше начала')
+        hierarchy = hierarchy or get_hierarchy()
+        self.rng = random.Random(seed)
+        self.start = start
+        self.comment_ratio = comment_ratio
+
+        # Порядок популярности случаен, но воспроизводим при одном seed
+        leaves = [
+            (item.id, item.category.id, item.category.type.id, item.category.type.name == INCOME_TYPE)
+            for item in hierarchy.subcategories
+        ]
+        statuses = [item.id for item in hierarchy.statuses]
+        if not leaves or not statuses:
+            raise ValueError('Справочники пусты: нужны статусы и подкатегории')
+        self.rng.shuffle(leaves)
+        self.rng.shuffle(statuses)
+        self.leaves, self.leaf_weights = leaves, zipf_cum_weights(len(leaves), skew)
+        self.statuses, self.status_weights = statuses, zipf_cum_weights(len(statuses), skew)
+
+        days = (end - start).days + 1
+        self.days = range(days)
+        # Вес дня растет к концу периода: (1 + day/days) ** recent_bias
+        self.day_weights = list(itertools.accumulate((1 + day / days) ** recent_bias for day in self.days))
+
+    def amount(self, income):
+        mu, sigma = INCOME_AMOUNT if income else EXPENSE_AMOUNT
+        kopecks = int(self.rng.lognormvariate(mu, sigma))
+        return from_kopecks(min(max(kopecks, 1), MAX_KOPECKS))
+
+    def comment(self):
+        if self.rng.random() >= self.comment_ratio:
+            return None
+        return ' '.join(self.rng.sample(COMMENT_WORDS, self.rng.randint(1, 4)))
+
+    def rows(self, count):
+        """count несохраненных Transaction"""
+        leaves = self.rng.choices(self.leaves, cum_weights=self.leaf_weights, k=count)
+        statuses = self.rng.choices(self.statuses, cum_weights=self.status_weights, k=count)
+        days = self.rng.choices(self.days, cum_weights=self.day_weights, k=count)
+        return [
+            Transaction(
+                created_date=self.start + datetime.timedelta(days=day),
+                status_id=status_id,
+                type_id=type_id,
+                category_id=category_id,
+                subcategory_id=subcategory_id,
+                amount=self.amount(income),
+                comment=self.comment(),
+            )
+            for (subcategory_id, category_id, type_id, income), status_id, day in zip(leaves, statuses, days)
+        ]
+
+    def generate(self, count, batch_size=5000, progress=None):
+        """Сохраняет count строк пакетами; каждый пакет - отдельная транзакция БД (bulk_create)"""
+        started = time.perf_counter()
+        created = 0
+        while created < count:
+            rows = self.rows(min(batch_size, count - created))
+            Transaction.objects.bulk_create(rows, batch_size=batch_size)
+            created += len(rows)
+            if progress:
+                progress(GenerationResult(created, time.perf_counter() - started))
+        return GenerationResult(created, time.perf_counter() - started)
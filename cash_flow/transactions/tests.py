@@ -1,3 +1,1751 @@
-from django.test import TestCase
+import datetime
+import importlib.util
+import io
+import itertools
+import json
+import os
+import re
+import tempfile
+import unittest
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, models, router
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import QueryDict
+from django.contrib.auth.models import User
+from django.test import Client, TestCase as DjangoTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .balances import Balances
+from .benchmarks import ScenarioResult, compare, percentile
+from .bookkeeping import rebuild_rollups, rebuild_usage, verify_rollups, verify_usage
+from . import columnar
+from .exporters import TransactionExporter
+from .hierarchy import Hierarchy, get_hierarchy, get_usage, reset_usage
+from .importers import ImportFileError, TransactionImporter, import_file, read_csv
+from . import jobs
+from .metrics import registry as metrics_registry
+from .merge import merge
+from .filters import TransactionFilterSet
+from .forms import TransactionForm
+from .fragments import counters as fragment_counters
+from .models import BucketChange, DataVersion, Job, Transaction, DailyRollup, PeriodSnapshot, Status, Type, Category, Subcategory
+from .routers import read_only_view
+from .search import match_expression, ranked
+from . import slowlog
+from .synthetic import TransactionGenerator
+from .pagination import CursorPaginator, InvalidCursor, decode_cursor, encode_cursor
+from . import report_render, reports
+from .stats import TransactionStats
+
+
+class TestCase(DjangoTestCase):
+    """Данные откатываются после каждого теста, а кэши в памяти общие - очищаем их"""
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        cache.clear()
+        fragment_counters.reset()
+        columnar.reset_store()
+        reset_usage()
+        slowlog.slow_log.reset()
+
+
+def create_transactions(count, start=datetime.date(2025, 1, 1), days=1, **overrides):
+    """Создает count транзакций по справочникам из начальной миграции"""
+    status = overrides.pop('status', None) or Status.objects.get(name='Бизнес')
+    type_ = overrides.pop('type', None) or Type.objects.get(name='Списание')
+    category = overrides.pop('category', None) or Category.objects.get(name='Маркетинг')
+    subcategory = overrides.pop('subcategory', None) or Subcategory.objects.get(name='Avito')
+    return Transaction.objects.bulk_create([
+        Transaction(
+            created_date=start + datetime.timedelta(days=(i % days) if days else 0),
+            status=status,
+            type=type_,
+            category=category,
+            subcategory=subcategory,
+            amount=overrides.get('amount', Decimal('10.00')),
+            comment=overrides.get('comment'),
+        )
+        for i in range(count)
+    ])
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        create_transactions(60, days=7)
+        self.queryset = Transaction.objects.all()
+        self.expected = list(self.queryset.order_by('-created_date', '-id'))
+
+    def test_cursor_round_trip(self):
+        token = encode_cursor('n', datetime.date(2025, 3, 1), 42)
+        self.assertEqual(decode_cursor(token), ('n', datetime.date(2025, 3, 1), 42))
+        with self.assertRaises(InvalidCursor):
+            decode_cursor('garbage!')
+
+    def test_walk_forward_and_back(self):
+        paginator = CursorPaginator(self.queryset, 25)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        third = paginator.page(second.next_cursor)
+
+        self.assertEqual(list(first) + list(second) + list(third), self.expected)
+        self.assertFalse(first.has_previous)
+        self.assertFalse(third.has_next)
+        self.assertEqual(list(paginator.page(third.previous_cursor)), list(second))
+        self.assertEqual(list(paginator.page(first.last_cursor)), self.expected[-25:])
+
+    def test_deep_page_does_not_use_offset_or_count(self):
+        paginator = CursorPaginator(self.queryset, 25)
+        cursor = paginator.page().next_cursor
+        with self.assertNumQueries(1) as ctx:
+            paginator.page(cursor)
+        sql = ctx.captured_queries[0]['sql'].upper()
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT(', sql)
+
+    def test_approximate_count_is_capped(self):
+        paginator = CursorPaginator(self.queryset, 25)
+        self.assertEqual(paginator.approximate_count(limit=10), (10, False))
+        self.assertEqual(paginator.approximate_count(limit=100), (60, True))
+
+    def test_list_view_keeps_filters_in_cursor_links(self):
+        status = Status.objects.get(name='Бизнес')
+        response = self.client.get(reverse('transaction_list'), {'status': status.pk})
+        page = response.context['page_obj']
+        self.assertContains(response, f'?cursor={page.next_cursor}&status={status.pk}')
+
+        response = self.client.get(
+            reverse('transaction_list'), {'status': status.pk, 'cursor': page.next_cursor}
+        )
+        self.assertEqual(list(response.context['page_obj']), self.expected[25:50])
+
+    def test_list_view_ignores_broken_cursor(self):
+        response = self.client.get(reverse('transaction_list'), {'cursor': '%%%'})
+        self.assertEqual(list(response.context['page_obj']), self.expected[:25])
+
+
+class QueryPlanTests(TestCase):
+    """
+    Каждое сочетание фильтров списка должно обслуживаться индексами:
+    без полного просмотра таблицы и без временного B-дерева для сортировки.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        statuses = list(Status.objects.all())
+        for i, subcategory in enumerate(Subcategory.objects.select_related('category__type')):
+            create_transactions(
+                20, days=200,
+                status=statuses[i % len(statuses)],
+                type=subcategory.category.type,
+                category=subcategory.category,
+                subcategory=subcategory,
+            )
+        subcategory = Subcategory.objects.select_related('category').first()
+        cls.params = {
+            'date_from': '2025-02-01',
+            'date_to': '2025-05-01',
+            'status': str(statuses[0].pk),
+            'type': str(subcategory.category.type_id),
+            'category': str(subcategory.category_id),
+            'subcategory': str(subcategory.pk),
+        }
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[3] for row in cursor.fetchall()]
+
+    def assert_plans_use_indexes(self, params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('transaction_list'), params)
+        self.assertEqual(response.status_code, 200)
+
+        indexes = {index.name for index in Transaction._meta.indexes}
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or '"transactions_transaction"' not in sql:
+                continue
+            for step in self.explain(sql):
+                with self.subTest(params=params, step=step):
+                    self.assertNotIn('TEMP B-TREE', step, sql)
+                    if 'transactions_transaction ' not in step + ' ':
+                        continue
+                    # С условием - поиск диапазона по составному индексу; без условий - обход
+                    # по индексу даты (постраничный, с LIMIT), но не по таблице
+                    if ' WHERE ' in sql:
+                        match = re.match(r'SEARCH transactions_transaction USING (?:COVERING )?INDEX (\w+) \(', step)
+                    else:
+                        match = re.match(r'SCAN transactions_transaction USING (?:COVERING )?INDEX (transaction_date_idx)$', step)
+                    self.assertIsNotNone(match, sql)
+                    self.assertIn(match.group(1), indexes)
+
+    def test_every_filter_combination(self):
+        for size in range(len(self.params) + 1):
+            for combination in itertools.combinations(self.params, size):
+                params = {name: self.params[name] for name in combination}
+                self.assert_plans_use_indexes(params)
+                params['cursor'] = encode_cursor('n', datetime.date(2025, 4, 1), 10 ** 6)
+                self.assert_plans_use_indexes(params)
+
+
+class DailyRollupTests(TestCase):
+    def setUp(self):
+        self.avito = Subcategory.objects.get(name='Avito')
+        self.smm = Subcategory.objects.get(name='SMM')
+
+    def rollup(self, **key):
+        return DailyRollup.objects.filter(**key).values_list('amount', 'count').first()
+
+    def test_create_edit_delete_keep_rollup_in_sync(self):
+        transaction = Transaction.objects.create(
+            created_date=datetime.date(2025, 3, 1),
+            status=Status.objects.get(name='Бизнес'),
+            type=self.avito.category.type,
+            category=self.avito.category,
+            subcategory=self.avito,
+            amount=Decimal('100.50'),
+        )
+        self.assertEqual(self.rollup(subcategory=self.avito), (Decimal('100.50'), 1))
+
+        # Перенос в другую корзину: старая пустеет и удаляется
+        transaction.subcategory = self.smm
+        transaction.created_date = datetime.date(2025, 3, 2)
+        transaction.amount = Decimal('7.25')
+        transaction.save()
+        self.assertIsNone(self.rollup(subcategory=self.avito))
+        self.assertEqual(self.rollup(subcategory=self.smm), (Decimal('7.25'), 1))
+
+        transaction.delete()
+        self.assertFalse(DailyRollup.objects.exists())
+
+    def test_queryset_operations_keep_rollup_in_sync(self):
+        create_transactions(30, days=5)
+        Transaction.objects.filter(created_date=datetime.date(2025, 1, 2)).update(
+            subcategory=self.smm, amount=Decimal('3.00'),
+        )
+        Transaction.objects.filter(created_date=datetime.date(2025, 1, 3)).delete()
+        Transaction.objects.filter(created_date=datetime.date(2025, 1, 4)).update(
+            amount=models.F('amount') * 2,
+        )
+        self.assertEqual(verify_rollups(), [])
+        self.assertEqual(DailyRollup.objects.aggregate(rows=models.Sum('count'))['rows'], 24)
+
+    def test_bulk_apply_for_many_buckets(self):
+        # Больше BULK_APPLY_THRESHOLD корзин: сводка пишется пакетным UPSERT
+        create_transactions(40, days=40)
+        create_transactions(40, days=40, amount=Decimal('1.00'))
+        Transaction.objects.filter(created_date__lt=datetime.date(2025, 1, 31)).delete()
+        self.assertEqual(verify_rollups(), [])
+        self.assertEqual(DailyRollup.objects.count(), 10)
+
+    def test_rebuild_and_verify_command(self):
+        create_transactions(10, days=3)
+        DailyRollup.objects.update(count=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', '--verify', stdout=io.StringIO())
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        call_command('rebuild_rollups', '--verify', stdout=io.StringIO())
+
+    def test_rebuild_records_corrected_buckets(self):
+        create_transactions(4, days=2)
+        DailyRollup.objects.filter(created_date=datetime.date(2025, 1, 2)).update(count=0)
+        version = DataVersion.get(DataVersion.DATA)
+        rebuild_rollups()
+        changes = BucketChange.objects.filter(version__gt=version)
+        self.assertEqual(list(changes.values_list('created_date', flat=True)), [datetime.date(2025, 1, 2)])
+        self.assertGreater(DataVersion.get(DataVersion.DATA), version)
+
+    def test_list_statistics_match_raw_rows(self):
+        create_transactions(12, days=4, amount=Decimal('2.50'))
+        income = Subcategory.objects.get(name='Премия')
+        create_transactions(
+            3, type=income.category.type, category=income.category, subcategory=income,
+            amount=Decimal('100.00'),
+        )
+        response = self.client.get(reverse('transaction_list'), {'date_to': '2025-01-02'})
+        context = response.context
+        self.assertEqual(context['total_transactions_count'], 15)
+        self.assertEqual(context['overall_income'], Decimal('300.00'))
+        self.assertEqual(context['overall_expense'], Decimal('30.00'))
+        self.assertEqual(context['filtered_count'], 9)
+        self.assertEqual(context['filtered_expense'], Decimal('15.00'))
+        self.assertEqual(context['filtered_balance'], Decimal('285.00'))
+
+
+class HierarchyCacheTests(TestCase):
+    DICTIONARY_TABLES = (
+        '"transactions_status"', '"transactions_type"',
+        '"transactions_category"', '"transactions_subcategory"',
+    )
+
+    def dictionary_queries(self, url, params=None):
+        get_hierarchy()  # прогрев кэша
+        get_usage()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [
+            query['sql'] for query in ctx.captured_queries
+            if query['sql'].split(' FROM ')[1].startswith(self.DICTIONARY_TABLES)
+        ]
+
+    def test_warm_pages_do_not_query_dictionaries(self):
+        create_transactions(3)
+        type_ = Type.objects.get(name='Списание')
+        category = Category.objects.get(name='Маркетинг')
+        for url, params in [
+            (reverse('transaction_list'), None),
+            (reverse('transaction_create'), None),
+            (reverse('transaction_edit', args=[Transaction.objects.first().pk]), None),
+            (reverse('dictionary_management'), None),
+            (reverse('ajax_load_categories'), {'type_id': type_.pk}),
+            (reverse('ajax_load_subcategories'), {'category_id': category.pk}),
+            (reverse('ajax_hierarchy'), None),
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(self.dictionary_queries(url, params), [])
+
+    def test_dictionary_changes_bump_version(self):
+        hierarchy = get_hierarchy()
+        type_ = Type.objects.get(name='Списание')
+        category = Category.objects.create(name='Связь', type=type_)
+        fresh = get_hierarchy()
+        self.assertGreater(fresh.version, hierarchy.version)
+        self.assertIn('Связь', [item.name for item in fresh.categories_for_type(type_.pk)])
+
+        # Каскадное удаление подкатегорий тоже сбрасывает кэш
+        Subcategory.objects.create(name='Мобильная', category=category)
+        category.delete()
+        self.assertNotIn('Мобильная', [item.name for item in get_hierarchy().subcategories])
+
+    def test_dictionaries_are_read_in_one_transaction(self):
+        version = DataVersion.get(DataVersion.HIERARCHY)
+        with CaptureQueriesContext(connection) as ctx:
+            Hierarchy.load(version)
+        statements = [query['sql'].split(' ')[0] for query in ctx.captured_queries]
+        # Внутри TestCase транзакция atomic() - точка сохранения вокруг всех четырех чтений
+        self.assertEqual(statements, ['SAVEPOINT', 'SELECT', 'SELECT', 'SELECT', 'SELECT', 'RELEASE'])
+
+    def test_hierarchy_endpoint_revalidates_by_etag(self):
+        url = reverse('ajax_hierarchy')
+        response = self.client.get(url)
+        tree = response.json()
+        self.assertIn('no-cache', response['Cache-Control'])
+        expense = next(item for item in tree['types'] if item['name'] == 'Списание')
+        marketing = next(item for item in expense['categories'] if item['name'] == 'Маркетинг')
+        self.assertIn({'id': Subcategory.objects.get(name='Avito').pk, 'name': 'Avito'}, marketing['subcategories'])
+
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+
+        Category.objects.create(name='Связь', type=Type.objects.get(name='Списание'))
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_form_validates_hierarchy_from_cache(self):
+        income = Category.objects.get(name='Зарплата')
+        expense_type = Type.objects.get(name='Списание')
+        form = TransactionForm(data={
+            'created_date': '2025-01-01',
+            'status': Status.objects.first().pk,
+            'type': expense_type.pk,
+            'category': income.pk,
+            'subcategory': income.subcategory_set.first().pk,
+            'amount': '10.00',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('category', form.errors)
+
+    def test_form_choices_carry_parents_without_queries(self):
+        avito = Subcategory.objects.select_related('category__type').get(name='Avito')
+        hierarchy = get_hierarchy()
+        form = TransactionForm(data={
+            'created_date': '2025-01-01',
+            'status': Status.objects.first().pk,
+            'type': avito.category.type_id,
+            'category': avito.category_id,
+            'subcategory': avito.pk,
+            'amount': '10.00',
+        }, hierarchy=hierarchy)
+        self.assertTrue(form.is_valid(), form.errors)
+        with self.assertNumQueries(0):
+            category = form.cleaned_data['category']
+            subcategory = form.cleaned_data['subcategory']
+            self.assertEqual(category.type_id, avito.category.type_id)
+            self.assertEqual(category.type.name, 'Списание')
+            self.assertEqual(subcategory.category.type.name, 'Списание')
+
+
+class TransactionStatsTests(TestCase):
+    def setUp(self):
+        create_transactions(12, days=4, amount=Decimal('2.50'))
+        salary = Subcategory.objects.get(name='Премия')
+        create_transactions(
+            3, type=salary.category.type, category=salary.category, subcategory=salary,
+            amount=Decimal('100.00'),
+        )
+        self.filters = models.Q(created_date__lte='2025-01-02')
+
+    def test_totals_and_categories_in_two_queries(self):
+        hierarchy = get_hierarchy()
+        with self.assertNumQueries(2):
+            result = TransactionStats(self.filters, hierarchy=hierarchy).compute()
+        self.assertEqual(result.overall.count, 15)
+        self.assertEqual(result.overall.balance, Decimal('270.00'))
+        self.assertEqual(result.filtered.count, 9)
+        self.assertEqual(result.filtered.expense, Decimal('15.00'))
+        self.assertEqual(
+            [(item.category_name, item.amount) for item in result.categories],
+            [('Зарплата', Decimal('300.00')), ('Маркетинг', Decimal('15.00'))],
+        )
+
+    def test_totals_do_not_join_type_table(self):
+        with CaptureQueriesContext(connection) as ctx:
+            TransactionStats(self.filters).totals()
+        self.assertNotIn('"transactions_type"', ctx.captured_queries[-1]['sql'])
+
+    def test_rollup_and_row_sources_agree(self):
+        for filters in (None, self.filters):
+            self.assertEqual(
+                TransactionStats(filters).compute(),
+                TransactionStats(filters, use_rollup=False).compute(),
+            )
+
+    def test_async_compute_matches_sync(self):
+        for filters in (None, self.filters):
+            stats = TransactionStats(filters)
+            self.assertEqual(async_to_sync(stats.acompute)(), stats.compute())
+
+
+class AsyncViewTests(TestCase):
+    async def test_async_read_views(self):
+        await sync_to_async(create_transactions)(30, days=3)
+        marketing = await Category.objects.aget(name='Маркетинг')
+
+        response = await self.async_client.get(reverse('ajax_load_subcategories'), {'category_id': marketing.pk})
+        self.assertEqual([item['name'] for item in json.loads(response.content)], ['Avito', 'Farpost', 'SMM', 'Контекстная реклама'])
+
+        response = await self.async_client.get(reverse('transaction_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_transactions_count'], 30)
+        self.assertEqual(len(response.context['transactions']), 25)
+
+        next_cursor = response.context['page_obj'].next_cursor
+        response = await self.async_client.get(reverse('transaction_list'), {'cursor': next_cursor})
+        self.assertEqual(len(response.context['transactions']), 5)
+
+
+STATEMENT_CSV = """Дата;Статус;Тип;Категория;Подкатегория;Сумма;Комментарий
+01.02.2025;Бизнес;Списание;Маркетинг;Avito;1 200,50;Реклама
+2025-02-02;Личное;Пополнение;Зарплата;Премия;50000;
+2025-02-03;Личное;Пополнение;Маркетинг;Avito;10;категория не того типа
+2025-02-04;Бизнес;Списание;Маркетинг;Avito;-5;
+"""
+
+
+class ImportTests(TestCase):
+    def test_importer_validates_rows_and_keeps_rollup(self):
+        rows = read_csv(io.StringIO(STATEMENT_CSV))
+        result = TransactionImporter(batch_size=1, chunk_size=1).run(rows)
+
+        self.assertEqual((result.processed, result.created, result.error_count), (4, 2, 2))
+        self.assertEqual([line for line, message in result.errors], [4, 5])
+        self.assertEqual(
+            sorted(Transaction.objects.values_list('amount', flat=True)),
+            [Decimal('1200.50'), Decimal('50000.00')],
+        )
+        self.assertEqual(verify_rollups(), [])
+
+    def test_import_command_dry_run(self):
+        path = self.tmp_file(STATEMENT_CSV)
+        out = io.StringIO()
+        call_command('import_transactions', path, '--dry-run', stdout=out, stderr=io.StringIO())
+        self.assertIn('Обработано строк: 4, добавлено: 0, ошибок: 2', out.getvalue())
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_upload_view(self):
+        upload = SimpleUploadedFile('statement.csv', STATEMENT_CSV.encode())
+        response = self.client.post(reverse('transaction_import'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 2)
+        self.assertContains(response, 'Строка 4')
+
+    def test_wrong_encoding_is_reported(self):
+        upload = SimpleUploadedFile('statement.csv', STATEMENT_CSV.encode('cp1251'))
+        response = self.client.post(reverse('transaction_import'), {'file': upload}, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'не в кодировке UTF-8')
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_read_error_after_committed_chunks_names_them(self):
+        # Ошибка кодировки далеко от начала: первые порции уже вставлены
+        good = STATEMENT_CSV.splitlines()[1] + '\n'
+        content = (STATEMENT_CSV.splitlines()[0] + '\n' + good * 300).encode() + 'Бизнес'.encode('cp1251')
+        with self.assertRaisesMessage(ImportFileError, 'До ошибки добавлено записей: 200'):
+            import_file(io.BytesIO(content), 'statement.csv', chunk_size=100)
+
+    def test_broken_xlsx_is_reported(self):
+        upload = SimpleUploadedFile('statement.xlsx', b'PK\x03\x04 not a workbook')
+        response = self.client.post(reverse('transaction_import'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        expected = 'поврежден' if importlib.util.find_spec('openpyxl') else 'openpyxl'
+        self.assertContains(response, expected)
+        with self.assertRaises(CommandError):
+            call_command('import_transactions', self.tmp_file('garbage', suffix='.xlsx'), stdout=io.StringIO())
+
+    def tmp_file(self, content, suffix='.csv'):
+        handle = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8')
+        with handle:
+            handle.write(content)
+        self.addCleanup(os.unlink, handle.name)
+        return handle.name
+
+
+class ExportTests(TestCase):
+    def export(self, **params):
+        response = self.client.get(reverse('transaction_export'), params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_export_honours_list_filters(self):
+        create_transactions(10, days=5)
+        smm = Subcategory.objects.get(name='SMM')
+        create_transactions(3, subcategory=smm, amount=Decimal('7.00'))
+        params = {'date_from': '2025-01-01', 'date_to': '2025-01-01', 'subcategory': str(smm.pk)}
+
+        content = self.export(**params)
+        lines = content.lstrip('\ufeff').splitlines()
+        self.assertEqual(lines[0].split(';')[:3], ['ID', 'Дата', 'Статус'])
+        self.assertEqual(len(lines) - 1, 3)
+        self.assertTrue(all(';SMM;7.00;' in line for line in lines[1:]))
+
+        listed = self.client.get(reverse('transaction_list'), params).context['filtered_count']
+        self.assertEqual(listed, 3)
+
+    async def test_asgi_export_streams_asynchronously(self):
+        await sync_to_async(create_transactions)(5)
+        response = await self.async_client.get(reverse('transaction_export'), {'format': 'jsonl'})
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode('utf-8')
+        self.assertEqual(len(content.splitlines()), 5)
+
+    def test_jsonl_export_streams_in_chunks_without_joins(self):
+        create_transactions(25)
+        exporter = TransactionExporter(chunk_size=10)
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(exporter.jsonl())
+        self.assertEqual(len(chunks), 3)
+        records = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+        self.assertEqual(len(records), 25)
+        self.assertEqual(records[0]['subcategory'], 'Avito')
+        self.assertFalse(any('JOIN' in query['sql'] for query in queries.captured_queries))
+
+    def test_csv_export_can_be_imported_back(self):
+        create_transactions(4, days=2, comment='тест')
+        content = self.export()
+        Transaction.objects.all().delete()
+        result = TransactionImporter().run(read_csv(io.StringIO(content.lstrip('\ufeff'))))
+        self.assertEqual((result.created, result.error_count), (4, 0))
+        self.assertEqual(verify_rollups(), [])
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.avito = Subcategory.objects.get(name='Avito')
+        self.payload = {
+            'created_date': '2025-02-01',
+            'status': Status.objects.get(name='Бизнес').pk,
+            'type': self.avito.category.type_id,
+            'category': self.avito.category_id,
+            'subcategory': self.avito.pk,
+            'amount': '150.00',
+            'comment': 'api',
+        }
+
+    def send(self, method, name, data, **kwargs):
+        return getattr(self.client, method)(
+            reverse(name, kwargs=kwargs), json.dumps(data), content_type='application/json',
+        )
+
+    def test_list_uses_filters_and_cursor(self):
+        create_transactions(5, days=5)
+        url = reverse('api_transactions')
+        response = self.client.get(url, {'limit': 2, 'date_from': '2025-01-02'})
+        data = response.json()
+        self.assertEqual([row['created_date'] for row in data['results']], ['2025-01-05', '2025-01-04'])
+        self.assertEqual(data['results'][0]['subcategory'], self.avito.pk)
+
+        seen = [row['id'] for row in data['results']]
+        while data['next_cursor']:
+            data = self.client.get(url, {
+                'limit': 2, 'date_from': '2025-01-02', 'cursor': data['next_cursor'],
+            }).json()
+            seen += [row['id'] for row in data['results']]
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(self.client.get(url, {'cursor': 'мусор'}).status_code, 400)
+
+    def test_create_update_delete(self):
+        response = self.send('post', 'api_transactions', self.payload)
+        self.assertEqual(response.status_code, 201)
+        pk = response.json()['id']
+
+        response = self.send('patch', 'api_transaction_detail', {'amount': '99.90'}, pk=pk)
+        self.assertEqual(response.json()['amount'], '99.90')
+        self.assertEqual(response.json()['comment'], 'api')
+
+        response = self.send('put', 'api_transaction_detail', {**self.payload, 'amount': '-1'}, pk=pk)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('amount', response.json()['errors'])
+
+        self.assertEqual(self.client.delete(reverse('api_transaction_detail', args=[pk])).status_code, 204)
+        self.assertEqual(self.client.get(reverse('api_transaction_detail', args=[pk])).status_code, 404)
+        self.assertEqual(verify_rollups(), [])
+
+    @override_settings(API_TOKENS=['s3cret'])
+    def test_writes_need_token_or_csrf_header(self):
+        client = Client(enforce_csrf_checks=True)
+        url, body = reverse('api_transactions'), json.dumps(self.payload)
+        self.assertEqual(client.post(url, body, content_type='application/json').status_code, 403)
+        self.assertEqual(client.post(
+            url, body, content_type='application/json', HTTP_AUTHORIZATION='Bearer wrong',
+        ).status_code, 403)
+        self.assertFalse(Transaction.objects.exists())
+
+        response = client.post(url, body, content_type='application/json', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 201)
+
+        # Страница с формой выдает cookie csrftoken; скрипт страницы передает его в заголовке
+        client.get(reverse('transaction_create'))
+        token = client.cookies['csrftoken'].value
+        response = client.delete(
+            reverse('api_transaction_detail', args=[response.json()['id']]), HTTP_X_CSRFTOKEN=token,
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(client.get(url).status_code, 200)
+
+    def test_batch_create_is_all_or_nothing(self):
+        smm = Subcategory.objects.get(name='SMM')
+        items = [dict(self.payload, amount=str(index + 1)) for index in range(300)]
+        broken = items + [dict(self.payload, subcategory=Subcategory.objects.get(name='Премия').pk)]
+        response = self.send('post', 'api_transactions_batch', {'transactions': broken})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [300])
+        self.assertFalse(Transaction.objects.exists())
+
+        items.append(dict(self.payload, subcategory=smm.pk))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.send('post', 'api_transactions_batch', items)
+        inserts = [query for query in queries.captured_queries
+                   if query['sql'].startswith('INSERT INTO "transactions_transaction"')]
+        self.assertLessEqual(len(inserts), 3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 301)
+        self.assertEqual(verify_rollups(), [])
+
+    def test_stats(self):
+        create_transactions(4, amount=Decimal('2.50'))
+        data = self.client.get(reverse('api_stats')).json()
+        self.assertEqual(data['overall'], {'count': 4, 'income': '0.00', 'expense': '10.00', 'balance': '-10.00'})
+        self.assertEqual(data['categories'][0]['category'], 'Маркетинг')
+
+
+class ConditionalListTests(TestCase):
+    def setUp(self):
+        create_transactions(5)
+        self.url = reverse('transaction_list')
+
+    def test_unchanged_list_returns_304_without_reading_transactions(self):
+        etag = self.client.get(self.url, {'status': '1'})['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'status': '1'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('transactions_dataversion', queries[0]['sql'])
+
+        # Другие фильтры - другой ETag
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_any_write_changes_etag(self):
+        transaction = Transaction.objects.first()
+        writes = [
+            lambda: Transaction.objects.filter(pk=transaction.pk).update(comment='изменено'),
+            lambda: Transaction.objects.filter(pk=transaction.pk).update(amount=Decimal('1.00')),
+            lambda: create_transactions(1),
+            lambda: Transaction.objects.filter(pk=transaction.pk).delete(),
+            lambda: Status.objects.create(name='Новый'),
+        ]
+        for write in writes:
+            etag = self.client.get(self.url)['ETag']
+            write()
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        create_transactions(30, days=3)
+        self.business = Status.objects.get(name='Бизнес')
+        self.personal = Status.objects.get(name='Личное')
+        self.url = reverse('transaction_list')
+
+    def counts(self, kind):
+        return fragment_counters.snapshot().get(kind, {})
+
+    def test_repeated_filter_is_served_from_cache(self):
+        params = {'status': self.business.pk}
+        first = self.client.get(self.url, params)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(self.url, params)
+        # Страница отличается только маскированным CSRF-токеном формы массовых действий
+        csrf = re.compile(rb'name="csrfmiddlewaretoken" value="[^"]+"')
+        self.assertEqual(csrf.sub(b'', first.content), csrf.sub(b'', second.content))
+        self.assertFalse([q for q in queries if 'transactions_transaction' in q['sql']])
+        self.assertEqual(self.counts('overall'), {'hits': 1, 'revalidated': 0, 'misses': 1})
+        self.assertEqual(self.counts('stats'), {'hits': 1, 'revalidated': 0, 'misses': 1})
+        self.assertEqual(self.counts('page'), {'hits': 1, 'revalidated': 0, 'misses': 1})
+
+    def test_writes_invalidate_only_intersecting_filters(self):
+        in_range = {'date_from': '2025-01-01', 'date_to': '2025-01-03', 'status': self.business.pk}
+        other_status = {'status': self.personal.pk}
+        other_dates = {'date_from': '2025-03-01'}
+        for params in (in_range, other_status, other_dates):
+            self.client.get(self.url, params)
+        fragment_counters.reset()
+
+        Transaction.objects.filter(created_date=datetime.date(2025, 1, 2)).update(comment='новый')
+        for params in (in_range, other_status, other_dates):
+            self.client.get(self.url, params)
+        self.assertEqual(self.counts('stats'), {'hits': 0, 'revalidated': 2, 'misses': 1})
+
+        response = self.client.get(self.url, in_range)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts('stats')['hits'], 1)
+
+    def test_overall_totals_follow_writes_outside_the_filter(self):
+        params = {'status': self.business.pk}
+        self.client.get(self.url, params)
+        create_transactions(2, status=self.personal)
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.context['total_transactions_count'], 32)
+        self.assertEqual(self.counts('overall'), {'hits': 0, 'revalidated': 0, 'misses': 2})
+        # Итоги по фильтру остались действительными: новые записи - другого статуса
+        self.assertEqual(self.counts('stats'), {'hits': 0, 'revalidated': 1, 'misses': 1})
+
+    def test_counters_endpoint(self):
+        self.client.get(self.url)
+        data = self.client.get(reverse('api_cache_stats')).json()
+        self.assertEqual(data['page']['misses'], 1)
+
+
+class FilterSetTests(TestCase):
+    def filterset(self, query):
+        return TransactionFilterSet(QueryDict(query))
+
+    def test_equivalent_queries_share_canonical_key(self):
+        keys = {
+            self.filterset(query).cache_key
+            for query in (
+                'status=01&date_from=2025-01-01',
+                'date_from=01.01.2025&status=1',
+                'status=1&status=&date_from=2025-01-01&cursor=abc',
+            )
+        }
+        self.assertEqual(keys, {'date_from=2025-01-01&status=1'})
+        self.assertEqual(
+            self.filterset('type=2,1&type=2&amount_min=10,5').cache_key,
+            'type=1%2C2&amount_min=10.50',
+        )
+
+    def test_malformed_values_are_reported_not_queried(self):
+        filterset = self.filterset('status=abc&date_to=2025-13-01&amount_max=много&category=3')
+        self.assertEqual(set(filterset.errors), {'status', 'date_to', 'amount_max'})
+        self.assertEqual(filterset.values, {'category': (3,)})
+
+        response = self.client.get(reverse('transaction_list'), {'status': 'abc', 'date_to': 'вчера'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'неверная дата')
+        self.assertEqual(self.client.get(reverse('api_transactions'), {'status': 'x'}).status_code, 400)
+
+    def test_out_of_range_values_are_filter_errors(self):
+        filterset = self.filterset(f'status=²&type=99999999999999999999&category={2 ** 63}&amount_min=1e30&subcategory=1')
+        self.assertEqual(set(filterset.errors), {'status', 'type', 'category', 'amount_min'})
+        self.assertEqual(filterset.values, {'subcategory': (1,)})
+
+        for name in ('transaction_list', 'transaction_export', 'api_transactions', 'api_stats'):
+            for params in ({'status': '²'}, {'status': '99999999999999999999'}, {'amount_min': '1e30'}):
+                with self.subTest(name=name, params=params):
+                    response = self.client.get(reverse(name), params)
+                    self.assertIn(response.status_code, (200, 400))
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+        self.assertEqual(self.client.get(reverse('ajax_load_categories'), {'type_id': '²'}).json(), [])
+
+    def test_multi_select_and_amount_range(self):
+        create_transactions(4, amount=Decimal('5.00'))
+        smm = Subcategory.objects.get(name='SMM')
+        create_transactions(3, subcategory=smm, amount=Decimal('50.00'))
+        avito = Subcategory.objects.get(name='Avito')
+
+        filterset = self.filterset(f'subcategory={avito.pk},{smm.pk}&amount_min=10')
+        self.assertEqual(filterset.filter(Transaction.objects.all()).count(), 3)
+        self.assertFalse(filterset.bucket_only)
+
+        stats = TransactionStats.for_filters(filterset).compute()
+        self.assertEqual((stats.filtered.count, stats.filtered.expense), (3, Decimal('150.00')))
+        self.assertEqual(stats.overall.count, 7)
+
+        response = self.client.get(reverse('transaction_list'), {'amount_max': '10'})
+        self.assertEqual(response.context['filtered_count'], 4)
+
+
+class DatabaseProfileTests(TestCase):
+    databases = {'default', 'replica'}
+
+    def test_pragmas_applied_to_new_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_replica_is_read_only(self):
+        self.assertTrue(Status.objects.using('replica').exists())
+        with self.assertRaises(OperationalError):
+            Status.objects.using('replica').create(name='Черновик')
+
+    def test_read_only_views_use_replica_outside_transactions(self):
+        @read_only_view
+        def read_view():
+            return router.db_for_read(Transaction)
+
+        @read_only_view
+        async def async_read_view():
+            return await sync_to_async(router.db_for_read)(Transaction)
+
+        # Вне транзакции на запись: чтение через replica, запись всегда в default
+        connection.in_atomic_block, in_atomic_block = False, connection.in_atomic_block
+        try:
+            self.assertEqual(read_view(), 'replica')
+            self.assertEqual(async_to_sync(async_read_view)(), 'replica')
+            self.assertEqual(router.db_for_read(Transaction), 'default')
+        finally:
+            connection.in_atomic_block = in_atomic_block
+
+        # Внутри транзакции replica не видит незафиксированные изменения
+        self.assertEqual(read_view(), 'default')
+        self.assertEqual(router.db_for_write(Transaction), 'default')
+
+
+class BalanceTests(TestCase):
+    def setUp(self):
+        self.business = Status.objects.get(name='Бизнес')
+        self.personal = Status.objects.get(name='Личное')
+        salary = Subcategory.objects.get(name='Аванс')
+        # Расходы по 10.00 каждый день с 10 января по 29 апреля, доходы по 100.00 каждые 7 дней
+        create_transactions(110, start=datetime.date(2025, 1, 10), days=110)
+        create_transactions(
+            16, start=datetime.date(2025, 1, 3), days=16, status=self.personal,
+            type=salary.category.type, category=salary.category, subcategory=salary, amount=Decimal('100.00'),
+        )
+        self.income_id = salary.category.type_id
+
+    def expected(self, day, status_ids=()):
+        balance = Decimal('0')
+        rows = Transaction.objects.filter(created_date__lte=day)
+        if status_ids:
+            rows = rows.filter(status_id__in=status_ids)
+        for type_id, amount in rows.values_list('type_id', 'amount'):
+            balance += amount if type_id == self.income_id else -amount
+        return balance
+
+    def test_balance_as_of_matches_raw_rows(self):
+        balances = Balances()
+        for day in (datetime.date(2024, 12, 31), datetime.date(2025, 1, 31),
+                    datetime.date(2025, 3, 15), datetime.date(2025, 6, 1)):
+            self.assertEqual(balances.as_of(day).balance, self.expected(day))
+        personal = Balances([self.personal.pk])
+        self.assertEqual(personal.as_of(datetime.date(2025, 2, 10)).balance, self.expected(
+            datetime.date(2025, 2, 10), [self.personal.pk],
+        ))
+
+        # Снимки уже построены: остаток - чтение снимка и одна сумма по сводке
+        with self.assertNumQueries(3):
+            balances.as_of(datetime.date(2025, 5, 20))
+
+    def test_back_dated_change_invalidates_later_snapshots(self):
+        balances = Balances()
+        balances.as_of(datetime.date(2025, 5, 1))
+        self.assertEqual(
+            set(PeriodSnapshot.objects.filter(status=None).values_list('month', flat=True)),
+            {datetime.date(2025, month, 1) for month in (1, 2, 3, 4)},
+        )
+
+        # Изменение в феврале: снимки января остаются, с февраля удаляются
+        Transaction.objects.filter(created_date=datetime.date(2025, 2, 5)).update(amount=Decimal('500.00'))
+        self.assertEqual(
+            set(PeriodSnapshot.objects.filter(status=None).values_list('month', flat=True)),
+            {datetime.date(2025, 1, 1)},
+        )
+        self.assertEqual(balances.as_of(datetime.date(2025, 5, 1)).balance, self.expected(datetime.date(2025, 5, 1)))
+
+        # Сегодняшние записи не трогают закрытые месяцы
+        create_transactions(1, start=datetime.date(2025, 5, 2))
+        self.assertEqual(PeriodSnapshot.objects.filter(status=None).count(), 4)
+
+    def test_far_future_dates_do_not_persist_snapshots(self):
+        far = datetime.date(9999, 12, 31)
+        self.assertEqual(Balances().as_of(far).balance, self.expected(far))
+        horizon = timezone.localdate().replace(day=1)
+        self.assertEqual(PeriodSnapshot.objects.filter(status=None).latest('month').month, horizon)
+        count = PeriodSnapshot.objects.count()
+
+        response = self.client.get(reverse('transaction_statement'), {'date_from': '9999-12-31'})
+        self.assertEqual(response.context['page'].opening, self.expected(far))
+        self.assertEqual(PeriodSnapshot.objects.count(), count)
+
+        for date_from in ('0001-01-01', '0001-02-01'):
+            response = self.client.get(reverse('transaction_statement'), {'date_from': date_from})
+            self.assertEqual(response.context['page'].opening, Decimal('0'))
+
+    def test_early_dates_do_not_persist_snapshots(self):
+        url = reverse('transaction_statement')
+        response = self.client.get(url, {'date_from': '0001-03-01', 'date_to': '0001-03-02'})
+        self.assertEqual(response.context['page'].opening, Decimal('0'))
+        self.assertEqual(Balances().as_of(datetime.date(2024, 12, 31)).balance, Decimal('0'))
+        self.assertEqual(PeriodSnapshot.objects.count(), 0)
+
+        # Обычный запрос строит снимки только с месяца первой записи
+        self.client.get(url, {'date_from': '2025-04-01'})
+        self.assertEqual(
+            set(PeriodSnapshot.objects.filter(status=None).values_list('month', flat=True)),
+            {datetime.date(2025, 1, 1), datetime.date(2025, 2, 1)},
+        )
+
+    def test_statement_pages_carry_running_balance(self):
+        url = reverse('transaction_statement')
+        response = self.client.get(url, {'date_from': '2025-02-01'})
+        first = response.context['page']
+        self.assertEqual(first.opening, self.expected(datetime.date(2025, 1, 31)))
+        self.assertEqual(len(first.lines), 50)
+        self.assertEqual(first.lines[-1].balance, first.closing)
+
+        second = self.client.get(url, {'date_from': '2025-02-01', 'cursor': first.next_cursor}).context['page']
+        self.assertEqual(second.opening, first.closing)
+        last = second.lines[-1].transaction
+        later_same_day = Transaction.objects.filter(created_date=last.created_date, id__gt=last.pk)
+        self.assertEqual(second.closing, self.expected(last.created_date) - sum(
+            row.amount if row.type_id == self.income_id else -row.amount for row in later_same_day
+        ))
+
+        response = self.client.get(url, {'status': self.personal.pk})
+        self.assertEqual(response.context['page'].closing, Decimal('1600.00'))
+
+
+@unittest.skipUnless(columnar.available(), 'нужен numpy')
+class ColumnarStoreTests(TestCase):
+    def setUp(self):
+        self.smm = Subcategory.objects.get(name='SMM')
+        salary = Subcategory.objects.get(name='Аванс')
+        create_transactions(40, start=datetime.date(2025, 1, 1), days=20, amount=Decimal('12.34'))
+        create_transactions(15, start=datetime.date(2025, 1, 5), days=15, subcategory=self.smm, amount=Decimal('250.00'))
+        create_transactions(
+            6, start=datetime.date(2025, 1, 10), days=3, status=Status.objects.get(name='Личное'),
+            type=salary.category.type, category=salary.category, subcategory=salary, amount=Decimal('1000.01'),
+        )
+
+    def assertSameStats(self, query):
+        filterset = TransactionFilterSet(QueryDict(query))
+        expected = TransactionStats.for_filters(filterset, engine='sql').compute()
+        actual = TransactionStats.for_filters(filterset, engine='columnar')
+        self.assertIsInstance(actual, columnar.ColumnarStats)
+        self.assertEqual(actual.compute().as_dict(), expected.as_dict(), query)
+
+    def test_results_match_sql_engine(self):
+        for query in ('', 'date_from=2025-01-08&date_to=2025-01-12',
+                      f'subcategory={self.smm.pk}', 'amount_min=100&amount_max=999',
+                      f'status=1,2,3&category={self.smm.category_id}'):
+            self.assertSameStats(query)
+
+    def test_follows_change_feed_incrementally(self):
+        store = columnar.get_store()
+        self.assertEqual(len(store), 61)
+
+        Transaction.objects.filter(created_date=datetime.date(2025, 1, 3)).update(amount=Decimal('5.00'))
+        create_transactions(2, start=datetime.date(2025, 2, 1))
+        Transaction.objects.filter(created_date=datetime.date(2025, 1, 19)).delete()
+        # Версии, лента изменений и строки только трех затронутых дней
+        with self.assertNumQueries(4):
+            store = columnar.get_store()
+        self.assertEqual(len(store), 61 + 2 - 2 - 1)
+        self.assertSameStats('')
+        self.assertSameStats('date_to=2025-01-05')
+
+        # Без изменений копия не перечитывается
+        with self.assertNumQueries(1):
+            self.assertIs(columnar.get_store(), store)
+
+    def test_group_by_matches_sql(self):
+        store = columnar.get_store()
+        groups = store.group_by(('status', 'subcategory'), store.mask(TransactionFilterSet(QueryDict('date_to=2025-01-11'))))
+        expected = {
+            (row['status_id'], row['subcategory_id']): (columnar.to_kopecks(row['total']), row['rows'])
+            for row in Transaction.objects.filter(created_date__lte='2025-01-11')
+            .values('status_id', 'subcategory_id').annotate(total=models.Sum('amount'), rows=models.Count('id'))
+        }
+        self.assertEqual(groups, expected)
+
+
+class CommentSearchTests(TestCase):
+    def setUp(self):
+        comments = [
+            'Реклама в Яндекс Директ', 'Оплата рекламы ВКонтакте', 'Кофе для офиса',
+            'реклама, реклама и ещё раз реклама', None, 'Яндекс такси',
+        ]
+        self.rows = create_transactions(len(comments))
+        for row, comment in zip(self.rows, comments):
+            row.comment = comment
+            row.save()
+
+    def found(self, text):
+        return set(Transaction.objects.filter(TransactionFilterSet(QueryDict(f'q={text}')).q).values_list('id', flat=True))
+
+    def ids(self, *indexes):
+        return {self.rows[index].pk for index in indexes}
+
+    def test_prefix_and_all_words(self):
+        self.assertEqual(self.found('рекл'), self.ids(0, 1, 3))
+        self.assertEqual(self.found('РЕКЛАМА яндекс'), self.ids(0))
+        self.assertEqual(self.found('ещe'), set())
+        # Синтаксис FTS5 из ввода не исполняется
+        self.assertEqual(match_expression('реклама OR "кофе*'), '"реклама"* "or"* "кофе"*')
+        self.assertEqual(self.found('"кофе* (офис'), self.ids(2))
+
+    def test_index_follows_edits_and_deletes(self):
+        self.rows[2].comment = 'Кофе и реклама'
+        self.rows[2].save()
+        Transaction.objects.filter(pk=self.rows[1].pk).update(comment='Печать визиток')
+        self.rows[0].delete()
+        self.assertEqual(self.found('реклама'), self.ids(2, 3))
+        self.assertEqual(self.found('визит'), self.ids(1))
+
+    def test_ranked_results_and_list_filter(self):
+        ordered = list(ranked(Transaction.objects.all(), 'реклам').values_list('id', flat=True))
+        self.assertEqual(ordered[0], self.rows[3].pk)  # чаще всего встречается слово
+        self.assertEqual(set(ordered), self.ids(0, 1, 3))
+
+        response = self.client.get(reverse('transaction_list'), {'q': '  Реклам  '})
+        self.assertEqual(response.context['filter_params']['q'], 'реклам')
+        self.assertEqual(response.context['filtered_count'], 3)
+        self.assertContains(response, 'Оплата рекламы')
+        self.assertEqual(len(self.client.get(reverse('api_transactions'), {'q': 'яндекс'}).json()['results']), 2)
+
+    def test_admin_search_uses_index(self):
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get(reverse('admin:transactions_transaction_changelist'), {'q': 'рекл'})
+        self.assertEqual([row.pk for row in response.context['cl'].result_list][0], self.rows[3].pk)
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+
+class BulkActionTests(TestCase):
+    def setUp(self):
+        self.smm = Subcategory.objects.get(name='SMM')
+        self.personal = Status.objects.get(name='Личное')
+        self.rows = create_transactions(30, start=datetime.date(2025, 1, 1), days=10)
+
+    def test_update_selected_rows_in_constant_queries(self):
+        ids = [row.pk for row in self.rows[:20]]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('transaction_bulk'), {
+                'action': 'update', 'scope': 'selected', 'ids': ids,
+                'status': self.personal.pk, 'subcategory': self.smm.pk,
+            })
+        self.assertRedirects(response, reverse('transaction_list'), fetch_redirect_response=False)
+        self.assertEqual(
+            Transaction.objects.filter(subcategory=self.smm, category=self.smm.category, status=self.personal).count(), 20,
+        )
+        self.assertEqual(sum(1 for query in queries if query['sql'].startswith('UPDATE "transactions_transaction"')), 1)
+        self.assertEqual(verify_rollups(), [])
+
+        # Сама таблица транзакций: одно чтение корзин и один UPDATE на пакет, а не на строку
+        transaction_queries = [
+            query['sql'] for query in queries
+            if 'FROM "transactions_transaction"' in query['sql'] or query['sql'].startswith('UPDATE "transactions_transaction"')
+        ]
+        self.assertLessEqual(len(transaction_queries), 2)
+
+    def test_hierarchy_validated_once_per_batch(self):
+        other_category = Category.objects.exclude(pk=self.smm.category_id).first()
+        for data, message in (
+            ({'category': self.smm.category_id}, 'укажите подкатегорию'),
+            ({'category': other_category.pk, 'subcategory': self.smm.pk}, 'не относится'),
+            ({'status': 999}, 'не найден'),
+            ({}, 'Не выбрано'),
+        ):
+            response = self.client.post(reverse('transaction_bulk'), {
+                'action': 'update', 'ids': [self.rows[0].pk], **data,
+            }, follow=True)
+            self.assertContains(response, message)
+        self.assertFalse(Transaction.objects.filter(subcategory=self.smm).exists())
+
+        # Без отмеченных строк и без фильтра ничего не выбирается
+        response = self.client.post(reverse('transaction_bulk'), {
+            'action': 'delete', 'scope': 'filter', 'confirm': '1',
+        }, follow=True)
+        self.assertContains(response, 'Не выбраны записи')
+        self.assertEqual(Transaction.objects.count(), 30)
+
+    def test_selected_scope_never_falls_back_to_filter(self):
+        url = reverse('transaction_bulk')
+        for data in ({}, {'scope': 'selected'}):
+            response = self.client.post(url, {'action': 'delete', 'filter_query': 'date_to=2025-01-03', **data}, follow=True)
+            self.assertContains(response, 'Не отмечены строки')
+        self.assertEqual(Transaction.objects.count(), 30)
+
+        # Удаление по фильтру - только с подтверждением
+        response = self.client.post(url, {
+            'action': 'delete', 'scope': 'filter', 'filter_query': 'date_to=2025-01-03',
+        }, follow=True)
+        self.assertContains(response, 'Подтвердите удаление')
+        self.assertEqual(Transaction.objects.count(), 30)
+
+    def test_filter_scope_and_api(self):
+        response = self.client.post(reverse('transaction_bulk'), {
+            'action': 'delete', 'scope': 'filter', 'filter_query': 'date_to=2025-01-03', 'confirm': '1',
+        })
+        self.assertRedirects(response, reverse('transaction_list') + '?date_to=2025-01-03', fetch_redirect_response=False)
+        self.assertEqual(Transaction.objects.count(), 21)
+
+        api = reverse('api_transactions_bulk')
+        response = self.client.post(api, {
+            'action': 'update', 'filter': {'date_from': '2025-01-09'}, 'changes': {'subcategory': self.smm.pk},
+        }, content_type='application/json')
+        self.assertEqual(response.json(), {'action': 'update', 'count': 6})
+        response = self.client.post(api, {
+            'action': 'delete', 'ids': [self.rows[-1].pk, self.rows[-2].pk],
+        }, content_type='application/json')
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(self.client.post(api, {'action': 'drop'}, content_type='application/json').status_code, 400)
+
+        # Удаление по фильтру - только с подтверждением
+        by_filter = {'action': 'delete', 'filter': {'date_from': '2025-01-09'}}
+        response = self.client.post(api, by_filter, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('confirm', response.json()['error'])
+        self.assertEqual(Transaction.objects.count(), 19)
+        response = self.client.post(api, dict(by_filter, confirm=True), content_type='application/json')
+        self.assertEqual(response.json()['count'], 4)
+        self.assertEqual(verify_rollups(), [])
+
+        # Без токена и заголовка CSRF массовая операция отклоняется
+        response = Client(enforce_csrf_checks=True).post(api, {
+            'action': 'delete', 'filter': {'date_from': '2025-01-01'}, 'confirm': True,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Transaction.objects.count(), 15)
+
+
+class UsageCounterTests(TestCase):
+    def setUp(self):
+        self.marketing = Category.objects.get(name='Маркетинг')
+        self.avito = Subcategory.objects.get(name='Avito')
+        self.smm = Subcategory.objects.get(name='SMM')
+        self.rows = create_transactions(6, days=3)
+
+    def usage(self, obj):
+        return type(obj).objects.values_list('usage_count', flat=True).get(pk=obj.pk)
+
+    def test_counters_follow_every_kind_of_write(self):
+        self.assertEqual(self.usage(self.avito), 6)
+        self.assertEqual(self.usage(self.marketing), 6)
+
+        self.rows[0].subcategory = self.smm
+        self.rows[0].save()
+        self.rows[1].delete()
+        Transaction.objects.filter(pk__in=[self.rows[2].pk, self.rows[3].pk]).update(subcategory=self.smm)
+        Transaction.objects.filter(pk=self.rows[4].pk).delete()
+
+        self.assertEqual(self.usage(self.avito), 1)
+        self.assertEqual(self.usage(self.smm), 3)
+        self.assertEqual(self.usage(self.marketing), 4)
+        self.assertEqual(verify_usage(), [])
+
+        Subcategory.objects.filter(pk=self.avito.pk).update(usage_count=100)
+        self.assertEqual(len(verify_usage()), 1)
+        rebuild_usage()
+        self.assertEqual(verify_usage(), [])
+
+    def test_dictionary_page_reads_counters_without_transaction_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dictionary_management'))
+        self.assertContains(response, 'title="Транзакций">6</span>')
+        self.assertFalse([query for query in queries if 'transactions_transaction"' in query['sql']])
+        # Повторно - из кэша, пока версия данных не изменилась
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('dictionary_management'))
+        self.assertFalse([query for query in queries if 'usage_count' in query['sql']])
+        create_transactions(1, subcategory=self.smm)
+        self.assertContains(self.client.get(reverse('dictionary_management')), 'title="Транзакций">7</span>')
+
+        # Удаление используемой записи запрещено по счетчику
+        response = self.client.post(reverse('delete_dictionary_item', args=['subcategory', self.avito.pk]), follow=True)
+        self.assertContains(response, 'используется в транзакциях')
+        unused = Subcategory.objects.get(name='Farpost')
+        self.client.post(reverse('delete_dictionary_item', args=['subcategory', unused.pk]))
+        self.assertFalse(Subcategory.objects.filter(pk=unused.pk).exists())
+
+    def test_merge_status_with_single_update(self):
+        business, personal = Status.objects.get(name='Бизнес'), Status.objects.get(name='Личное')
+        with CaptureQueriesContext(connection) as queries:
+            target, moved = merge('status', business.pk, personal.pk)
+        self.assertEqual((target, moved), (personal, 6))
+        self.assertEqual(sum(1 for query in queries if query['sql'].startswith('UPDATE "transactions_transaction"')), 1)
+        self.assertFalse(Status.objects.filter(pk=business.pk).exists())
+        self.assertEqual(self.usage(personal), 6)
+        self.assertEqual(verify_usage(), [])
+        self.assertEqual(verify_rollups(), [])
+        self.assertIsNone(get_hierarchy().status(business.pk))
+
+    def test_merge_category_moves_and_merges_subcategories(self):
+        # Дубль категории другого типа: одноименная подкатегория сливается, остальные переносятся
+        income = Type.objects.get(name='Пополнение')
+        duplicate = Category.objects.create(name='Реклама', type=income)
+        twin = Subcategory.objects.create(name='Avito', category=duplicate)
+        extra = Subcategory.objects.create(name='Баннеры', category=duplicate)
+        create_transactions(2, type=income, category=duplicate, subcategory=twin)
+        create_transactions(3, type=income, category=duplicate, subcategory=extra)
+
+        response = self.client.post(reverse('merge_dictionary_items', args=['category']), {
+            'source': duplicate.pk, 'target': self.marketing.pk,
+        }, follow=True)
+        self.assertContains(response, 'перенесено транзакций: 5')
+        self.assertFalse(Category.objects.filter(pk=duplicate.pk).exists())
+        self.assertFalse(Subcategory.objects.filter(pk=twin.pk).exists())
+        extra.refresh_from_db()
+        self.assertEqual(extra.category, self.marketing)
+        self.assertEqual(Transaction.objects.filter(category=self.marketing, type=self.marketing.type).count(), 11)
+        self.assertEqual(self.usage(self.avito), 8)
+        self.assertEqual(self.usage(self.marketing.type), 11)
+        self.assertEqual(verify_usage(), [])
+        self.assertEqual(verify_rollups(), [])
+
+    def test_merge_rejects_bad_input(self):
+        for data, message in (
+            ({'source': self.avito.pk, 'target': self.avito.pk}, 'саму с собой'),
+            ({'source': self.avito.pk, 'target': 999}, 'не найдена'),
+            ({'source': '', 'target': self.smm.pk}, 'Выберите'),
+        ):
+            response = self.client.post(reverse('merge_dictionary_items', args=['subcategory']), data, follow=True)
+            self.assertContains(response, message)
+        self.assertEqual(self.usage(self.avito), 6)
+
+
+class MoneyFieldTests(TestCase):
+    def test_amounts_stored_as_kopecks_and_read_as_decimal(self):
+        rows = create_transactions(3, amount=Decimal('0.10'))
+        row = Transaction.objects.get(pk=rows[0].pk)
+        self.assertEqual(row.amount, Decimal('0.10'))
+        self.assertEqual(str(row.amount), '0.10')
+        self.assertEqual(row.get_amount_display(), '0.10 р.')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT amount FROM transactions_transaction WHERE id = %s', [row.pk])
+            self.assertEqual(cursor.fetchone()[0], 10)
+
+        # Целочисленная сумма: 0.1 + 0.1 + 0.1 без погрешности плавающей точки
+        total = Transaction.objects.aggregate(total=models.Sum('amount'))['total']
+        self.assertEqual(total, Decimal('0.30'))
+        self.assertEqual(Transaction.objects.filter(amount__gte='0.1').count(), 3)
+        self.assertEqual(verify_rollups(), [])
+
+    def test_forms_keep_decimal_api(self):
+        field = TransactionForm.base_fields['amount']
+        self.assertEqual((type(field).__name__, field.decimal_places), ('DecimalField', 2))
+        form = TransactionForm(data={
+            'created_date': '2025-01-01',
+            'status': Status.objects.get(name='Бизнес').pk,
+            'type': Type.objects.get(name='Списание').pk,
+            'category': Category.objects.get(name='Маркетинг').pk,
+            'subcategory': Subcategory.objects.get(name='Avito').pk,
+            'amount': '1234.567',
+        })
+        self.assertIn('amount', form.errors)
+
+
+class SyntheticDataTests(TestCase):
+    def test_generated_rows_follow_hierarchy_and_skew(self):
+        start, end = datetime.date(2024, 1, 1), datetime.date(2024, 12, 31)
+        generator = TransactionGenerator(start, end, skew=1.5, recent_bias=2, seed=7)
+        result = generator.generate(600, batch_size=250)
+        self.assertEqual((result.created, Transaction.objects.count()), (600, 600))
+
+        hierarchy = get_hierarchy()
+        for row in Transaction.objects.all():
+            subcategory = hierarchy.subcategory(row.subcategory_id)
+            self.assertEqual(row.category_id, subcategory.category.id)
+            self.assertEqual(row.type_id, subcategory.category.type_id)
+            self.assertTrue(start <= row.created_date <= end)
+            self.assertGreater(row.amount, 0)
+        self.assertEqual(verify_rollups(), [])
+
+        # Самая частая подкатегория заметно популярнее средней, поздние даты - чаще ранних
+        counts = Transaction.objects.values('subcategory').annotate(rows=models.Count('id')).order_by('-rows')
+        self.assertGreater(counts[0]['rows'], 600 / len(hierarchy.subcategories) * 3)
+        late = Transaction.objects.filter(created_date__gte=datetime.date(2024, 7, 1)).count()
+        self.assertGreater(late, 300)
+
+        # Один seed - одни и те же данные
+        again = TransactionGenerator(start, end, skew=1.5, recent_bias=2, seed=7).rows(5)
+        first = TransactionGenerator(start, end, skew=1.5, recent_bias=2, seed=7).rows(5)
+        self.assertEqual(
+            [(row.subcategory_id, row.created_date, row.amount) for row in again],
+            [(row.subcategory_id, row.created_date, row.amount) for row in first],
+        )
+
+
+class ViewBenchmarkTests(TestCase):
+    def result(self, **overrides):
+        values = dict(name='transaction_list', runs=10, p50_ms=10.0, p95_ms=20.0, p99_ms=25.0,
+                      max_ms=30.0, queries=2, peak_kb=500.0, errors=0)
+        values.update(overrides)
+        return ScenarioResult(**values)
+
+    def test_compare_reports_regressions_beyond_tolerance(self):
+        baseline = {'transaction_list': self.result().as_dict()}
+        self.assertEqual(compare([self.result(p95_ms=26.0, peak_kb=600.0)], baseline), [])
+        regressions = compare([self.result(p95_ms=40.0, queries=3, peak_kb=2000.0)], baseline)
+        self.assertEqual(len(regressions), 3)
+        self.assertEqual(compare([self.result(name='other', queries=50)], baseline), [])
+        self.assertEqual(percentile([1, 2, 3, 4], 0.5), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 0.95), 4)
+
+    def test_command_saves_and_checks_baseline(self):
+        create_transactions(5)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            call_command(
+                'benchmark_views', iterations=2, warmup=0, save_baseline=path,
+                scenarios=['transaction_list', 'ajax_hierarchy', 'transaction_create'], stdout=io.StringIO(),
+            )
+            with open(path, encoding='utf-8') as fileobj:
+                document = json.load(fileobj)
+            self.assertEqual(document['rows'], 5)
+            self.assertEqual(document['scenarios']['transaction_create']['errors'], 0)
+            # Запись в сценарии откатывается
+            self.assertEqual(Transaction.objects.count(), 5)
+
+            document['scenarios']['ajax_hierarchy']['queries'] = 0
+            with open(path, 'w', encoding='utf-8') as fileobj:
+                json.dump(document, fileobj)
+            with self.assertRaisesMessage(CommandError, 'Регрессий: 1'):
+                call_command(
+                    'benchmark_views', iterations=2, warmup=0, baseline=path,
+                    scenarios=['ajax_hierarchy'], stdout=io.StringIO(), stderr=io.StringIO(),
+                )
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics_registry.reset()
+        create_transactions(3)
+
+    def sample(self, text, name, **labels):
+        label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+        match = re.search(rf'^cashflow_{name}\{{{re.escape(label_text)}\}} (\S+)$', text, re.M)
+        self.assertIsNotNone(match, f'{name} {labels}')
+        return float(match.group(1))
+
+    def test_views_record_queries_latency_templates_and_size(self):
+        get_hierarchy()
+        get_usage()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dictionary_management'))
+        # captured_queries читает queries_log лениво - следующий запрос его очистит
+        query_count = len(queries)
+        self.client.get(reverse('transaction_list'))  # асинхронное представление
+        self.client.get('/no-such-page/')
+
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertEqual(self.sample(text, 'http_requests_total', view='dictionary_management', method='GET', status='200'), 1)
+        self.assertEqual(self.sample(text, 'db_queries_per_request_sum', view='dictionary_management'), query_count)
+        self.assertGreater(self.sample(text, 'db_query_seconds_total', view='dictionary_management'), 0)
+        self.assertGreater(self.sample(text, 'template_render_seconds_total', view='dictionary_management'), 0)
+        self.assertEqual(
+            self.sample(text, 'http_response_size_bytes_sum', view='dictionary_management'), len(response.content),
+        )
+        self.assertEqual(self.sample(text, 'http_request_duration_seconds_bucket', view='transaction_list', le='+Inf'), 1)
+        self.assertGreater(self.sample(text, 'db_queries_per_request_sum', view='transaction_list'), 0)
+        self.assertGreater(self.sample(text, 'template_render_seconds_total', view='transaction_list'), 0)
+        self.assertEqual(self.sample(text, 'http_requests_total', view='unmatched', method='GET', status='404'), 1)
+
+    def test_endpoint_uses_prometheus_text_format(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE cashflow_http_request_duration_seconds histogram', text)
+        # Гистограмма накопительная: каждая граница не меньше предыдущей
+        buckets = [
+            float(value) for value in re.findall(
+                r'^cashflow_http_request_duration_seconds_bucket\{view="metrics",le="[^"]+"\} (\S+)$', text, re.M,
+            )
+        ]
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertEqual(buckets[-1], 1)
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        create_transactions(3)
+        slowlog.slow_log.reset()
+
+    def test_fingerprint_ignores_literals_and_list_lengths(self):
+        self.assertEqual(
+            slowlog.fingerprint("SELECT * FROM t WHERE id IN (%s, %s) AND name = 'a' LIMIT 21"),
+            slowlog.fingerprint("SELECT *  FROM t WHERE id IN (%s,%s,%s)\nAND name = 'b''c' LIMIT 5"),
+        )
+        self.assertNotEqual(
+            slowlog.fingerprint('SELECT * FROM t WHERE id = %s'),
+            slowlog.fingerprint('SELECT * FROM u WHERE id = %s'),
+        )
+        self.assertEqual(slowlog.normalize('SELECT "t0"."id" FROM t0'), 'SELECT "t0"."id" FROM t0')
+
+    def test_entries_carry_view_and_plan_is_captured_once_per_fingerprint(self):
+        # Прогрев: кэши справочников и фрагментов не дают запросов во втором ответе
+        self.client.get(reverse('transaction_list'))
+        slowlog.slow_log.reset()
+        with mock.patch.object(slowlog, 'explain', wraps=slowlog.explain) as explain:
+            self.client.get(reverse('transaction_list'))
+            first_calls = explain.call_count
+            self.client.get(reverse('transaction_list'))
+
+        self.assertGreater(first_calls, 0)
+        self.assertEqual(explain.call_count, first_calls)
+        entries = slowlog.slow_log.entries()
+        self.assertTrue(entries)
+        self.assertEqual({entry.view for entry in entries}, {'transaction_list'})
+
+        summary = slowlog.slow_log.summary()
+        totals = [item.total_ms for item in summary]
+        self.assertEqual(totals, sorted(totals, reverse=True))
+        selects = [item for item in summary if item.normalized.startswith('SELECT')]
+        self.assertEqual(len(selects), first_calls)
+        for item in selects:
+            self.assertEqual(item.count % 2, 0)
+            self.assertTrue(item.plan)
+            self.assertFalse(item.plan[0].startswith('План недоступен'), item.plan)
+
+    def test_params_are_redacted_unless_disabled(self):
+        Transaction.objects.filter(comment='секрет').exists()
+        self.assertEqual(slowlog.slow_log.entries()[0].params, ('<int>', '<str>'))
+
+        with self.settings(SLOW_QUERY_REDACT_PARAMS=False):
+            Transaction.objects.filter(comment='секрет').exists()
+        self.assertEqual(slowlog.slow_log.entries()[0].params, (1, 'секрет'))
+        self.assertEqual(slowlog.slow_log.entries()[0].view, slowlog.NO_VIEW)
+
+    def test_buffer_is_bounded(self):
+        slowlog.slow_log.reset(size=3)
+        for pk in range(5):
+            Transaction.objects.filter(pk=pk).exists()
+        Status.objects.count()
+        Type.objects.count()
+        self.assertEqual(len(slowlog.slow_log.entries()), 3)
+        self.assertLessEqual(len(slowlog.slow_log.summary()), 3)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=None)
+    def test_disabled(self):
+        Transaction.objects.count()
+        self.assertEqual(slowlog.slow_log.entries(), [])
+
+    def test_admin_page(self):
+        url = reverse('slow_queries')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        self.client.get(reverse('transaction_list'))
+        top = slowlog.slow_log.summary()[0]
+        response = self.client.get(url)
+        self.assertContains(response, top.fingerprint)
+        self.assertContains(response, 'transaction_list')
+
+        self.client.post(url)
+        self.assertEqual(slowlog.slow_log.summary(), [])
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = self.settings(JOB_FILES_DIR=directory.name, JOB_RETRY_DELAY=60)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = directory.name
+
+    def register(self, kind, func, max_attempts=3):
+        patcher = mock.patch.dict(jobs.HANDLERS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        jobs.handler(kind, max_attempts)(func)
+
+    def test_background_export_writes_file_and_reports_progress(self):
+        create_transactions(5)
+        create_transactions(2, start=datetime.date(2025, 3, 1))
+        response = self.client.post(reverse('job_export'), {'filter_query': 'date_from=2025-02-01'})
+        job = Job.objects.get()
+        self.assertRedirects(response, reverse('job_detail', args=[job.pk]))
+        self.assertEqual(job.status, Job.QUEUED)
+
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual((job.progress, job.total, job.result['rows']), (2, 2, 2))
+
+        status = self.client.get(reverse('api_job_status', args=[job.pk])).json()
+        self.assertEqual(status['percent'], 100)
+        download = self.client.get(status['download_url'])
+        content = b''.join(download.streaming_content).decode('utf-8-sig')
+        expected = ''.join(TransactionExporter(Transaction.objects.filter(created_date__gte='2025-02-01')).csv())
+        self.assertEqual(content, expected.lstrip('\ufeff'))
+        self.assertIn('attachment; filename="transactions.csv"', download['Content-Disposition'])
+
+    def test_background_import_removes_upload(self):
+        content = 'Дата;Статус;Тип;Категория;Подкатегория;Сумма\n2025-01-05;Бизнес;Списание;Маркетинг;Avito;100,50\n'
+        response = self.client.post(reverse('transaction_import'), {
+            'file': SimpleUploadedFile('bank.csv', content.encode()),
+            'background': 'on',
+        })
+        job = Job.objects.get()
+        self.assertRedirects(response, reverse('job_detail', args=[job.pk]))
+        self.assertEqual(job.max_attempts, 1)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result['created'], 1)
+        self.assertEqual(Transaction.objects.get().amount, Decimal('100.50'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        calls = []
+
+        def flaky(context):
+            calls.append(context.job.attempts)
+            raise RuntimeError('нет связи')
+
+        self.register('flaky', flaky, max_attempts=2)
+        job = jobs.enqueue('flaky')
+        with self.assertLogs('transactions.jobs', 'ERROR'):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_after, job.started_at + datetime.timedelta(seconds=59))
+        self.assertIn('RuntimeError: нет связи', job.error)
+        # Задержка еще не истекла
+        self.assertEqual(jobs.run_pending(), 0)
+
+        Job.objects.filter(pk=job.pk).update(run_after=job.started_at)
+        with self.assertLogs('transactions.jobs', 'ERROR'):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, calls), (Job.FAILED, 2, [1, 2]))
+        status = self.client.get(reverse('api_job_status', args=[job.pk])).json()
+        self.assertEqual(status['error'], 'RuntimeError: нет связи')
+
+    def test_cancel_queued_and_running(self):
+        self.register('noop', lambda context: {'ok': True})
+        queued = jobs.enqueue('noop')
+        # Отмена через API - с токеном или заголовком CSRF, как и прочие изменения
+        self.assertEqual(Client(enforce_csrf_checks=True).post(reverse('api_job_cancel', args=[queued.pk])).status_code, 403)
+        response = self.client.post(reverse('api_job_cancel', args=[queued.pk]))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], Job.CANCELLED)
+        self.assertEqual(self.client.post(reverse('api_job_cancel', args=[queued.pk])).status_code, 409)
+        self.assertEqual(jobs.run_pending(), 0)
+
+        def cancelled_midway(context):
+            context.progress(1, 10, force=True)
+            self.assertTrue(jobs.cancel(context.job))
+            context.progress(2, 10, force=True)
+            return {'ok': True}
+
+        self.register('long', cancelled_midway)
+        running = jobs.enqueue('long')
+        jobs.run_pending()
+        running.refresh_from_db()
+        self.assertEqual((running.status, running.progress, running.result), (Job.CANCELLED, 1, None))
+
+    def test_job_is_claimed_once_and_stale_jobs_are_requeued(self):
+        self.register('noop', lambda context: None, max_attempts=2)
+        job = jobs.enqueue('noop')
+        self.assertEqual(jobs.claim('first', 5), [job.pk])
+        self.assertEqual(jobs.claim('second', 5), [])
+
+        old = timezone.now() - datetime.timedelta(hours=1)
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=old)
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (Job.QUEUED, ''))
+
+        self.assertEqual(jobs.claim('second'), [job.pk])
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=old)
+        jobs.requeue_stale()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_rebuild_rollups_job_and_pages(self):
+        create_transactions(3)
+        DailyRollup.objects.all().delete()
+        self.client.post(reverse('job_rebuild_rollups'))
+        jobs.run_pending()
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, {'buckets': 1})
+        self.assertEqual(verify_rollups(), [])
+
+        self.assertContains(self.client.get(reverse('job_list')), reverse('job_detail', args=[job.pk]))
+        self.assertContains(self.client.get(reverse('job_detail', args=[job.pk])), 'Готово')
+        self.assertEqual(self.client.get(reverse('api_job_status', args=[job.pk + 1])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('job_download', args=[job.pk])).status_code, 404)
+
+
+class ReportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = self.settings(JOB_FILES_DIR=directory.name, REPORT_RENDER_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = directory.name
+
+        income = {
+            'type': Type.objects.get(name='Пополнение'),
+            'category': Category.objects.get(name='Фриланс'),
+            'subcategory': Subcategory.objects.get(name='Разработка'),
+        }
+        create_transactions(3, start=datetime.date(2025, 1, 10), amount=Decimal('100.00'), **income)
+        create_transactions(2, start=datetime.date(2025, 1, 20), amount=Decimal('15.50'))
+        create_transactions(1, start=datetime.date(2025, 3, 5), amount=Decimal('40.00'))
+        create_transactions(4, start=datetime.date(2024, 12, 31))
+
+    def data(self, query, hierarchy=None):
+        return reports.build_data(TransactionFilterSet(QueryDict(query)), hierarchy)
+
+    def test_monthly_totals_and_pivots(self):
+        hierarchy = get_hierarchy()
+        with self.assertNumQueries(1):
+            data = self.data('date_from=2025-01-01&date_to=2025-03-31', hierarchy)
+
+        self.assertEqual(data.months, (datetime.date(2025, 1, 1), datetime.date(2025, 2, 1), datetime.date(2025, 3, 1)))
+        self.assertEqual(data.period, 'с 01.01.2025 по 31.03.2025')
+        self.assertEqual(data.monthly(), [
+            (datetime.date(2025, 1, 1), Decimal('300.00'), Decimal('31.00'), Decimal('269.00'), 5),
+            (datetime.date(2025, 2, 1), Decimal('0'), Decimal('0'), Decimal('0'), 0),
+            (datetime.date(2025, 3, 1), Decimal('0'), Decimal('40.00'), Decimal('-40.00'), 1),
+        ])
+        self.assertEqual(data.pivot('type', 'category'), [
+            (('Пополнение', 'Фриланс'), [Decimal('300.00'), Decimal('0'), Decimal('0')], Decimal('300.00')),
+            (('Списание', 'Маркетинг'), [Decimal('-31.00'), Decimal('0'), Decimal('-40.00')], Decimal('-71.00')),
+        ])
+
+    def test_amount_filter_reads_transactions_and_is_described(self):
+        data = self.data(f'amount_min=20&status={Status.objects.get(name="Бизнес").pk}')
+        self.assertEqual(data.period, 'все время')
+        self.assertEqual(data.months[0], datetime.date(2025, 1, 1))
+        self.assertEqual(data.months[-1], datetime.date(2025, 3, 1))
+        self.assertEqual(sum(row.count for row in data.rows), 4)
+        self.assertEqual(data.filters, (('Статус', 'Бизнес'), ('Сумма от', '20.00')))
+
+    def test_report_is_built_by_job_and_cached_until_data_changes(self):
+        query = {'date_from': '2025-01-01', 'format': 'xlsx'}
+        with mock.patch.object(reports, 'available_formats', return_value=['xlsx', 'pdf']), \
+                mock.patch.object(report_render, 'render', return_value=b'report') as render:
+            response = self.client.post(reverse('transaction_report'), query)
+            job = Job.objects.get()
+            self.assertRedirects(response, reverse('job_detail', args=[job.pk]))
+            jobs.run_pending()
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.SUCCEEDED, job.error)
+            self.assertEqual(job.result['filename'], 'cash-flow-2025-01.xlsx')
+            self.assertEqual(render.call_count, 1)
+
+            cached = self.client.post(reverse('transaction_report'), query)
+            self.assertEqual(b''.join(cached.streaming_content), b'report')
+            self.assertEqual(Job.objects.count(), 1)
+
+            create_transactions(1, start=datetime.date(2025, 2, 1))
+            self.client.post(reverse('transaction_report'), query)
+            self.assertEqual(Job.objects.count(), 2)
+            jobs.run_pending()
+            self.assertEqual(render.call_count, 2)
+
+    def test_report_period_is_limited(self):
+        with mock.patch.object(reports, 'available_formats', return_value=['xlsx']):
+            for query in ({'date_from': '0001-01-01', 'date_to': '9999-12-31'}, {'date_to': '9999-12-31'}):
+                response = self.client.post(reverse('transaction_report'), dict(query, format='xlsx'), follow=True)
+                self.assertContains(response, f'не больше {reports.MAX_MONTHS} месяцев')
+        self.assertFalse(Job.objects.exists())
+        with self.assertRaises(ValueError):
+            self.data('date_from=2000-01-01')
+
+        # Последний месяц календаря не переполняет дату
+        data = self.data('date_from=9999-01-01&date_to=9999-12-31')
+        self.assertEqual((len(data.months), data.months[-1]), (12, datetime.date(9999, 12, 1)))
+
+    def test_purge_keeps_report_files_of_remaining_jobs(self):
+        query = TransactionFilterSet(QueryDict('date_from=2025-01-01')).querystring()
+        with mock.patch.object(report_render, 'render', return_value=b'report'):
+            first = jobs.enqueue('report', {'query': query, 'format': 'xlsx'})
+            jobs.run_pending()
+            second = jobs.enqueue('report', {'query': query, 'format': 'xlsx'})
+            jobs.run_pending()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.result['file'], second.result['file'])
+        path = jobs.file_path(first.result['file'])
+
+        old = timezone.now() - datetime.timedelta(days=30)
+        Job.objects.filter(pk=first.pk).update(finished_at=old)
+        self.assertEqual(jobs.purge_finished(days=7), 1)
+        self.assertTrue(path.exists())
+        Job.objects.filter(pk=second.pk).update(finished_at=old)
+        self.assertEqual(jobs.purge_finished(days=7), 1)
+        self.assertFalse(path.exists())
+
+        # Файл пропал между проверкой и открытием - отчет строится заново
+        with mock.patch.object(reports, 'available_formats', return_value=['xlsx']), \
+                mock.patch.object(reports, 'cached_report', return_value=path.name):
+            response = self.client.post(reverse('transaction_report'), {'date_from': '2025-01-01', 'format': 'xlsx'})
+        self.assertRedirects(response, reverse('job_detail', args=[Job.objects.get().pk]), fetch_redirect_response=False)
+
+    def test_unavailable_format_is_rejected(self):
+        with mock.patch.object(reports, 'available_formats', return_value=[]):
+            response = self.client.post(reverse('transaction_report'), {'format': 'pdf'}, follow=True)
+        self.assertContains(response, 'Формат PDF недоступен')
+        self.assertFalse(Job.objects.exists())
+
+    @unittest.skipUnless(report_render.available('xlsx'), 'openpyxl не установлен')
+    def test_xlsx_sheets(self):
+        from openpyxl import load_workbook
+
+        data = self.data('date_from=2025-01-01&date_to=2025-03-31')
+        workbook = load_workbook(io.BytesIO(report_render.render(data, 'xlsx')))
+        self.assertEqual(workbook.sheetnames, ['Сводка', 'Статусы', 'Категории', 'Подкатегории', 'Данные'])
+        categories = list(workbook['Категории'].values)
+        self.assertEqual(categories[0], ('Тип', 'Категория', 'январь 2025', 'февраль 2025', 'март 2025', 'Итого'))
+        self.assertEqual(categories[1][:2], ('Пополнение', 'Фриланс'))
+        self.assertEqual(categories[1][-1], 300)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     # Основные маршруты для транзакций
@@ -7,6 +7,19 @@ urlpatterns = [
     path('create/', views.transaction_create, name='transaction_create'),
     path('edit/<int:pk>/', views.transaction_edit, name='transaction_edit'),
     path('delete/<int:pk>/', views.transaction_delete, name='transaction_delete'),
+    path('bulk/', views.transaction_bulk, name='transaction_bulk'),
+    path('import/', views.transaction_import, name='transaction_import'),
+    path('export/', views.transaction_export, name='transaction_export'),
+    path('statement/', views.transaction_statement, name='transaction_statement'),
+    path('report/', views.transaction_report, name='transaction_report'),
+    
+    # Фоновые задачи
+    path('jobs/', views.job_list, name='job_list'),
+    path('jobs/export/', views.job_export, name='job_export'),
+    path('jobs/rebuild-rollups/', views.job_rebuild_rollups, name='job_rebuild_rollups'),
+    path('jobs/<int:pk>/', views.job_detail, name='job_detail'),
+    path('jobs/<int:pk>/cancel/', views.job_cancel, name='job_cancel'),
+    path('jobs/<int:pk>/download/', views.job_download, name='job_download'),
     
     # Управление справочниками
     path('dictionaries/', views.dictionary_management, name='dictionary_management'),
@@ -14,8 +27,22 @@ urlpatterns = [
          views.edit_dictionary_item, name='edit_dictionary_item'),
     path('dictionaries/delete/<str:model_type>/<int:pk>/', 
          views.delete_dictionary_item, name='delete_dictionary_item'),
+    path('dictionaries/merge/<str:model_type>/',
+         views.merge_dictionary_items, name='merge_dictionary_items'),
+    
+    # JSON API
+    path('api/v1/transactions/', api.transaction_collection, name='api_transactions'),
+    path('api/v1/transactions/batch/', api.transaction_batch, name='api_transactions_batch'),
+    path('api/v1/transactions/bulk/', api.transaction_bulk, name='api_transactions_bulk'),
+    path('api/v1/transactions/<int:pk>/', api.transaction_detail, name='api_transaction_detail'),
+    path('api/v1/stats/', api.transaction_stats, name='api_stats'),
+    path('api/v1/jobs/<int:pk>/', api.job_status, name='api_job_status'),
+    path('api/v1/jobs/<int:pk>/cancel/', api.job_cancel, name='api_job_cancel'),
+    path('api/v1/cache-stats/', api.cache_stats, name='api_cache_stats'),
+    path('metrics', api.metrics, name='metrics'),
     
     # AJAX endpoints
     path('ajax/load-categories/', views.load_categories, name='ajax_load_categories'),
     path('ajax/load-subcategories/', views.load_subcategories, name='ajax_load_subcategories'),
+    path('ajax/hierarchy/', views.load_hierarchy, name='ajax_hierarchy'),
 ]
\ No newline at end of file
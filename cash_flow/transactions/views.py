@@ -1,140 +1,221 @@
+import asyncio
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import QueryDict
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.urls import reverse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.contrib import messages
-from django.db.models import Q, Sum, Count
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db import router
+from django.db.models import Q
 from django.views.decorators.http import require_http_methods
-from .models import Transaction, Status, Type, Category, Subcategory
-from .forms import TransactionForm, StatusForm, TypeForm, CategoryForm, SubcategoryForm
+from .models import DataVersion, Job, Transaction, Status, Type, Category, Subcategory
+from .exporters import FORMATS, TransactionExporter
+from .balances import Statement
+from .bulk import BulkOperation, parse_ids, select
+from .filters import StatementFilterSet, TransactionFilterSet, parse_id
+from .fragments import Fragment
+from .forms import TransactionForm, StatusForm, TypeForm, CategoryForm, SubcategoryForm, ImportForm
+from .hierarchy import aget_hierarchy, get_hierarchy, get_usage
+from .importers import ImportFileError, import_file
+from . import jobs, reports
+from .merge import merge
+from .pagination import CursorPaginator, InvalidCursor, decode_cursor
+from .routers import read_only_view
+from .stats import TransactionStats
+
+def transaction_list_etag(data_version, transaction_filter, cursor, request):
+    """ETag списка: версия данных + нормализованные фильтры + позиция страницы"""
+    key = '|'.join([
+        str(data_version),
+        transaction_filter.cache_key,
+        cursor or '',
+        # Непоказанные сообщения (после редиректа) должны попасть на страницу
+        request.COOKIES.get('messages', ''),
+    ])
+    return '"%s"' % hashlib.sha1(key.encode()).hexdigest()
 
-def transaction_list(request):
-    # Получаем все транзакции с предзагрузкой связанных данных
+def set_revalidation_headers(response, etag):
+    response['ETag'] = etag
+    # Браузер кэширует страницу, но всегда сверяет ETag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@read_only_view
+async def transaction_list(request):
+    # Все транзакции со связанными данными (для таблицы нужны названия)
     transactions = Transaction.objects.all().select_related(
         'status', 'type', 'category', 'subcategory'
     ).order_by('-created_date', '-id')
     
-    # Инициализируем фильтры
-    filters = Q()
-    filter_applied = False
-    filter_params = {}
-    
-    # Обработка параметров фильтрации
-    date_from = request.GET.get('date_from', '')
-    date_to = request.GET.get('date_to', '')
-    status_id = request.GET.get('status', '')
-    type_id = request.GET.get('type', '')
-    category_id = request.GET.get('category', '')
-    subcategory_id = request.GET.get('subcategory', '')
-    
-    # Сохраняем параметры фильтрации
-    filter_params = {
-        'date_from': date_from,
-        'date_to': date_to,
-        'status': status_id,
-        'type': type_id,
-        'category': category_id,
-        'subcategory': subcategory_id,
-    }
+    # Фильтры из GET-параметров, проверенные и нормализованные (общие со статистикой и экспортом)
+    transaction_filter = TransactionFilterSet(request.GET)
+    transactions = transaction_filter.filter(transactions)
     
-    # Применяем фильтры
-    if date_from:
-        filters &= Q(created_date__gte=date_from)
-        filter_applied = True
-    if date_to:
-        filters &= Q(created_date__lte=date_to)
-        filter_applied = True
-    if status_id:
-        filters &= Q(status_id=status_id)
-        filter_applied = True
-    if type_id:
-        filters &= Q(type_id=type_id)
-        filter_applied = True
-    if category_id:
-        filters &= Q(category_id=category_id)
-        filter_applied = True
-    if subcategory_id:
-        filters &= Q(subcategory_id=subcategory_id)
-        filter_applied = True
+    # Пагинация по ключу (created_date, id) вместо OFFSET + COUNT
+    paginator = CursorPaginator(transactions, 25)  # 25 записей на страницу
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursor:
+            cursor = None
     
-    # Применяем фильтры к queryset
-    if filter_applied:
-        transactions = transactions.filter(filters)
+    # Условный GET: если данные не менялись, отвечаем 304, не трогая таблицу транзакций
+    data_version = await DataVersion.aget(DataVersion.DATA)
+    etag = transaction_list_etag(data_version, transaction_filter, cursor, request)
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return set_revalidation_headers(response, etag)
     
-    # Пагинация
-    paginator = Paginator(transactions, 25)  # 25 записей на страницу
-    page = request.GET.get('page')
+    # Данные для фильтров - из кэша справочников
+    hierarchy = await aget_hierarchy()
     
-    try:
-        transactions_page = paginator.page(page)
-    except PageNotAnInteger:
-        transactions_page = paginator.page(1)
-    except EmptyPage:
-        transactions_page = paginator.page(paginator.num_pages)
-    
-    # Расчет статистики
-    total_count = Transaction.objects.count()
-    filtered_count = transactions.count()
-    
-    # Общая статистика
-    overall_stats = Transaction.objects.aggregate(
-        total_income=Sum('amount', filter=Q(type__name='Пополнение')),
-        total_expense=Sum('amount', filter=Q(type__name='Списание')),
-    )
+    # Статистика и страница таблицы кэшируются отдельно: у статистики ключ - только фильтры.
+    # Общие итоги меняет любая запись, поэтому они - отдельный фрагмент, общий для всех фильтров
+    # и сверяемый со всей лентой изменений, а не только с корзинами фильтра
+    filter_key = transaction_filter.cache_key
+    overall_fragment = Fragment('overall', [hierarchy.version], Q(), data_version)
+    stats_fragment = Fragment('stats', [hierarchy.version, filter_key], transaction_filter.bucket_q, data_version)
+    page_fragment = Fragment('page', [hierarchy.version, filter_key, cursor], transaction_filter.bucket_q, data_version)
     
-    overall_income = overall_stats['total_income'] or 0
-    overall_expense = overall_stats['total_expense'] or 0
-    overall_balance = overall_income - overall_expense
+    def render_overall(overall):
+        return render_to_string('transactions/includes/overall_statistics.html', {
+            'total_transactions_count': overall.count,
+            'overall_income': overall.income,
+            'overall_expense': overall.expense,
+            'overall_balance': overall.balance,
+        })
     
-    # Статистика по фильтрованным данным
-    filtered_stats = transactions.aggregate(
-        total_income=Sum('amount', filter=Q(type__name='Пополнение')),
-        total_expense=Sum('amount', filter=Q(type__name='Списание')),
-    )
+    async def overall_html():
+        html = await overall_fragment.aget()
+        if html is None:
+            overall, _ = await TransactionStats(hierarchy=hierarchy).atotals()
+            html = render_overall(overall)
+            await overall_fragment.aset(html)
+        return html
     
-    filtered_income = filtered_stats['total_income'] or 0
-    filtered_expense = filtered_stats['total_expense'] or 0
-    filtered_balance = filtered_income - filtered_expense
+    async def statistics_html():
+        html = await stats_fragment.aget()
+        if html is None:
+            stats = await TransactionStats.for_filters(transaction_filter, hierarchy=hierarchy).acompute()
+            html = render_to_string('transactions/includes/statistics.html', {
+                'stats': stats,
+                'filter_applied': transaction_filter.applied,
+                'filtered_count': stats.filtered.count,
+                'filtered_income': stats.filtered.income,
+                'filtered_expense': stats.filtered.expense,
+                'filtered_balance': stats.filtered.balance,
+                'category_stats': stats.categories,
+            })
+            await stats_fragment.aset(html)
+        return html
     
-    # Статистика по категориям
-    category_stats = transactions.values(
-        'category__name', 'type__name'
-    ).annotate(
-        total_amount=Sum('amount'),
-        count=Count('id')
-    ).order_by('-total_amount')[:10]
+    async def table_html():
+        html = await page_fragment.aget()
+        if html is None:
+            transactions_page = await paginator.apage(cursor)
+            is_paginated = transactions_page.has_next or transactions_page.has_previous
+            
+            # Приблизительное число записей нужно только для навигации
+            # и ограничено сверху, поэтому не зависит от размера таблицы
+            if is_paginated:
+                approximate_count, approximate_count_exact = await paginator.aapproximate_count()
+            else:
+                approximate_count, approximate_count_exact = len(transactions_page), True
+            
+            html = render_to_string('transactions/includes/transaction_table.html', {
+                'transactions': transactions_page,
+                'page_obj': transactions_page,
+                'is_paginated': is_paginated,
+                'approximate_count': approximate_count,
+                'approximate_count_exact': approximate_count_exact,
+                'filter_query': filter_key,
+            })
+            await page_fragment.aset(html)
+        return html
     
-    # Получаем данные для фильтров
-    statuses = Status.objects.all().order_by('name')
-    types = Type.objects.all().order_by('name')
-    categories = Category.objects.all().select_related('type').order_by('type__name', 'name')
-    subcategories = Subcategory.objects.all().select_related('category').order_by('category__name', 'name')
+    # Фрагменты не зависят друг от друга и строятся одновременно
+    overall, statistics, table = await asyncio.gather(overall_html(), statistics_html(), table_html())
     
     context = {
-        'transactions': transactions_page,
-        'page_obj': transactions_page,
-        'is_paginated': paginator.num_pages > 1,
-        
-        'filter_params': filter_params,
-        'filter_applied': filter_applied,
+        'overall_html': mark_safe(overall),
+        'statistics_html': mark_safe(statistics),
+        'table_html': mark_safe(table),
         
-        'statuses': statuses,
-        'types': types,
-        'categories': categories,
-        'subcategories': subcategories,
+        'filter_params': transaction_filter.params,
+        'filter_values': transaction_filter.values,
+        'filter_errors': transaction_filter.errors,
+        'filter_applied': transaction_filter.applied,
+        'filter_query': filter_key,
         
-        # Статистика
-        'total_count': total_count,
-        'filtered_count': filtered_count,
-        'overall_income': overall_income,
-        'overall_expense': overall_expense,
-        'overall_balance': overall_balance,
-        'filtered_income': filtered_income,
-        'filtered_expense': filtered_expense,
-        'filtered_balance': filtered_balance,
-        'category_stats': category_stats,
+        'statuses': hierarchy.statuses,
+        'types': hierarchy.types,
+        'categories': hierarchy.categories,
+        'subcategories': hierarchy.subcategories,
+        # Для массовой смены категории: подкатегория задает и категорию, и тип
+        'bulk_categories': [
+            (category, hierarchy.subcategories_for_category(category.id))
+            for category in hierarchy.categories
+        ],
     }
     
-    return render(request, 'transactions/transaction_list.html', context)
+    # Шаблон и контекст-процессоры (сессия, сообщения) синхронные
+    response = await sync_to_async(render)(request, 'transactions/transaction_list.html', context)
+    return set_revalidation_headers(response, etag)
+
+@read_only_view
+def transaction_export(request):
+    """Выгрузка отфильтрованного списка целиком, потоком (CSV или JSON Lines)"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in FORMATS:
+        export_format = 'csv'
+    content_type, extension = FORMATS[export_format]
+    
+    # Те же фильтры, что и у списка транзакций
+    # Выгрузка читается уже после выхода из представления - соединение выбираем сейчас
+    rows = Transaction.objects.using(router.db_for_read(Transaction))
+    transactions = TransactionFilterSet(request.GET).filter(rows)
+    exporter = TransactionExporter(transactions)
+    
+    # Под ASGI поток должен быть асинхронным, иначе ответ буферизуется в памяти целиком
+    content = exporter.astream(export_format) if isinstance(request, ASGIRequest) else exporter.stream(export_format)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="transactions.{extension}"'
+    return response
+
+@read_only_view
+def transaction_statement(request):
+    """Выписка по возрастанию дат с входящим остатком страницы и остатком после каждой записи"""
+    statement_filter = StatementFilterSet(request.GET)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursor:
+            cursor = None
+    
+    # Входящий остаток - по снимкам на конец месяца, без суммирования всей истории
+    page = Statement(statement_filter).page(cursor)
+    hierarchy = get_hierarchy()
+    
+    context = {
+        'page': page,
+        'cursor': cursor,
+        'filter_params': statement_filter.params,
+        'filter_values': statement_filter.values,
+        'filter_errors': statement_filter.errors,
+        'filter_applied': statement_filter.applied,
+        'filter_query': statement_filter.querystring(),
+        'statuses': hierarchy.statuses,
+    }
+    return render(request, 'transactions/transaction_statement.html', context)
 
 def transaction_create(request):
     if request.method == 'POST':
@@ -177,6 +258,38 @@ def transaction_edit(request, pk):
     }
     return render(request, 'transactions/transaction_form.html', context)
 
+@require_http_methods(["POST"])
+def transaction_bulk(request):
+    """Массовая смена статуса/категории или удаление: отмеченные строки или все по фильтру"""
+    filter_query = request.POST.get('filter_query', '')
+    transaction_filter = TransactionFilterSet(QueryDict(filter_query))
+    list_url = reverse('transaction_list')
+    if transaction_filter.querystring():
+        list_url += '?' + transaction_filter.querystring()
+    
+    try:
+        operation = BulkOperation.from_data(request.POST.get('action'), request.POST)
+        if request.POST.get('scope') == 'filter':
+            if operation.action == 'delete' and not request.POST.get('confirm'):
+                raise ValidationError('Подтвердите удаление всех записей по фильтру')
+            queryset = select((), transaction_filter)
+        else:
+            # Без отмеченных строк фильтр не подставляется: действие только над выбранным
+            ids = parse_ids(request.POST.getlist('ids'))
+            if not ids:
+                raise ValidationError('Не отмечены строки')
+            queryset = select(ids)
+        count = operation.execute(queryset)
+    except ValidationError as error:
+        messages.error(request, ' '.join(error.messages))
+        return redirect(list_url)
+    
+    if operation.action == 'delete':
+        messages.success(request, f'Удалено записей: {count}')
+    else:
+        messages.success(request, f'Изменено записей: {count}')
+    return redirect(list_url)
+
 def transaction_delete(request, pk):
     transaction = get_object_or_404(Transaction, pk=pk)
     
@@ -192,6 +305,38 @@ def transaction_delete(request, pk):
     }
     return render(request, 'transactions/transaction_confirm_delete.html', context)
 
+def transaction_import(request):
+    result = None
+    if request.method == 'POST':
+        form = ImportForm(request.POST, request.FILES)
+        if form.is_valid() and form.cleaned_data['background']:
+            uploaded = form.cleaned_data['file']
+            name = jobs.save_upload(uploaded)
+            job = jobs.enqueue('import', {'file': name, 'name': uploaded.name, 'cleanup': [name]})
+            messages.info(request, 'Файл поставлен в очередь на импорт.')
+            return redirect('job_detail', pk=job.pk)
+        elif form.is_valid():
+            uploaded = form.cleaned_data['file']
+            try:
+                result = import_file(uploaded, uploaded.name)
+            except ImportFileError as error:
+                messages.error(request, str(error))
+            else:
+                if result.error_count:
+                    messages.warning(request, f'Импорт завершен с ошибками: {result.error_count}')
+                else:
+                    messages.success(request, f'Импортировано записей: {result.created}')
+        else:
+            messages.error(request, 'Выберите файл для импорта.')
+    else:
+        form = ImportForm()
+    
+    context = {
+        'form': form,
+        'result': result,
+    }
+    return render(request, 'transactions/transaction_import.html', context)
+
 def dictionary_management(request):
     # Обработка добавления новых элементов
     if request.method == 'POST':
@@ -214,11 +359,17 @@ def dictionary_management(request):
         else:
             messages.error(request, 'Ошибка при добавлении элемента. Проверьте данные.')
     
+    hierarchy = get_hierarchy()
+    usage = get_usage()
     context = {
-        'statuses': Status.objects.all().order_by('name'),
-        'types': Type.objects.all().order_by('name'),
-        'categories': Category.objects.all().select_related('type').order_by('type__name', 'name'),
-        'subcategories': Subcategory.objects.all().select_related('category').order_by('category__name', 'name'),
+        'statuses': hierarchy.statuses,
+        'types': hierarchy.types,
+        'categories': hierarchy.categories,
+        'subcategories': hierarchy.subcategories,
+        'status_rows': usage.rows('status', hierarchy.statuses),
+        'type_rows': usage.rows('type', hierarchy.types),
+        'category_rows': usage.rows('category', hierarchy.categories),
+        'subcategory_rows': usage.rows('subcategory', hierarchy.subcategories),
         
         'status_form': StatusForm(),
         'type_form': TypeForm(),
@@ -278,16 +429,14 @@ def delete_dictionary_item(request, model_type, pk):
     item = get_object_or_404(model_class, pk=pk)
     item_name = item.name
     
-    # Проверка на использование в транзакциях
-    if model_type == 'status' and Transaction.objects.filter(status=item).exists():
+    # Проверка на использование в транзакциях - по счетчику, без запросов к транзакциям
+    if model_type == 'status' and item.usage_count:
         messages.error(request, f'Нельзя удалить статус "{item_name}", так как он используется в транзакциях!')
-    elif model_type == 'type' and (Category.objects.filter(type=item).exists() or 
-                                  Transaction.objects.filter(type=item).exists()):
+    elif model_type == 'type' and (item.usage_count or Category.objects.filter(type=item).exists()):
         messages.error(request, f'Нельзя удалить тип "{item_name}", так как он используется в категориях или транзакциях!')
-    elif model_type == 'category' and (Subcategory.objects.filter(category=item).exists() or 
-                                     Transaction.objects.filter(category=item).exists()):
+    elif model_type == 'category' and (item.usage_count or Subcategory.objects.filter(category=item).exists()):
         messages.error(request, f'Нельзя удалить категорию "{item_name}", так как она используется в подкатегориях или транзакциях!')
-    elif model_type == 'subcategory' and Transaction.objects.filter(subcategory=item).exists():
+    elif model_type == 'subcategory' and item.usage_count:
         messages.error(request, f'Нельзя удалить подкатегорию "{item_name}", так как она используется в транзакциях!')
     else:
         item.delete()
@@ -295,21 +444,151 @@ def delete_dictionary_item(request, model_type, pk):
     
     return redirect('dictionary_management')
 
+@require_http_methods(["POST"])
+def merge_dictionary_items(request, model_type):
+    """Слияние дубля (source) с записью target: транзакции переносятся, дубль удаляется"""
+    try:
+        target, moved = merge(model_type, request.POST.get('source'), request.POST.get('target'))
+    except ValidationError as error:
+        messages.error(request, ' '.join(error.messages))
+    else:
+        messages.success(request, f'Записи объединены в "{target.name}", перенесено транзакций: {moved}')
+    return redirect('dictionary_management')
+
+def job_list(request):
+    context = {
+        'jobs': Job.objects.all()[:50],
+    }
+    return render(request, 'transactions/job_list.html', context)
+
+def job_detail(request, pk):
+    job = get_object_or_404(Job, pk=pk)
+    return render(request, 'transactions/job_detail.html', {'job': job})
+
+@require_http_methods(["POST"])
+def job_export(request):
+    """Выгрузка по фильтру списка в файл фоновой задачей"""
+    transaction_filter = TransactionFilterSet(QueryDict(request.POST.get('filter_query', '')))
+    job = jobs.enqueue('export', {
+        'query': transaction_filter.querystring(),
+        'format': request.POST.get('format', 'csv'),
+    })
+    messages.info(request, 'Выгрузка поставлена в очередь.')
+    return redirect('job_detail', pk=job.pk)
+
+# Параметры фильтра, которые задаются полями формы отчета; остальные (из списка) передаются скрытыми
+REPORT_FORM_FILTERS = ('date_from', 'date_to', 'status', 'type', 'category')
+
+def report_response(request, report_filter, report_format):
+    """Готовый файл отчета или задача на его построение"""
+    cached = reports.cached_report(report_filter, report_format)
+    if cached:
+        try:
+            report_file = open(jobs.file_path(cached), 'rb')
+        except FileNotFoundError:
+            # Файл удалила очистка задач после проверки - строим заново
+            pass
+        else:
+            return FileResponse(
+                report_file, as_attachment=True,
+                filename=reports.download_name(report_filter, report_format),
+                content_type=reports.FORMATS[report_format][0],
+            )
+    job = jobs.enqueue('report', {'query': report_filter.querystring(), 'format': report_format})
+    messages.info(request, 'Отчет поставлен в очередь.')
+    return redirect('job_detail', pk=job.pk)
+
+def transaction_report(request):
+    """Помесячный отчет по фильтру: готовый файл отдается сразу, иначе строится фоновой задачей"""
+    report_filter = TransactionFilterSet(request.POST if request.method == 'POST' else request.GET)
+    report_format = request.POST.get('format', 'xlsx')
+    formats = reports.available_formats()
+    
+    if request.method == 'POST':
+        if report_filter.errors:
+            for error in report_filter.errors.values():
+                messages.error(request, error)
+        elif report_format not in formats:
+            messages.error(request, f'Формат {report_format.upper()} недоступен на сервере.')
+        else:
+            period_error = reports.period_error(report_filter)
+            if period_error:
+                messages.error(request, period_error)
+            else:
+                return report_response(request, report_filter, report_format)
+    
+    hierarchy = get_hierarchy()
+    context = {
+        'filter_params': report_filter.params,
+        'filter_values': report_filter.values,
+        'extra_params': [
+            (name, report_filter.declared_filters[name].label, value) for name, value in report_filter.params.items()
+            if value and name not in REPORT_FORM_FILTERS
+        ],
+        'statuses': hierarchy.statuses,
+        'types': hierarchy.types,
+        'categories': hierarchy.categories,
+        'formats': [
+            (name, name.upper(), name in formats) for name in reports.FORMATS
+        ],
+        'report_format': report_format if report_format in formats else (formats[0] if formats else None),
+    }
+    return render(request, 'transactions/transaction_report.html', context)
+
+@require_http_methods(["POST"])
+def job_rebuild_rollups(request):
+    job = jobs.enqueue('rebuild_rollups')
+    messages.info(request, 'Пересчет сводок поставлен в очередь.')
+    return redirect('job_detail', pk=job.pk)
+
+@require_http_methods(["POST"])
+def job_cancel(request, pk):
+    job = get_object_or_404(Job, pk=pk)
+    if jobs.cancel(job):
+        messages.success(request, 'Задача отменена.' if job.status == Job.QUEUED else 'Отмена запрошена.')
+    else:
+        messages.warning(request, 'Задача уже завершена.')
+    return redirect('job_detail', pk=pk)
+
+def job_download(request, pk):
+    job = get_object_or_404(Job, pk=pk, status=Job.SUCCEEDED)
+    if not job.result or not job.result.get('file'):
+        raise Http404('У задачи нет файла')
+    try:
+        fileobj = open(jobs.file_path(job.result['file']), 'rb')
+    except FileNotFoundError:
+        raise Http404('Файл задачи удален')
+    return FileResponse(
+        fileobj, as_attachment=True, filename=job.result.get('filename'), content_type=job.result.get('content_type'),
+    )
+
 # AJAX views
-def load_categories(request):
-    type_id = request.GET.get('type_id')
+@read_only_view
+async def load_categories(request):
+    type_id = parse_id(request.GET.get('type_id', ''))
     if type_id:
-        categories = Category.objects.filter(type_id=type_id).order_by('name')
+        categories = (await aget_hierarchy()).categories_for_type(type_id)
         categories_data = [{'id': cat.id, 'name': cat.name} for cat in categories]
     else:
         categories_data = []
     return JsonResponse(categories_data, safe=False)
 
-def load_subcategories(request):
-    category_id = request.GET.get('category_id')
+@read_only_view
+async def load_hierarchy(request):
+    """Все дерево справочников одним документом; повторные запросы получают 304"""
+    content, etag = (await aget_hierarchy()).document
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type='application/json')
+    # Браузер хранит копию, но каждый раз сверяет ETag: изменения справочников видны сразу
+    return set_revalidation_headers(response, etag)
+
+@read_only_view
+async def load_subcategories(request):
+    category_id = parse_id(request.GET.get('category_id', ''))
     if category_id:
-        subcategories = Subcategory.objects.filter(category_id=category_id).order_by('name')
+        subcategories = (await aget_hierarchy()).subcategories_for_category(category_id)
         subcategories_data = [{'id': sub.id, 'name': sub.name} for sub in subcategories]
     else:
         subcategories_data = []
-    return JsonResponse(subcategories_data, safe=False)
\ No newline at end of file
+    return JsonResponse(subcategories_data, safe=False)